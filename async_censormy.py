@@ -1,7 +1,13 @@
 import argparse
+import json
 import time
 import asyncio
 from async_toolset import *
+from pipeline import PipelineCoordinator, METHOD_PLANS
+from word_list import load_word_list
+from workspace import Workspace
+from audio_source import AudioSource
+from streaming import StreamingCensor, STREAM_METHODS
 
 
 async def main():
@@ -13,75 +19,65 @@ async def main():
     parser.add_argument("slurs_file", help="Path to the slurs file.")
     parser.add_argument(
         "--method",
-        choices=["v", "Gv", "b", "vb", "p", "sv", "sb", "ts", "tape_stop"],
+        choices=list(METHOD_PLANS),
         required=True,
         help="Censorship method: 'v' for vocal separation, 'b' for backspin, 'vb' for combination of both, 'Gv' for GenAI vocal separation, 'p' for down-pitch, 'sv' for slur + vocal, 'sb' for slur + both or 'ts'/'tape_stop' for tape stop / vinyl break.",
     )
     parser.add_argument("--output", default="censored_output.mp3", help="Output file path.")
+    parser.add_argument("--low-memory", action="store_true", help="Unload Spleeter after separating instead of keeping it resident.")
+    parser.add_argument("--targeted", action="store_true", help="Separate only padded windows around the detected words (after transcription) instead of the whole song.")
+    parser.add_argument("--cascade", action="store_true", help="Screen the song with a small Whisper model and re-transcribe only the flagged regions with the main one.")
+    parser.add_argument("--vad", action="store_true", help="Transcribe the vocals stem with voice-activity gating once it's separated (the mix with VAD when the method doesn't separate).")
+    parser.add_argument("--job-id", default=None, help="Job id tagging this run's logs and scratch dir (random by default).")
+    parser.add_argument("--stream", action="store_true", help="Censor window by window and write the output as it goes (first audio within one window, bounded memory).")
+    parser.add_argument("--detections-out", default=None, help="Write the censored intervals (ms) to this JSON file, used by batch_runner to place chunk seams.")
     args = parser.parse_args()
+    if args.stream:
+        # Stream windows are transcribed and separated on their own, the whole-song modes don't apply to them
+        unsupported = [flag for flag, on in (("--low-memory", args.low_memory), ("--targeted", args.targeted),
+                                             ("--cascade", args.cascade), ("--vad", args.vad)) if on]
+        if unsupported:
+            parser.error(f"--stream can't be combined with {', '.join(unsupported)}")
+        if args.method not in STREAM_METHODS:
+            parser.error(f"--stream isn't available for method '{args.method}'")
 
     # Time now for execution benchmarking
     start = time.time()
 
     # Read bad words from file
-    with open(args.bad_words_file, "r") as f:
-        bad_words = [line.strip().lower() for line in f]
+    bad_words = load_word_list(args.bad_words_file)
 
-    if args.method == "v":
-        print("Using Async vocal separation method...")
-        task1 = asyncio.create_task(run_in_thread(separate_audio(args.audio_file)))
-        task2 = asyncio.create_task(run_in_thread(censor_with_instrumentals(args.audio_file, bad_words, args.output)))
-        await asyncio.gather(task1, task2)
+    # Each method runs only the stages its plan needs (backspin never separates)
+    plan = METHOD_PLANS[args.method]
+    slurs = load_word_list(args.slurs_file) if plan.slurs else None
 
-    elif args.method == "Gv":
-        print("Using GenAI Async vocal separation method...")
-        task1 = asyncio.create_task(run_in_thread(separate_audio(args.audio_file)))
-        task2 = asyncio.create_task(run_in_thread(censor_with_instrumentals(args.audio_file, bad_words, args.output, genai=True)))
-        await asyncio.gather(task1, task2)    
-    
-    elif args.method == "b": # Oldest method in the book, doesn't require vocal separation
-        print("Using Async backspin method...")
-        task1 = asyncio.create_task(run_in_thread(separate_audio(args.audio_file)))
-        task2 = asyncio.create_task(run_in_thread(censor_with_backspin(args.audio_file, bad_words, args.output)))
-        await asyncio.gather(task1, task2)
+    # Decoded once, every stage below shares the buffer
+    audio = AudioSource(args.audio_file)
 
-    elif args.method == 'ts':
-        print("Using Async tape stop method...")
-        task1 = asyncio.create_task(run_in_thread(separate_audio(args.audio_file)))
-        task2 = asyncio.create_task(run_in_thread(censor_with_tape_stop(args.audio_file, bad_words, args.output, sep_task=task1)))
-        await asyncio.gather(task1, task2)
+    # Every run gets its own scratch dir, so concurrent runs never touch each other's files
+    workspace = Workspace(args.job_id)
+    try:
+        pipeline = None
+        detections = None
+        if args.stream:
+            print(f"Using streaming {plan.label} method...")
+            detections = await StreamingCensor(audio, bad_words, slurs, method=args.method, job_id=workspace.job_id).run(args.output)
+        else:
+            print(f"Using Async {plan.label} method...")
+            pipeline = PipelineCoordinator(audio, low_memory=args.low_memory, workspace=workspace, targeted=args.targeted, cascade=args.cascade, vad=args.vad)
+            await pipeline.execute(plan, bad_words, args.output, slurs=slurs)
 
-    elif args.method == "vb":
-        print("Using Async vocal + backspin method...")
-        task1 = asyncio.create_task(run_in_thread(separate_audio(args.audio_file)))
-        task2 = asyncio.create_task(run_in_thread(censor_with_both(args.audio_file, bad_words, args.output, sep_task=task1)))
-        await asyncio.gather(task1, task2)
-
-    elif args.method == "p":
-        print("Using Async vocal downpitch method...")
-        task1 = asyncio.create_task(run_in_thread(separate_audio(args.audio_file)))
-        task2 = asyncio.create_task(run_in_thread(censor_with_downpitch(args.audio_file, bad_words, args.output, sep_task=task1)))
-        await asyncio.gather(task1, task2)
-
-    elif args.method == "sv":
-        print("Using Async Slur + Vocal method...")
-        with open(args.slurs_file, "r") as f:
-            slurs = [line.strip().lower() for line in f]
-        task1 = asyncio.create_task(run_in_thread(separate_audio(args.audio_file)))
-        task2 = asyncio.create_task(run_in_thread(censor_with_instrumentals_and_downpitch(args.audio_file, bad_words, slurs, args.output, sep_task=task1)))
-        await asyncio.gather(task1, task2)
-
-    elif args.method == "sb":
-        print("Using Async Slur + vocal + backspin method...")
-        with open(args.slurs_file, "r") as f:
-            slurs = [line.strip().lower() for line in f]
-        task1 = asyncio.create_task(run_in_thread(separate_audio(args.audio_file)))
-        task2 = asyncio.create_task(run_in_thread(censor_with_both_and_downpitch(args.audio_file, bad_words, slurs, args.output, sep_task=task1)))
-        await asyncio.gather(task1, task2)
+        if pipeline is not None:
+            detections = pipeline.detections()
+        if args.detections_out and detections is not None:
+            with open(args.detections_out, "w", encoding="utf-8") as f:
+                json.dump({'intervals': detections}, f)
+    finally:
+        # Removed whether the run succeeded or not
+        await cleanup(workspace)
 
     # End time
     end = time.time()
-    await cleanup()
     print(f'[=] Took {end-start} seconds to run')
 
 
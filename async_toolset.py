@@ -1,648 +1,443 @@
 import os
 import whisper
-import librosa
 import torch
-import soundfile as sf
 import asyncio
-import string
-import json
-import numpy as np
+import threading
 from pydub import AudioSegment
-from shutil import rmtree
+from concurrent.futures import Future
 from module_context import ModuleContext
-from faster_whisper import WhisperModel
-
-
-async def separate_audio(input_audio_path, output_dir="separated"):
+from model_pool import whisper_pool
+from separator_service import get_separator_service, load_waveform, separate_waveform, SEPARATOR_MODEL, SEPARATOR_SAMPLE_RATE, Stems, WindowedStem
+from stem_cache import stem_cache
+from stage_scheduler import gpu_scheduler
+from phrase_matcher import get_matcher, clean_token, fuzzy_hits
+from transcript_cache import transcript_cache
+from workspace import job_tag, Workspace
+from audio_source import as_audio_source, resample_blocks, WHISPER_SAMPLE_RATE
+from render_engine import segment_to_array, array_to_segment, tape_stop
+
+# Whisper model used by every transcription helper, resident in whisper_pool between songs
+WHISPER_MODEL_SIZE = "medium"
+WHISPER_DEVICE = "cuda"
+WHISPER_COMPUTE_TYPE = "int8_float16"
+# Decoding parameters of the word-level pass, part of the transcript cache key
+WHISPER_DECODE_OPTIONS = {'word_timestamps': True, 'beam_size': 5}
+BUFFER_MS = 85   # padding around every matched word/phrase
+# Cascade transcription: a small model screens the whole song, the main model only re-decodes padded candidate regions
+SCREEN_MODEL_SIZE = os.environ.get("CENSOR_SCREEN_MODEL", "tiny")
+SCREEN_DECODE_OPTIONS = {'word_timestamps': True, 'beam_size': 1}
+CASCADE_PADDING_MS = int(os.environ.get("CENSOR_CASCADE_PADDING_MS", 2000))
+# Voice-activity gating: faster-whisper's Silero VAD drops non-speech before decoding and maps the timestamps back
+VAD_OPTIONS = {'vad_filter': True, 'vad_parameters': {'min_silence_duration_ms': 500, 'speech_pad_ms': 300}}
+# Targeted separation: context separated on both sides of a hit, and the share of the song above which it's all separated instead
+TARGET_PADDING_MS = int(os.environ.get("CENSOR_TARGET_PADDING_MS", 3000))
+TARGET_MAX_COVERAGE = float(os.environ.get("CENSOR_TARGET_MAX_COVERAGE", 0.6))
+
+
+async def separate_audio(input_audio_path, output_dir="separated", low_memory=False):
     """
     Separates the input audio into vocals and instrumental using Spleeter.
+    By default the job goes to the resident separator service, so the TensorFlow graph is built once per process.
+    :param low_memory: Load Spleeter just for this call and unload it afterwards (slower, frees memory between songs).
     """
-    print(f'[+] Separation in Progress..')
+    if not low_memory:
+        return await asyncio.wrap_future(get_separator_service().submit(input_audio_path, output_dir))
+
+    print(f'[+] Separation in Progress (low-memory mode)..')
     with ModuleContext("spleeter.separator") as modules:
         Separator = modules["spleeter.separator"].Separator
-        separator = Separator('spleeter:2stems-16kHz')  # 2 stems: vocals + instrumental
+        separator = Separator(SEPARATOR_MODEL)
         separator.separate_to_file(input_audio_path, output_dir)
-        return f"{output_dir}/separated_audio/vocals.wav", f"{output_dir}/separated_audio/accompaniment.wav"
+        filename = os.path.splitext(os.path.basename(input_audio_path))[0]
+        return f"{output_dir}/{filename}/vocals.wav", f"{output_dir}/{filename}/accompaniment.wav"
 
-async def down_pitch(input_path, output_path, semitones):
+def start_separation(input_audio_path, low_memory=False, job_id=None):
     """
-    Down-pitch an audio file by a given number of semitones using librosa.
-    :param input_path: Path to the input audio file.
-    :param output_path: Path to save the down-pitched audio.
-    :param semitones: Number of semitones to shift down (positive for down-pitching).
+    Kicks off in-memory separation and returns a thread-safe future resolving to Stems,
+    so a censor coroutine running in any thread/loop can await it directly.
+    :param job_id: Tags the separation's log lines (see workspace.Workspace).
     """
-    # Load the audio file
-    y, sr = librosa.load(input_path, sr=None)
-
-    # Down-pitch the audio
-    y_shifted = librosa.effects.pitch_shift(y=y, sr=sr, n_steps=-semitones)
-    print(f"[-] Down-shifted the pitch, saving..")
-    # Save the processed audio
-    sf.write(output_path, y_shifted, sr)
-
-async def get_bad_word_timestamps(audio_file_path, bad_words):
-    # 1. CACHE HANDLER
-    # Checks if a pre-calculated timestamp list exists
-    def _check_cache():
-        if os.path.exists(f'{audio_file_path}.json'):
-            print(f'[+] Using cached transcription from {audio_file_path}.json')
-            with open(f'{audio_file_path}.json', 'r') as f:
-                data = json.load(f) 
-                return [tuple(item) for item in data]
-        return None
-
-    cached_timestamps = _check_cache()
-    if cached_timestamps is not None:
-        return cached_timestamps
-
-    # 2. TRANSCRIPTION (Updated for Faster-Whisper)
-    print(f'[+] Transcribing {audio_file_path} with word-level timestamps (Faster Engine)...')
-
-    model = WhisperModel(
-        "medium", 
-        device="cuda", 
-        compute_type="int8_float16"
-    )
-
-    segments, info = model.transcribe(
-        audio_file_path,
-        word_timestamps=True,
-        beam_size=5
-    )
-
-    # 3. PREPROCESS WORDS
-    # Convert generator to list to consume it completely before cleanup
-    segments_list = list(segments)
-    all_words = []   # each element: {'raw': str, 'clean': str, 'start': float, 'end': float}
-    for segment in segments_list:
-        if segment.words:
-            for word_obj in segment.words:
-                raw_word = word_obj.word
-                clean_word = raw_word.lower().strip().strip(string.punctuation)
-                all_words.append({
-                    'raw': raw_word,
-                    'clean': clean_word,
-                    'start': word_obj.start,
-                    'end': word_obj.end
-                })
-
-    # 4. PREPROCESS BAD WORDS: split each bad word into tokens (cleaned similarly)
-    bad_phrases = []
-    for phrase in bad_words:
-        clean_phrase = phrase.lower().strip().strip(string.punctuation)
-        tokens = clean_phrase.split()
-        if tokens:  # ignore empty phrases
-            bad_phrases.append(tokens)
-
-    # 5. FIND PHRASE MATCHES
-    n = len(all_words)
-    intervals = []   # list of (start_idx, end_idx) in word indices
-
-    for i in range(n):
-        for tokens in bad_phrases:
-            L = len(tokens)
-            if i + L > n:
-                continue
-            # Check if the next L words match the tokens
-            match = True
-            for j in range(L):
-                if all_words[i+j]['clean'] != tokens[j]:
-                    match = False
-                    break
-            if match:
-                intervals.append( (i, i+L-1) )
-
-    # 6. CONVERT WORD INDICES TO TIME INTERVALS WITH BUFFER
-    BUFFER_MS = 85   # same as before
-    time_intervals = []
-    for (start_idx, end_idx) in intervals:
-        start_time = all_words[start_idx]['start']
-        end_time   = all_words[end_idx]['end']
-        # Convert to milliseconds and apply buffer
-        start_time_ms = int(start_time * 1000) - BUFFER_MS
-        end_time_ms   = int(end_time   * 1000) + BUFFER_MS
-        if start_time_ms < 0:
-            start_time_ms = 0
-        time_intervals.append( (start_time_ms, end_time_ms) )
-
-    # 7. MERGE OVERLAPPING OR ADJACENT INTERVALS
-    if not time_intervals:
-        bad_word_timestamps = []
-    else:
-        # Sort by start time
-        time_intervals.sort(key=lambda x: x[0])
-        merged = []
-        current_start, current_end = time_intervals[0]
-        for i in range(1, len(time_intervals)):
-            s, e = time_intervals[i]
-            if s <= current_end:   # overlapping or adjacent
-                if e > current_end:
-                    current_end = e
-            else:
-                merged.append( (current_start, current_end) )
-                current_start, current_end = s, e
-        merged.append( (current_start, current_end) )
-        bad_word_timestamps = merged
-
-    # 8. SAVE THE RESULTS TO JSON FOR CACHING
-    with open(f'{audio_file_path}.json', 'w') as f:
-        json.dump(bad_word_timestamps, f)
-    print(f'[+] Saved transcription cache to {audio_file_path}.json')
-
-    # 9. CLEAN UP MODEL TO FREE GPU MEMORY
-    del model
-    import torch
-    if torch.cuda.is_available():
-        torch.cuda.empty_cache()
-
-    # 10. RETURN THE TIMESTAMPS
-    return _check_cache() or bad_word_timestamps
-
-async def get_bad_word_and_slurs_timestamps(audio_file_path, bad_words, slurs):
-    # 1. CACHE HANDLER
-    # Checks if a pre-calculated timestamp list exists
-    cache_file = f'{audio_file_path}_bad_slurs.json'
-    if os.path.exists(cache_file):
-        print(f'[+] Using cached transcription from {cache_file}')
-        with open(cache_file, 'r') as f:
-            data = json.load(f)
-            return [tuple(item) for item in data['bad_words']], [tuple(item) for item in data['slurs']]
-
-    # 2. Load Faster-Whisper Model
+    if not low_memory:
+        return get_separator_service().submit_stems(input_audio_path, job_id=job_id)
+
+    future = Future()
+    def _separate():
+        print(f'[+] Separation in Progress (low-memory mode){job_tag(job_id)}..')
+        try:
+            with ModuleContext("spleeter.separator", "spleeter.audio.adapter") as modules:
+                audio_adapter = modules["spleeter.audio.adapter"].AudioAdapter.default()
+                waveform = load_waveform(audio_adapter, input_audio_path)
+                # The separator is only built on a cache miss, and only once the GPU has room for it
+                def separate(waveform):
+                    with gpu_scheduler.reserve("separate"):
+                        return separate_waveform(modules["spleeter.separator"].Separator(SEPARATOR_MODEL, multiprocess=False), waveform)
+                future.set_result(stem_cache.get_or_separate(waveform, SEPARATOR_MODEL, separate))
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=_separate, name=f"separate-{job_id or 'stage'}", daemon=True).start()
+    return future
+
+def separation_windows(intervals, duration_ms, padding_ms=TARGET_PADDING_MS):
+    """
+    Windows to separate around censored intervals: each padded by ``padding_ms`` on both sides
+    (Spleeter's output degrades near the edges of what it's given), merged when they overlap
+    or when the gap between them is shorter than the padding.
+    :return: sorted [(start_ms, end_ms), ..].
+    """
+    windows = []
+    for start, end in merge_intervals([(max(0, s - padding_ms), min(duration_ms, e + padding_ms)) for s, e in intervals]):
+        if windows and start - windows[-1][1] < padding_ms:
+            windows[-1] = (windows[-1][0], end)
+        else:
+            windows.append((start, end))
+    return windows
+
+def separate_windows(waveforms, low_memory=False, job_id=None):
+    """Separates 44.1kHz waveforms (blocking), through the separator service or a separator loaded just for them."""
+    if not low_memory:
+        service = get_separator_service()
+        return [f.result() for f in [service.submit_waveform(waveform, job_id=job_id) for waveform in waveforms]]
+    with ModuleContext("spleeter.separator") as modules:
+        separator = None
+        def separate(waveform):
+            nonlocal separator
+            with gpu_scheduler.reserve("separate"):
+                if separator is None:
+                    separator = modules["spleeter.separator"].Separator(SEPARATOR_MODEL, multiprocess=False)
+                return separate_waveform(separator, waveform)
+        return [stem_cache.get_or_separate(waveform, SEPARATOR_MODEL, separate) for waveform in waveforms]
+
+def start_targeted_separation(source, ts_task, low_memory=False, job_id=None):
+    """
+    Separates only padded windows around the censored intervals, once transcription has found them,
+    so separation costs in proportion to the hits instead of the song length.
+    :param ts_task: Future of the transcription stage (bad word intervals, or (bad words, slurs)).
+    :return: thread-safe future resolving to Stems of WindowedStem, silent outside the windows; plain
+             Stems of the whole song when the windows would cover most of it anyway.
+    """
+    future = Future()
+    def _separate():
+        try:
+            found = ts_task.result()
+            intervals = [interval for category in found for interval in category] if isinstance(found, tuple) else found
+            duration_ms = source.duration_ms
+            windows = separation_windows(intervals, duration_ms)
+            covered_ms = sum(end - start for start, end in windows)
+            if covered_ms > TARGET_MAX_COVERAGE * duration_ms:
+                print(f'[=] Hits cover most of the song, separating all of it{job_tag(job_id)}')
+                future.set_result(start_separation(source, low_memory=low_memory, job_id=job_id).result())
+                return
+
+            print(f'[+] Targeted separation of {len(windows)} windows ({covered_ms / 1000:.1f}s of {duration_ms / 1000:.1f}s){job_tag(job_id)}..')
+            parts = separate_windows([source.window(start, end, SEPARATOR_SAMPLE_RATE) for start, end in windows], low_memory, job_id)
+            frames = int(round(len(source.samples) * SEPARATOR_SAMPLE_RATE / source.sample_rate))
+            channels = parts[0].vocals.shape[1] if parts else 2
+            offsets = [int(round(start * SEPARATOR_SAMPLE_RATE / 1000)) for start, _ in windows]
+            future.set_result(Stems(
+                WindowedStem(frames, channels, [(offset, part.vocals) for offset, part in zip(offsets, parts)]),
+                WindowedStem(frames, channels, [(offset, part.accompaniment) for offset, part in zip(offsets, parts)])
+            ))
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=_separate, name=f"separate-{job_id or 'stage'}", daemon=True).start()
+    return future
+
+def transcript_key(source):
+    """Transcript cache key of an AudioSource: its content hash + model + decoding parameters."""
+    return transcript_cache.key(source.content_hash, (WHISPER_MODEL_SIZE, WHISPER_COMPUTE_TYPE), WHISPER_DECODE_OPTIONS)
+
+def transcribe_samples(samples, offset_s=0.0, model_size=WHISPER_MODEL_SIZE, decode_options=WHISPER_DECODE_OPTIONS):
+    """
+    Word-level Whisper transcript of 16kHz mono float32 samples (a whole song or one window). Blocking, not cached.
+    :param offset_s: Added to every word time, i.e. where the window starts in the song.
+    :param model_size: i.e. SCREEN_MODEL_SIZE for a cheap first pass.
+    :return: list of {'raw', 'clean', 'start', 'end', 'probability'} with times in seconds.
+    """
+    # 1. TRANSCRIPTION (Updated for Faster-Whisper)
     # Using 'int8_float16' for massive VRAM savings (1.5GB-ish on 8GB GPU)
-    model = WhisperModel(
-        "medium",
-        device="cuda",
-        compute_type="int8_float16"
-    )
-
-    print(f'[+] Transcribing {audio_file_path} for bad words and slurs...')
-
-    # 3. Run Transcription
     # word_timestamps=True is mandatory for the 'surgical' data you need
-    segments, info = model.transcribe(
-        audio_file_path,
-        word_timestamps=True,
-        beam_size=5
-    )
-
-    # 4. PREPROCESS WORDS
-    segments_list = list(segments)
-    all_words = []   # each element: {'raw': str, 'clean': str, 'start': float, 'end': float}
+    with gpu_scheduler.reserve("transcribe"), whisper_pool.checkout(model_size, WHISPER_DEVICE, WHISPER_COMPUTE_TYPE) as model:
+        segments, info = model.transcribe(samples, **decode_options)
+        # Convert generator to list to consume it completely while the model is checked out
+        segments_list = list(segments)
+
+    # 2. PREPROCESS WORDS
+    all_words = []
     for segment in segments_list:
         if segment.words:
             for word_obj in segment.words:
-                raw_word = word_obj.word
-                clean_word = raw_word.lower().strip().strip(string.punctuation)
                 all_words.append({
-                    'raw': raw_word,
-                    'clean': clean_word,
-                    'start': word_obj.start,
-                    'end': word_obj.end
+                    'raw': word_obj.word,
+                    'clean': clean_token(word_obj.word),
+                    'start': word_obj.start + offset_s,
+                    'end': word_obj.end + offset_s,
+                    'probability': word_obj.probability
                 })
+    return all_words
 
-    # 5. PREPROCESS BAD WORDS AND SLURS: split each into tokens (cleaned similarly)
-    def preprocess_terms(terms):
-        phrases = []
-        for term in terms:
-            clean_term = term.lower().strip().strip(string.punctuation)
-            tokens = clean_term.split()
-            if tokens:  # ignore empty terms
-                phrases.append(tokens)
-        return phrases
-
-    bad_phrases = preprocess_terms(bad_words)
-    slur_phrases = preprocess_terms(slurs)
-
-    # 6. FIND PHRASE MATCHES FOR BAD WORDS AND SLURS SEPARATELY
-    n = len(all_words)
-    bad_intervals = []   # list of (start_idx, end_idx) for bad words
-    slur_intervals = []  # list of (start_idx, end_idx) for slurs
-
-    for i in range(n):
-        # Check bad words
-        for tokens in bad_phrases:
-            L = len(tokens)
-            if i + L > n:
-                continue
-            match = True
-            for j in range(L):
-                if all_words[i+j]['clean'] != tokens[j]:
-                    match = False
-                    break
-            if match:
-                bad_intervals.append( (i, i+L-1) )
-        # Check slurs
-        for tokens in slur_phrases:
-            L = len(tokens)
-            if i + L > n:
-                continue
-            match = True
-            for j in range(L):
-                if all_words[i+j]['clean'] != tokens[j]:
-                    match = False
-                    break
-            if match:
-                slur_intervals.append( (i, i+L-1) )
-
-    # 7. CONVERT WORD INDICES TO TIME INTERVALS WITH BUFFER
-    BUFFER_MS = 85   # same as before
-    def convert_intervals(intervals):
-        time_intervals = []
-        for (start_idx, end_idx) in intervals:
-            start_time = all_words[start_idx]['start']
-            end_time   = all_words[end_idx]['end']
-            # Convert to milliseconds and apply buffer
-            start_time_ms = int(start_time * 1000) - BUFFER_MS
-            end_time_ms   = int(end_time   * 1000) + BUFFER_MS
-            if start_time_ms < 0:
-                start_time_ms = 0
-            time_intervals.append( (start_time_ms, end_time_ms) )
-        return time_intervals
-
-    bad_time_intervals = convert_intervals(bad_intervals)
-    slur_time_intervals = convert_intervals(slur_intervals)
-
-    # 8. MERGE OVERLAPPING OR ADJACENT INTERVALS FOR EACH LIST
-    def merge_intervals(intervals):
-        if not intervals:
-            return []
-        # Sort by start time
-        intervals.sort(key=lambda x: x[0])
-        merged = []
-        current_start, current_end = intervals[0]
-        for i in range(1, len(intervals)):
-            s, e = intervals[i]
-            if s <= current_end:   # overlapping or adjacent
-                if e > current_end:
-                    current_end = e
-            else:
-                merged.append( (current_start, current_end) )
-                current_start, current_end = s, e
-        merged.append( (current_start, current_end) )
-        return merged
-
-    merged_bad = merge_intervals(bad_time_intervals)
-    merged_slur = merge_intervals(slur_time_intervals)
-
-    # 9. SAVE THE RESULTS TO JSON FOR CACHING
-    cache_data = {
-        'bad_words': merged_bad,
-        'slurs': merged_slur
-    }
-    with open(cache_file, 'w') as f:
-        json.dump(cache_data, f)
-    print(f'[+] Saved transcription cache to {cache_file}')
-
-    # 10. CLEAN UP MODEL TO FREE GPU MEMORY
-    del model
-    import torch
-    if torch.cuda.is_available():
-        torch.cuda.empty_cache()
-
-    # 11. RETURN THE TIMESTAMPS
-    return merged_bad, merged_slur
-
-async def get_separated_paths(audio_file_path, both=False):
-    """
-    Get the paths for separated instrumental and vocal files.
-    """
-    import os
-    filename = os.path.splitext(os.path.basename(audio_file_path))[0]  # without extension
-    instrumental_path = f'separated/{filename}/accompaniment.wav'
-    vocal_path = f'separated/{filename}/vocals.wav'
-
-    if both:
-        if os.path.exists(instrumental_path) and os.path.exists(vocal_path):
-            return instrumental_path, vocal_path
-        else:
-            return None, None
-    else:
-        if os.path.exists(instrumental_path):
-            return instrumental_path
-        else:
-            return None
-
-async def censor_with_instrumentals(audio_file_path, bad_words, output_file="censored_output.mp3", sep_task : asyncio.Task = None, genai=False):
+def stem_for_whisper(stems, name='vocals'):
     """
-    Censors bad words by replacing vocal segments with instrumentals.
+    A stem (Stems from the separator) as 16kHz mono float32, for transcribing it instead of the mix.
+    Resampled block by block, so a memory-mapped cached stem is never loaded whole.
     """
-    instrumental_path = await get_separated_paths(audio_file_path)
-    
+    samples = stems[name]
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    return resample_blocks(samples, stems.sample_rate, WHISPER_SAMPLE_RATE, mono=True)
 
-    # Step 2: Transcribe vocals to find bad words
-    print(f'[+] Transcribe vocals to find bad words in Progress..')
-    if genai:
-        bad_word_timestamps = await get_bad_word_timestamps_genai(audio_file_path, bad_words)
+async def get_transcript(audio_file_path, stems=None, vad=False):
+    """
+    Word-level Whisper transcript of the audio, cached by audio hash + model + decoding parameters.
+    :param stems: Transcribe the vocals stem instead of the mix, VAD-gated: intros, breaks and
+                  instrumental stretches are silent there, so they are skipped instead of decoded
+                  (and can't hallucinate words).
+    :param vad: Gate the mix with VAD (what's left when separation hasn't run, i.e. backspin).
+    :return: list of {'raw', 'clean', 'start', 'end', 'probability'} with times in seconds, on the song's timeline.
+    """
+    # 1. CACHE HANDLER
+    # The key doesn't depend on any word list, so list edits never trigger a new GPU pass
+    source = as_audio_source(audio_file_path)
+    decode_options = dict(WHISPER_DECODE_OPTIONS, **VAD_OPTIONS) if vad or stems is not None else WHISPER_DECODE_OPTIONS
+    if stems is not None:
+        cache_key = transcript_cache.key(source.content_hash, (WHISPER_MODEL_SIZE, WHISPER_COMPUTE_TYPE), dict(decode_options, input='vocals'))
+    elif decode_options is WHISPER_DECODE_OPTIONS:
+        cache_key = transcript_key(source)
     else:
-        bad_word_timestamps = await get_bad_word_timestamps(audio_file_path, bad_words)
-
-   # Step 3: Block the code until the paths are found (from the separator simultaneously running thread)
-    # Wait up to 60 seconds for instrumental_path to become available
-    import time
-    timeout = 60  # seconds
-    start_time = time.time()
-    while instrumental_path is None:
-        await asyncio.sleep(1)
-        instrumental_path = await get_separated_paths(audio_file_path)
-    if not instrumental_path:
-        print(f'Error! Separated instrumental not found after waiting. Had the separator not worked firstly?')
-        return
-
-    audio = AudioSegment.from_file(audio_file_path)
-    instrumental = AudioSegment.from_file(instrumental_path)
-
-    censored_audio = AudioSegment.empty()  # Start with an empty audio segment
-    previous_end_time = 0  # Keep track of the end of the last processed segment
-  
-    # Process each bad word segment
-    for start_time, end_time in bad_word_timestamps:
-        # Add the audio before the bad word
-        censored_audio += audio[previous_end_time:start_time]
-        print(f"[-] Processing segment: {start_time} ms to {end_time} ms")
-        # Reverse only the segment containing the bad word
-        censored_segment = instrumental[start_time:end_time]
-        censored_audio += censored_segment
-
-        # Update the end time of the last processed segment
-        previous_end_time = end_time
-
-    # Add the remaining audio after the last bad word
-    censored_audio += audio[previous_end_time:]
-
-    # Save the censored audio to the output file
-    # if the original file is wav, save as wav, otherwise save as mp3 with high bitrate
-    if audio_file_path.endswith(".wav"):
-        censored_audio.export(output_file, format="wav")
+        cache_key = transcript_cache.key(source.content_hash, (WHISPER_MODEL_SIZE, WHISPER_COMPUTE_TYPE), decode_options)
+    all_words = transcript_cache.get(cache_key)
+    if all_words is not None:
+        print(f'[+] Using cached transcript for {audio_file_path}')
+        return all_words
+
+    # 2. TRANSCRIPTION
+    # The shared decoded buffer at 16kHz, Whisper doesn't decode the file again
+    if stems is not None:
+        print(f'[+] Transcribing the vocals of {audio_file_path} with word-level timestamps (VAD-gated)...')
+        samples = stem_for_whisper(stems)
     else:
-        censored_audio.export(output_file, format="mp3", bitrate='320k')
-    print(f"Censored audio saved to {output_file}")
-
-async def censor_with_both(audio_file_path, bad_words, output_file="censored_output.mp3", sep_task : asyncio.Task = None):
+        print(f'[+] Transcribing {audio_file_path} with word-level timestamps (Faster Engine{", VAD-gated" if vad else ""})...')
+        samples = source.for_whisper()
+    all_words = transcribe_samples(samples, decode_options=decode_options)
+
+    # 3. SAVE THE TRANSCRIPT FOR CACHING
+    cache_path = transcript_cache.put(cache_key, all_words)
+    print(f'[+] Saved transcript cache to {cache_path}')
+    return all_words
+
+def _cached_transcription(source, model_size, decode_options, samples, offset_s=0.0, clip=None):
+    """transcribe_samples through the transcript cache; ``clip`` (start_ms, end_ms) keys a region of the song."""
+    params = dict(decode_options, clip=list(clip)) if clip else decode_options
+    cache_key = transcript_cache.key(source.content_hash, (model_size, WHISPER_COMPUTE_TYPE), params)
+    all_words = transcript_cache.get(cache_key)
+    if all_words is None:
+        all_words = transcribe_samples(samples(), offset_s, model_size=model_size, decode_options=decode_options)
+        transcript_cache.put(cache_key, all_words)
+    return all_words
+
+async def get_cascade_transcript(audio_file_path, bad_words, slurs=None, vad=False):
     """
-    Censors bad words by reversing vocal segments with the song original instrumentals.
+    Two-pass transcript: ``SCREEN_MODEL_SIZE`` with greedy decoding transcribes the whole song and
+    flags candidate words with recall-oriented fuzzy matching (phrase_matcher.fuzzy_hits), then the
+    main model re-decodes only the candidates padded by ``CASCADE_PADDING_MS`` (merged when they
+    touch). The returned words all come from the confirmation pass, so matching and timestamps are
+    as precise as a full pass wherever something was flagged. Both passes are cached.
+    :param vad: Gate the screen pass with VAD, so instrumental stretches aren't screened either.
+    :return: list of {'raw', 'clean', 'start', 'end', 'probability'}, only within the confirmed regions.
     """
-    instrumental_path, vocal_path = None,None
-    # Step 1: Block the code until the paths are found (from the separator simultaneously running thread)
-    while not sep_task.done():
-        await asyncio.sleep(1)
-        instrumental_path, vocal_path = await get_separated_paths(audio_file_path, both=True)
-    
-    # Step 2: Transcribe vocals to find bad words
-    print(f'[+] Transcribe vocals to find bad words in Progress..')
-    bad_word_timestamps = await get_bad_word_timestamps(audio_file_path, bad_words)
-
-    if not (instrumental_path and vocal_path):
-        print(f'Error! Separated files not found. Had the separator not worked firstly?')
-        return
-
-    audio = AudioSegment.from_file(audio_file_path)
-    instrumental = AudioSegment.from_file(instrumental_path)
-    vocals = AudioSegment.from_file(vocal_path)
-
-    censored_audio = AudioSegment.empty()  # Start with an empty audio segment
-    previous_end_time = 0  # Keep track of the end of the last processed segment
-  
-    # Process each bad word segment
-    for start_time, end_time in bad_word_timestamps:
-        # Add the audio before the bad word
-        censored_audio += audio[previous_end_time:start_time]
-        print(f"[-] Processing segment: {start_time} ms to {end_time} ms")
-        # Reverse only the segment containing the bad word
-        censored_segment : AudioSegment = instrumental[start_time:end_time]
-        censored_audio += censored_segment.overlay(vocals[start_time:end_time].reverse())
-
-        # Update the end time of the last processed segment
-        previous_end_time = end_time
-
-    # Add the remaining audio after the last bad word
-    censored_audio += audio[previous_end_time:]
-
-    # Save the censored audio to the output file
-    if audio_file_path.endswith(".wav"):
-        censored_audio.export(output_file, format="wav")
-    else:
-        censored_audio.export(output_file, format="mp3", bitrate='320k')
-    print(f"Censored audio saved to {output_file}")
+    source = as_audio_source(audio_file_path)
+    # Both models stay resident, instead of each one evicting the other on every song
+    whisper_pool.ensure_capacity(len({SCREEN_MODEL_SIZE, WHISPER_MODEL_SIZE}))
+    # A full transcript of the main model is already as good as it gets
+    all_words = transcript_cache.get(transcript_key(source))
+    if all_words is not None:
+        print(f'[+] Using cached transcript for {audio_file_path}')
+        return all_words
+
+    # 1. SCREEN: small model, greedy, whole song
+    duration_ms = source.duration_ms
+    print(f'[+] Screening {audio_file_path} with the "{SCREEN_MODEL_SIZE}" model..')
+    screen_options = dict(SCREEN_DECODE_OPTIONS, **VAD_OPTIONS) if vad else SCREEN_DECODE_OPTIONS
+    screen = _cached_transcription(source, SCREEN_MODEL_SIZE, screen_options, source.for_whisper)
+    flagged = [(int(screen[i]['start'] * 1000), int(screen[i]['end'] * 1000))
+               for i in fuzzy_hits([w['clean'] for w in screen], bad_words, slurs)]
+    regions = merge_intervals([(max(0, start - CASCADE_PADDING_MS), min(duration_ms, end + CASCADE_PADDING_MS)) for start, end in flagged])
+
+    # 2. CONFIRM: main model with word timestamps, flagged regions only
+    all_words = []
+    for start, end in regions:
+        samples = lambda: source.window(start, end, sample_rate=WHISPER_SAMPLE_RATE, mono=True)
+        all_words.extend(_cached_transcription(source, WHISPER_MODEL_SIZE, WHISPER_DECODE_OPTIONS, samples, start / 1000, clip=(start, end)))
+
+    confirmed_ms = sum(end - start for start, end in regions)
+    print(f'[=] Cascade: screen pass "{SCREEN_MODEL_SIZE}" over {duration_ms / 1000:.1f}s of audio, '
+          f'confirmation "{WHISPER_MODEL_SIZE}" over {confirmed_ms / 1000:.1f}s in {len(regions)} regions '
+          f'({confirmed_ms / max(1, duration_ms):.1%} of the song), {len(flagged)} candidate words')
+    return all_words
+
+def merge_intervals(intervals):
+    """Sorts (start_ms, end_ms) intervals and merges overlapping or adjacent ones."""
+    if not intervals:
+        return []
+    intervals = sorted(intervals, key=lambda x: x[0])
+    merged = []
+    current_start, current_end = intervals[0]
+    for s, e in intervals[1:]:
+        if s <= current_end:   # overlapping or adjacent
+            if e > current_end:
+                current_end = e
+        else:
+            merged.append( (current_start, current_end) )
+            current_start, current_end = s, e
+    merged.append( (current_start, current_end) )
+    return merged
 
-async def censor_with_downpitch(audio_file_path, bad_words, output_file="censored_output.mp3", sep_task : asyncio.Task = None):
+def match_transcript(all_words, bad_words, slurs=None):
     """
-    Censors bad words by downpitching vocal segments with the song original instrumentals.
+    Matches word lists against a transcript. Cheap, no model involved.
+    :return: {'bad_words': [(start_ms, end_ms), ..], 'slurs': [..]} with BUFFER_MS padding, merged per category.
     """
-    instrumental_path, vocal_path = None,None
-    # Step 1: Block the code until the paths are found (from the separator simultaneously running thread)
-    while not sep_task.done():
-            await asyncio.sleep(1)
-            instrumental_path, vocal_path = await get_separated_paths(audio_file_path, both=True)
+    # 1. TAG BAD WORDS (AND SLURS) IN A SINGLE PASS
+    # The compiled automaton reports the category of every match, reused for the same lists across songs
+    matcher = get_matcher(bad_words, slurs)
+    intervals = {'bad_words': [], 'slurs': []}
+    for start_idx, end_idx, category in matcher.find([w['clean'] for w in all_words]):
+        # 2. CONVERT WORD INDICES TO TIME INTERVALS WITH BUFFER
+        start_time_ms = max(0, int(all_words[start_idx]['start'] * 1000) - BUFFER_MS)
+        end_time_ms   = int(all_words[end_idx]['end'] * 1000) + BUFFER_MS
+        intervals[category].append( (start_time_ms, end_time_ms) )
+
+    # 3. MERGE OVERLAPPING OR ADJACENT INTERVALS FOR EACH LIST
+    return {category: merge_intervals(found) for category, found in intervals.items()}
 
-    # Step 2: Transcribe vocals to find bad words
-    print(f'[+] Transcribe vocals to find bad words in Progress..')
-    bad_word_timestamps = await get_bad_word_timestamps(audio_file_path, bad_words)
+async def get_bad_word_timestamps(audio_file_path, bad_words):
+    all_words = await get_transcript(audio_file_path)
+    return match_transcript(all_words, bad_words)['bad_words']
 
-    if not (instrumental_path and vocal_path):
-        print(f'Error! Separated files not found. Had the separator not worked firstly?')
-        return
+async def get_bad_word_and_slurs_timestamps(audio_file_path, bad_words, slurs):
+    all_words = await get_transcript(audio_file_path)
+    matches = match_transcript(all_words, bad_words, slurs)
+    return matches['bad_words'], matches['slurs']
 
-    audio = AudioSegment.from_file(audio_file_path)
-    instrumental = AudioSegment.from_file(instrumental_path)
-    vocals = AudioSegment.from_file(vocal_path)
+def render_instrumentals(renderer, bad_word_timestamps, slurs_timestamps=()):
+    """Replaces every bad word with the instrumental. Needs stems."""
+    for start_time, end_time in bad_word_timestamps:
+        print(f"[-] Processing segment: {start_time} ms to {end_time} ms")
+        # Replace only the segment containing the bad word with the instrumental
+        renderer.replace(start_time, end_time, 'accompaniment')
 
-    censored_audio = AudioSegment.empty()  # Start with an empty audio segment
-    previous_end_time = 0  # Keep track of the end of the last processed segment
-  
-    # Process each bad word segment
+def render_reversed_vocals(renderer, bad_word_timestamps, slurs_timestamps=()):
+    """Reverses the vocals of every bad word over the instrumental. Needs stems."""
     for start_time, end_time in bad_word_timestamps:
-        # Add the audio before the bad word
-        censored_audio += audio[previous_end_time:start_time]
+        print(f"[-] Processing segment: {start_time} ms to {end_time} ms")
+        # Reverse only the vocals of the segment containing the bad word, over the instrumental
+        renderer.overlay(start_time, end_time, renderer.source('vocals', start_time, end_time)[::-1], base='accompaniment')
+
+def render_downpitch(renderer, bad_word_timestamps, slurs_timestamps=(), semitones=10):
+    """Down-pitches the vocals of every bad word over the instrumental. Needs stems."""
+    print(f"[-] Down-pitching {len(bad_word_timestamps)} vocal segments in one pass..")
+    downpitched_segments = renderer.pitch_many(bad_word_timestamps, -semitones) # 10 semi-tones should be enough to sound screwed.
+    for (start_time, end_time), downpitched in zip(bad_word_timestamps, downpitched_segments):
         print(f"[+] Processing segment: {start_time} ms to {end_time} ms")
-        # Reverse only the segment containing the bad word
-        censored_segment : AudioSegment = instrumental[start_time:end_time]
-
-        print(f"[-] Preparing current segment for down-pitch..")
-        cur_vocal_to_downpitch = vocals[start_time:end_time]
-        cur_vocal_to_downpitch.export('temp.wav',format="wav")
-        print(f"[-] Calling downpitch... ")
-        
-        await down_pitch('temp.wav','down_temp.wav',semitones=10) # 10 semi-tones should be enough to sound screwed.
         print(f"[-] Mixing segment as censored...")
-        downpitched = AudioSegment.from_file('down_temp.wav')
-        censored_audio += censored_segment.overlay(downpitched)
-
-        # Update the end time of the last processed segment
-        previous_end_time = end_time
-
-    # Add the remaining audio after the last bad word
-    censored_audio += audio[previous_end_time:]
-
-    # Save the censored audio to the output file
-    if audio_file_path.endswith(".wav"):
-        censored_audio.export(output_file, format="wav")
-    else:
-        censored_audio.export(output_file, format="mp3", bitrate='320k')
-    print(f"Censored audio saved to {output_file}")
-
-async def censor_with_instrumentals_and_downpitch(audio_file_path, bad_words, slurs, output_file="censored_output.mp3", sep_task : asyncio.Task = None):
-    """
-    Censors bad words by replacing vocal segments with instrumentals.
-    """
-    # Step 1: Wait for separation to complete if sep_task is provided
-    instrumental_path, vocal_path = None, None
-    if sep_task is not None:
-        # Wait for the separation task to complete
-        while not sep_task.done():
-            await asyncio.sleep(1)
-            instrumental_path, vocal_path = await get_separated_paths(audio_file_path, both=True)
-        # One final check after task completes
-        instrumental_path, vocal_path = await get_separated_paths(audio_file_path, both=True)
-    else:
-        # If no sep_task provided, get paths directly (for backward compatibility)
-        instrumental_path, vocal_path = await get_separated_paths(audio_file_path, both=True)
-    
-    if not (instrumental_path and vocal_path):
-        print(f'Error! Separated files not found. Had the separator not worked firstly?')
-        return
-
-    # Step 2: Transcribe vocals to find bad words and slurs
-    print(f'[+] Transcribe vocals to find bad words and slurs in Progress..')
-    both_timestamps = await get_bad_word_and_slurs_timestamps(audio_file_path, bad_words, slurs)
-    bad_word_timestamps, slurs_timestamps = both_timestamps
-    
-    audio = AudioSegment.from_file(audio_file_path)
-    instrumental = AudioSegment.from_file(instrumental_path)
-    vocals = AudioSegment.from_file(vocal_path)
-    
-    censored_audio = AudioSegment.empty()  # Start with an empty audio segment
-    previous_end_time = 0  # Keep track of the end of the last processed segment
-   
-    # Process each bad word segment
-    for start_time, end_time in sorted(bad_word_timestamps + slurs_timestamps):
-        # Add the audio before the bad word
-        if (start_time, end_time) in bad_word_timestamps:
-            censored_audio += audio[previous_end_time:start_time]
+        renderer.overlay(start_time, end_time, downpitched, base='accompaniment')
+
+def _render_with_downpitched_slurs(renderer, bad_word_timestamps, slurs_timestamps, censor_bad_word, semitones=10):
+    # Slurs that aren't bad words too are down-pitched, in one batched pass
+    bad_word_set = set(bad_word_timestamps)
+    slur_only = [interval for interval in slurs_timestamps if interval not in bad_word_set]
+    print(f"[-] Down-pitching {len(slur_only)} slur segments in one pass..")
+    downpitched_slurs = dict(zip(slur_only, renderer.pitch_many(slur_only, -semitones))) # 10 semi-tones should be enough to sound screwed.
+    for start_time, end_time in sorted(list(bad_word_timestamps) + list(slurs_timestamps)):
+        if (start_time, end_time) in bad_word_set:
             print(f"[+] Processing bad word segment: {start_time} ms to {end_time} ms")
-            # Reverse only the segment containing the bad word
-            censored_segment = instrumental[start_time:end_time]
-            censored_audio += censored_segment
-        
+            censor_bad_word(start_time, end_time)
         else:
-            censored_audio += audio[previous_end_time:start_time]
             print(f"[+] Processing slur segment: {start_time} ms to {end_time} ms")
-            # Reverse only the segment containing the bad word
-            censored_segment : AudioSegment = instrumental[start_time:end_time]
-            
-            print(f"[-] Preparing current segment for down-pitch..")
-            cur_vocal_to_downpitch = vocals[start_time:end_time]
-            cur_vocal_to_downpitch.export('temp.wav',format="wav")
-            print(f"[-] Calling downpitch... ")
-            
-            await down_pitch('temp.wav','down_temp.wav',semitones=10) # 10 semi-tones should be enough to sound screwed.
             print(f"[-] Mixing segment as censored...")
-            downpitched = AudioSegment.from_file('down_temp.wav')
-            censored_audio += censored_segment.overlay(downpitched)
-        
-        # Update the end time of the last processed segment
-        previous_end_time = end_time
-    
-    # Add the remaining audio after the last bad word
-    censored_audio += audio[previous_end_time:]
-    
-    # Save the censored audio to the output file
-    if audio_file_path.endswith(".wav"):
-        censored_audio.export(output_file, format="wav")
-    else:
-        censored_audio.export(output_file, format="mp3", bitrate='320k')
-    print(f"Censored audio saved to {output_file}")
+            renderer.overlay(start_time, end_time, downpitched_slurs[(start_time, end_time)], base='accompaniment')
+
+def render_instrumentals_and_downpitch(renderer, bad_word_timestamps, slurs_timestamps=()):
+    """Bad words become instrumental, slurs are down-pitched. Needs stems."""
+    # Replace only the segment containing the bad word with the instrumental
+    _render_with_downpitched_slurs(renderer, bad_word_timestamps, slurs_timestamps,
+                                   lambda start_time, end_time: renderer.replace(start_time, end_time, 'accompaniment'))
+
+def render_both_and_downpitch(renderer, bad_word_timestamps, slurs_timestamps=()):
+    """Bad words get reversed vocals over the instrumental, slurs are down-pitched. Needs stems."""
+    # Reverse only the vocals of the segment containing the bad word, over the instrumental
+    _render_with_downpitched_slurs(renderer, bad_word_timestamps, slurs_timestamps,
+                                   lambda start_time, end_time: renderer.overlay(start_time, end_time, renderer.source('vocals', start_time, end_time)[::-1], base='accompaniment'))
+
+def render_backspin(renderer, bad_word_timestamps, slurs_timestamps=()):
+    """Reverses the whole mix over every bad word. No stems needed."""
+    for start_time, end_time in bad_word_timestamps:
+        print(f"[-] Processing segment: {start_time} ms to {end_time} ms")
+        # Reverse only the segment containing the bad word
+        renderer.reverse(start_time, end_time)
+
+def render_tape_stop(renderer, bad_word_timestamps, slurs_timestamps=(), semitones=10, intensity=0.6):
+    """Down-pitch + tape stop over every bad word: of the vocals over the instrumental with stems, of the whole mix without."""
+    has_stems = renderer.has_source('vocals')
+    # 1. Down-pitch every flagged vocal (or the whole mix without stems) in one batched pass
+    print(f"[-] Calling downpitch ({semitones} semitones) for {len(bad_word_timestamps)} tape stop segments...")
+    downpitched_vocals = renderer.pitch_many(bad_word_timestamps, -semitones, source='vocals' if has_stems else 'mix')
 
-async def censor_with_both_and_downpitch(audio_file_path, bad_words, slurs, output_file="censored_output.mp3", sep_task : asyncio.Task = None):
+    for (start_time, end_time), downpitched_vocal in zip(bad_word_timestamps, downpitched_vocals):
+        print(f"[-] Processing tape stop segment (intensity={intensity}): {start_time} ms to {end_time} ms")
+        # 2. Apply tape stop deceleration with controlled break intensity through the float32 kernel
+        ts_vocal = tape_stop(downpitched_vocal, renderer.sample_rate, intensity=intensity)
+        # 3. Lay it over the instrumental, or replace the segment outright without stems
+        renderer.overlay(start_time, end_time, ts_vocal, base='accompaniment' if has_stems else None)
+
+async def censor_with_plan(method, audio_file_path, bad_words, output_file="censored_output.mp3", slurs=None, **options):
+    """
+    Censors a song end to end with one method's plan (pipeline.METHOD_PLANS), the same path the CLI
+    and the Gradio app take: only the stages the method needs, errors of any stage raised here.
+    :param method: A key of METHOD_PLANS.
+    :param options: Passed to the plan's render function (i.e. intensity for the tape stop).
+    :return: The output path.
+    """
+    # pipeline imports this module
+    from pipeline import PipelineCoordinator, METHOD_PLANS
+    plan = METHOD_PLANS[method]
+    # The job's scratch dir goes away with it, whether it succeeds or not
+    with Workspace() as workspace:
+        pipeline = PipelineCoordinator(audio_file_path, workspace=workspace)
+        return await pipeline.execute(plan, bad_words, output_file, slurs=slurs if plan.slurs else None, **options)
+
+async def censor_with_instrumentals(audio_file_path, bad_words, output_file="censored_output.mp3", genai=False):
     """
     Censors bad words by replacing vocal segments with instrumentals.
     """
-    while not sep_task.done():
-        await asyncio.sleep(1)
-        instrumental_path, vocal_path = await get_separated_paths(audio_file_path, both=True)
+    return await censor_with_plan('Gv' if genai else 'v', audio_file_path, bad_words, output_file)
 
-    # Step 2: Transcribe vocals to find bad words
-    print(f'[+] Transcribe vocals to find bad words and slurs in Progress..')
-    both_timestamps = await get_bad_word_and_slurs_timestamps(audio_file_path, bad_words, slurs)
-    bad_word_timestamps, slurs_timestamps = both_timestamps
-    
-    if not (instrumental_path and vocal_path):
-        print(f'Error! Separated files not found. Had the separator not worked firstly?')
-        return
-
-    audio = AudioSegment.from_file(audio_file_path)
-    instrumental = AudioSegment.from_file(instrumental_path)
-    vocals = AudioSegment.from_file(vocal_path)
-
-    censored_audio = AudioSegment.empty()  # Start with an empty audio segment
-    previous_end_time = 0  # Keep track of the end of the last processed segment
-  
-    # Process each bad word segment
-    for start_time, end_time in sorted(bad_word_timestamps + slurs_timestamps):
-        # Add the audio before the bad word
-        if (start_time, end_time) in bad_word_timestamps:
-            censored_audio += audio[previous_end_time:start_time]
-            print(f"[+] Processing bad word segment: {start_time} ms to {end_time} ms")
-            # Reverse only the segment containing the bad word
-            censored_segment : AudioSegment = instrumental[start_time:end_time]
-            censored_audio += censored_segment.overlay(vocals[start_time:end_time].reverse())
-
-        else:
-            censored_audio += audio[previous_end_time:start_time]
-            print(f"[+] Processing slur segment: {start_time} ms to {end_time} ms")
-            # Reverse only the segment containing the bad word
-            censored_segment : AudioSegment = instrumental[start_time:end_time]
-
-            print(f"[-] Preparing current segment for down-pitch..")
-            cur_vocal_to_downpitch = vocals[start_time:end_time]
-            cur_vocal_to_downpitch.export('temp.wav',format="wav")
-            print(f"[-] Calling downpitch... ")
-            
-            await down_pitch('temp.wav','down_temp.wav',semitones=10) # 10 semi-tones should be enough to sound screwed.
-            print(f"[-] Mixing segment as censored...")
-            downpitched = AudioSegment.from_file('down_temp.wav')
-            censored_audio += censored_segment.overlay(downpitched)
+async def censor_with_both(audio_file_path, bad_words, output_file="censored_output.mp3"):
+    """
+    Censors bad words by reversing vocal segments with the song original instrumentals.
+    """
+    return await censor_with_plan('vb', audio_file_path, bad_words, output_file)
 
-        # Update the end time of the last processed segment
-        previous_end_time = end_time
+async def censor_with_downpitch(audio_file_path, bad_words, output_file="censored_output.mp3"):
+    """
+    Censors bad words by downpitching vocal segments with the song original instrumentals.
+    """
+    return await censor_with_plan('p', audio_file_path, bad_words, output_file)
 
-    # Add the remaining audio after the last bad word
-    censored_audio += audio[previous_end_time:]
+async def censor_with_instrumentals_and_downpitch(audio_file_path, bad_words, slurs, output_file="censored_output.mp3"):
+    """
+    Censors bad words by replacing vocal segments with instrumentals, slurs by downpitching them.
+    """
+    return await censor_with_plan('sv', audio_file_path, bad_words, output_file, slurs=slurs)
 
-    # Save the censored audio to the output file
-    if audio_file_path.endswith(".wav"):
-        censored_audio.export(output_file, format="wav")
-    else:
-        censored_audio.export(output_file, format="mp3", bitrate='320k')
-    print(f"Censored audio saved to {output_file}")
+async def censor_with_both_and_downpitch(audio_file_path, bad_words, slurs, output_file="censored_output.mp3"):
+    """
+    Censors bad words by reversing vocal segments over the instrumentals, slurs by downpitching them.
+    """
+    return await censor_with_plan('sb', audio_file_path, bad_words, output_file, slurs=slurs)
 
 async def censor_with_backspin(audio_file_path, bad_words, output_file_path="censored_output.mp3"):
     # Oldest method in the book
-    audio = AudioSegment.from_file(audio_file_path)
-    print(f'[+] Transcribe vocals to find bad words in Progress..')
-    bad_word_timestamps = await get_bad_word_timestamps(audio_file_path, bad_words)
-
-    censored_audio = AudioSegment.empty()  # Start with an empty audio segment
-    previous_end_time = 0  # Keep track of the end of the last processed segment
-
-    # Process each bad word segment
-    for start_time, end_time in bad_word_timestamps:
-        # Add the audio before the bad word
-        censored_audio += audio[previous_end_time:start_time]
-        print(f"[-] Processing segment: {start_time} ms to {end_time} ms")
-        # Reverse only the segment containing the bad word
-        censored_segment = audio[start_time:end_time].reverse()
-        censored_audio += censored_segment
-
-        # Update the end time of the last processed segment
-        previous_end_time = end_time
-
-    # Add the remaining audio after the last bad word
-    censored_audio += audio[previous_end_time:]
-
-    # Save the censored audio to the output file
-    censored_audio.export(output_file_path, format="mp3")
-    print(f"Censored audio saved to {output_file_path}")
+    return await censor_with_plan('b', audio_file_path, bad_words, output_file_path)
 
 def apply_tape_stop_effect(
     segment: AudioSegment,
@@ -660,73 +455,15 @@ def apply_tape_stop_effect(
     """
     if len(segment) == 0:
         return segment
-
-    intensity = max(0.0, min(1.0, float(intensity)))
-    speed_end = 1.0 - intensity * 0.85
-
-    orig_raw = np.array(segment.get_array_of_samples())
-    samples = orig_raw.astype(np.float64)
-    num_channels = segment.channels
-
-    if num_channels > 1:
-        samples = samples.reshape((-1, num_channels))
-
-    num_frames = len(samples)
-    if num_frames < 2:
-        return segment
-
-    orig_peak = np.max(np.abs(samples))
-    if orig_peak == 0:
-        return segment
-
-    u = np.linspace(0.0, 1.0, num_frames)
-
-    p = curve_exponent + 1.0
-    phi = u - ((1.0 - speed_end) / p) * (u ** p)
-    phi_max = 1.0 - ((1.0 - speed_end) / p)
-
-    in_indices = np.arange(num_frames, dtype=np.float64)
-    out_indices = (num_frames - 1) * (phi / phi_max)
-
-    if num_channels == 1:
-        out_samples = np.interp(out_indices, in_indices, samples)
-    else:
-        out_samples = np.zeros((num_frames, num_channels), dtype=np.float64)
-        for c in range(num_channels):
-            out_samples[:, c] = np.interp(out_indices, in_indices, samples[:, c])
-
-    out_peak = np.max(np.abs(out_samples))
-    if out_peak > 0:
-        out_samples = out_samples * (orig_peak / out_peak)
-
-    if np.issubdtype(orig_raw.dtype, np.integer):
-        info = np.iinfo(orig_raw.dtype)
-        out_samples = np.clip(out_samples, info.min, info.max).astype(orig_raw.dtype)
-    else:
-        out_samples = out_samples.astype(orig_raw.dtype)
-
-    if num_channels > 1:
-        out_samples = out_samples.flatten()
-
-    tape_stopped = AudioSegment(
-        out_samples.tobytes(),
-        frame_rate=segment.frame_rate,
-        sample_width=segment.sample_width,
-        channels=segment.channels
-    )
-
-    if fade_in_ms > 0 and len(tape_stopped) > fade_in_ms:
-        tape_stopped = tape_stopped.fade_in(duration=fade_in_ms)
-    if fade_out_ms > 0 and len(tape_stopped) > fade_out_ms:
-        tape_stopped = tape_stopped.fade_out(duration=fade_out_ms)
-
-    return tape_stopped
+    # The float32 kernel (render_engine.tape_stop) on the decoded samples
+    samples = tape_stop(segment_to_array(segment), segment.frame_rate, intensity=intensity,
+                        curve_exponent=curve_exponent, fade_in_ms=fade_in_ms, fade_out_ms=fade_out_ms)
+    return array_to_segment(samples, segment.frame_rate)
 
 async def censor_with_tape_stop(
     audio_file_path,
     bad_words,
     output_file_path="censored_output.mp3",
-    sep_task: asyncio.Task = None,
     semitones: int = 10,
     intensity: float = 0.6
 ):
@@ -737,88 +474,24 @@ async def censor_with_tape_stop(
     :param intensity: Tape break intensity from 0.0 (0%) to 1.0 (100%).
                       Default 0.6 (60%) allows a smooth vinyl pitch dip that flows naturally.
     """
-    instrumental_path, vocal_path = None, None
-    if sep_task is not None:
-        while not sep_task.done():
-            await asyncio.sleep(0.5)
-        instrumental_path, vocal_path = await get_separated_paths(audio_file_path, both=True)
-
-    print(f'[+] Transcribe vocals to find bad words in Progress..')
-    bad_word_timestamps = await get_bad_word_timestamps(audio_file_path, bad_words)
-    audio = AudioSegment.from_file(audio_file_path)
-
-    has_stems = instrumental_path and vocal_path and os.path.exists(instrumental_path) and os.path.exists(vocal_path)
-    if has_stems:
-        instrumental = AudioSegment.from_file(instrumental_path)
-        vocals = AudioSegment.from_file(vocal_path)
-
-    censored_audio = AudioSegment.empty()  # Start with an empty audio segment
-    previous_end_time = 0  # Keep track of the end of the last processed segment
-
-    # Process each bad word segment
-    for start_time, end_time in bad_word_timestamps:
-        # Add the audio before the bad word
-        censored_audio += audio[previous_end_time:start_time]
-        print(f"[-] Processing tape stop segment (intensity={intensity}): {start_time} ms to {end_time} ms")
-        
-        target_vocal = vocals[start_time:end_time] if has_stems else audio[start_time:end_time]
-        
-        # 1. Export target segment to temporary file for down_pitch
-        temp_input = 'temp_ts_in.wav'
-        temp_down = 'temp_ts_down.wav'
-        target_vocal.export(temp_input, format="wav")
-        
-        # 2. Call down_pitch
-        print(f"[-] Calling downpitch ({semitones} semitones) for tape stop segment...")
-        await down_pitch(temp_input, temp_down, semitones=semitones)
-        downpitched_vocal = AudioSegment.from_file(temp_down)
-        
-        # 3. Apply tape stop deceleration with controlled break intensity
-        ts_vocal = apply_tape_stop_effect(downpitched_vocal, intensity=intensity)
-
-        if has_stems:
-            inst_seg = instrumental[start_time:end_time]
-            censored_segment = inst_seg.overlay(ts_vocal)
-        else:
-            censored_segment = ts_vocal
-
-        censored_audio += censored_segment
-
-        # Update the end time of the last processed segment
-        previous_end_time = end_time
-
-    # Add the remaining audio after the last bad word
-    censored_audio += audio[previous_end_time:]
-
-
-    # Save the censored audio to the output file
-    if audio_file_path.endswith(".wav"):
-        censored_audio.export(output_file_path, format="wav")
-    else:
-        censored_audio.export(output_file_path, format="mp3", bitrate='320k')
-    print(f"Censored audio saved to {output_file_path}")
+    return await censor_with_plan('ts', audio_file_path, bad_words, output_file_path, semitones=semitones, intensity=intensity)
 
 
 async def print_transcribed_words(audio_file_path):
-    # Load model with high-performance int8_float16 quantization
-    model = WhisperModel(
-        "medium", 
-        device="cuda", 
-        compute_type="int8_float16"
-    )
-
     print(f"[#] Debug: Transcribing {audio_file_path} (Faster Engine)")
 
-    # 1. Faster-Whisper returns a generator of segments
-    segments, info = model.transcribe(
-        audio_file_path, 
-        word_timestamps=True,
-        beam_size=5
-    )
+    # 1. Borrow the resident model (int8_float16 quantization), Faster-Whisper returns a generator of segments
+    with gpu_scheduler.reserve("transcribe"), whisper_pool.checkout(WHISPER_MODEL_SIZE, WHISPER_DEVICE, WHISPER_COMPUTE_TYPE) as model:
+        segments, info = model.transcribe(
+            audio_file_path, 
+            word_timestamps=True,
+            beam_size=5
+        )
+        segments = list(segments)
 
     print("Recognized words and their timestamps:")
 
-    # 2. Iterate through the generator
+    # 2. Iterate through the segments
     for segment in segments:
         # Print the full segment text for context
         print(f"\n--- Segment: {segment.text.strip()} ---")
@@ -846,7 +519,7 @@ async def get_bad_word_timestamps_genai(audio_file_path, bad_words):
     # check if transcription.json exists, if not, print error and exit
     if not os.path.exists('transcription.json'):
         print(f'Error! transcription.json not found. Running transcription..')
-        await genai.transcribe_audio_file(audio_file_path, 'transcription.json')
+        await genai.transcribe_audio_file(os.fspath(audio_file_path), 'transcription.json')
 
     with open('transcription.json', 'r') as f:
         result = json.load(f)
@@ -861,14 +534,17 @@ async def get_bad_word_timestamps_genai(audio_file_path, bad_words):
 
     return bad_word_timestamps
 
-async def cleanup():
-    print(f'[=] Running clean-up..')
-    files = ['down_temp.wav','down_temp.mp3','temp.wav','temp.mp3','temp_ts_in.wav','temp_ts_down.wav']
-    for file in files:
-        if os.path.exists(file):
-            os.remove(file)
-    if os.path.exists('separated'):
-        rmtree('separated')
+async def cleanup(workspace=None):
+    """
+    Removes one job's scratch directory (see workspace.Workspace). Nothing shared is touched:
+    not other jobs' workspaces, not the stem or transcript caches.
+    """
+    if workspace is not None:
+        workspace.cleanup()
 
 async def run_in_thread(coro):
-    await asyncio.to_thread(asyncio.run, coro)
\ No newline at end of file
+    """
+    Runs a coroutine to completion on its own event loop in a worker thread and returns its result.
+    Anything it awaits from the outside must be thread-safe (i.e. a concurrent.futures.Future), not a task of the caller's loop.
+    """
+    return await asyncio.to_thread(asyncio.run, coro)
@@ -0,0 +1,233 @@
+import os
+import subprocess
+import tempfile
+import threading
+import numpy as np
+
+WHISPER_SAMPLE_RATE = 16000
+# Inputs longer than this are decoded into a memory-mapped file instead of RAM (DJ sets, long mixes)
+MEMMAP_MIN_SECONDS = float(os.environ.get("CENSOR_MEMMAP_MINUTES", 20)) * 60
+# Where those maps live; a disk-backed dir, tmpfs would put the whole song back in memory
+MEMMAP_DIR = os.environ.get("CENSOR_MEMMAP_DIR", tempfile.gettempdir())
+RESAMPLE_BLOCK_SECONDS = 60
+
+
+class AudioSource:
+    """
+    One decoded input file, shared by every stage of a job.
+
+    The file is decoded once (one ffmpeg run) into a float32 (frames, channels) buffer at
+    its native rate, which is what the renderer works on. Other rates are derived from that
+    buffer on first use and kept: 16kHz mono for Whisper, 44.1kHz for Spleeter. Safe to use
+    from the separation, transcription and censor threads at the same time.
+
+    Stages take an AudioSource wherever they took a path; ``os.fspath(source)`` is still the
+    path, for output naming and anything that really needs the file.
+
+    Inputs longer than ``MEMMAP_MIN_SECONDS`` are decoded by ffmpeg straight into a float32
+    file that is memory-mapped (and unlinked right away, the map keeps it alive), and their
+    resampled versions are built block by block into maps of their own. Slices are then
+    zero-copy views and only the pages a stage reads are ever resident, so peak memory no
+    longer grows with the length of the set.
+    """
+
+    def __init__(self, path, memmap=None):
+        """
+        :param memmap: Force (True) or disable (False) the memory-mapped backing, by default decided by duration.
+        """
+        self.path = os.fspath(path)
+        self.memmap = memmap
+        self._samples = None
+        self._sample_rate = None
+        self._map_files = []   # open handles of the (unlinked) backing files
+        self._resampled = {}   # (sample_rate, mono) -> samples
+        self._content_hash = None
+        self._lock = threading.Lock()
+
+    def _decode(self):
+        with self._lock:
+            if self._samples is None:
+                if self.memmap is None:
+                    self.memmap = self._probe()[2] >= MEMMAP_MIN_SECONDS
+                if self.memmap:
+                    self._decode_to_memmap()
+                else:
+                    from pydub import AudioSegment
+                    from render_engine import segment_to_array
+                    print(f'[+] Decoding {self.path}..')
+                    segment = AudioSegment.from_file(self.path)
+                    self._samples, self._sample_rate = segment_to_array(segment), segment.frame_rate
+        return self._samples
+
+    def _probe(self):
+        """(sample_rate, channels, duration in seconds) from ffprobe, without decoding."""
+        from pydub.utils import mediainfo
+        info = mediainfo(self.path)
+        return int(info.get('sample_rate', 44100)), int(info.get('channels', 2)), float(info.get('duration', 0) or 0)
+
+    def _map_file(self, suffix):
+        """Creates a backing file, unlinked at once: it lives as long as its open handle (and any map of it)."""
+        os.makedirs(MEMMAP_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=MEMMAP_DIR, suffix=suffix)
+        f = os.fdopen(fd, "r+b")
+        self._map_files.append(f)
+        return f, path
+
+    def _decode_to_memmap(self):
+        from pydub.utils import get_encoder_name
+        sample_rate, channels, duration = self._probe()
+        f, raw_path = self._map_file(".f32")
+        print(f'[+] Decoding {self.path} ({duration / 60:.0f} min) into a memory map..')
+        subprocess.run([get_encoder_name(), "-y", "-v", "error", "-i", self.path, "-f", "f32le", "-acodec", "pcm_f32le",
+                        "-ar", str(sample_rate), "-ac", str(channels), raw_path], check=True)
+        os.remove(raw_path)
+        self._samples = np.memmap(f, dtype=np.float32, mode='r').reshape(-1, channels)
+        self._sample_rate = sample_rate
+
+    def writable_copy(self):
+        """
+        A private, writable version of the native buffer, for rendering. For a memory-mapped
+        source it's a copy-on-write map: only the pages written to take memory.
+        """
+        samples = self.samples
+        if isinstance(samples, np.memmap):
+            return np.memmap(self._map_files[0], dtype=np.float32, mode='c', shape=samples.shape)
+        return samples.copy()
+
+    @property
+    def samples(self):
+        """Native rate float32 (frames, channels) samples. Shared, don't write to it."""
+        return self._decode()
+
+    @property
+    def sample_rate(self):
+        self._decode()
+        return self._sample_rate
+
+    @property
+    def channels(self):
+        return self.samples.shape[1]
+
+    @property
+    def duration_ms(self):
+        return len(self.samples) * 1000 // self.sample_rate
+
+    def at_rate(self, sample_rate, mono=False):
+        """
+        The audio resampled to ``sample_rate`` (and optionally downmixed), computed once per rate.
+        :return: float32 (frames, channels) array, or (frames,) when mono.
+        """
+        key = (sample_rate, mono)
+        cached = self._resampled.get(key)
+        if cached is not None:
+            return cached
+        samples = self.samples
+        if isinstance(samples, np.memmap):
+            resampled = self._resample_to_memmap(samples, sample_rate, mono)
+        else:
+            if mono:
+                samples = samples.mean(axis=1)
+            if sample_rate != self.sample_rate:
+                import librosa
+                samples = librosa.resample(samples.T, orig_sr=self.sample_rate, target_sr=sample_rate).T
+            resampled = np.ascontiguousarray(samples, dtype=np.float32)
+        with self._lock:
+            return self._resampled.setdefault(key, resampled)
+
+    def _resample_to_memmap(self, samples, sample_rate, mono):
+        """Resamples block by block (see resample_blocks) into a new memory map."""
+        frames = resampled_length(len(samples), self.sample_rate, sample_rate)
+        shape = (frames,) if mono else (frames, samples.shape[1])
+        f, path = self._map_file(".f32")
+        os.remove(path)
+        f.truncate(int(np.prod(shape)) * 4)
+        out = np.memmap(f, dtype=np.float32, mode='r+', shape=shape)
+        resample_blocks(samples, self.sample_rate, sample_rate, mono=mono, out=out)
+        out.flush()
+        return out
+
+    def window(self, start_ms, end_ms, sample_rate=None, mono=False, margin_seconds=1):
+        """
+        A time window of the audio, optionally resampled (and downmixed) on its own, for
+        stages that work window by window and shouldn't resample the whole song up front.
+        The window is resampled with up to a second of context on both sides, trimmed off.
+        :return: float32 (frames, channels) array, or (frames,) when mono.
+        """
+        samples, rate = self.samples, self.sample_rate
+        a = min(len(samples), max(0, int(round(start_ms * rate / 1000))))
+        b = min(len(samples), max(a, int(round(end_ms * rate / 1000))))
+        if sample_rate is None or sample_rate == rate:
+            chunk = np.asarray(samples[a:b], dtype=np.float32)
+            return np.ascontiguousarray(chunk.mean(axis=1) if mono else chunk)
+        import librosa
+        margin = margin_seconds * rate
+        lo, hi = max(0, a - margin), min(len(samples), b + margin)
+        chunk = np.asarray(samples[lo:hi], dtype=np.float32)
+        if mono:
+            chunk = chunk.mean(axis=1)
+        resampled = librosa.resample(chunk.T, orig_sr=rate, target_sr=sample_rate).T
+        ratio = sample_rate / rate
+        skip = int(round((a - lo) * ratio))
+        return np.ascontiguousarray(resampled[skip:skip + int(round((b - a) * ratio))], dtype=np.float32)
+
+    def for_whisper(self):
+        """16kHz mono float32, the array faster-whisper's transcribe() takes instead of a path."""
+        return self.at_rate(WHISPER_SAMPLE_RATE, mono=True)
+
+    @property
+    def content_hash(self):
+        """sha256 of the file bytes (see transcript_cache.file_hash), computed once."""
+        if self._content_hash is None:
+            from transcript_cache import file_hash
+            self._content_hash = file_hash(self.path)
+        return self._content_hash
+
+    def __fspath__(self):
+        return self.path
+
+    def __str__(self):
+        return self.path
+
+    def __repr__(self):
+        return f"AudioSource({self.path})"
+
+
+def resampled_length(frames, orig_sr, target_sr):
+    """Frames of ``frames`` resampled from ``orig_sr`` to ``target_sr``, as librosa.resample returns them."""
+    return int(np.ceil(frames * target_sr / orig_sr))
+
+
+def resample_blocks(samples, orig_sr, target_sr, mono=False, out=None, margin_seconds=1):
+    """
+    Resamples (and optionally downmixes) a long (frames, channels) array block by block, so
+    only one block is ever read into memory besides the output: a memory-mapped input (a
+    long decode, a cached stem) stays mapped. Each block is resampled with a second of context
+    on both sides, which is trimmed off, so block edges don't show.
+    :param out: float32 array to fill (i.e. a memory map), of resampled_length frames; allocated when None.
+    :return: float32 (frames, channels) array, or (frames,) when mono.
+    """
+    ratio = target_sr / orig_sr
+    frames = resampled_length(len(samples), orig_sr, target_sr)
+    if out is None:
+        out = np.zeros((frames,) if mono else (frames, samples.shape[1]), dtype=np.float32)
+    block, margin = RESAMPLE_BLOCK_SECONDS * orig_sr, margin_seconds * orig_sr
+    for start in range(0, len(samples), block):
+        lo, hi = max(0, start - margin), min(len(samples), start + block + margin)
+        chunk = np.asarray(samples[lo:hi], dtype=np.float32)
+        if mono:
+            chunk = chunk.mean(axis=1)
+        if target_sr != orig_sr:
+            import librosa
+            chunk = librosa.resample(chunk.T, orig_sr=orig_sr, target_sr=target_sr).T
+        # The last block runs to the end of the output, whichever way its length rounded
+        last = start + block >= len(samples)
+        out_start, out_end = int(round(start * ratio)), frames if last else min(frames, int(round((start + block) * ratio)))
+        skip = int(round((start - lo) * ratio))
+        piece = chunk[skip:skip + out_end - out_start]
+        out[out_start:out_start + len(piece)] = piece
+    return out
+
+
+def as_audio_source(audio):
+    """Wraps a path in an AudioSource, passes an AudioSource through."""
+    return audio if isinstance(audio, AudioSource) else AudioSource(audio)
@@ -2,68 +2,325 @@
 """
 batch_runner.py
 
-Split an input audio into N chunks, run async_censormy.py sequentially on each chunk,
-then merge the processed chunk outputs into a single output file.
+Split an input audio into N overlapping chunks (cut at quiet points), run async_censormy.py
+on each chunk (sequentially, or --workers at a time), then merge the processed chunk outputs
+into a single output file, crossfading at seams placed so no censored word is cut in two.
 
 Usage example:
   python batch_runner.py songxxx.mp3 bad_words.txt slurs.txt --method sb --output songxCENS.mp3 --chunks 2
+  python batch_runner.py songxxx.mp3 bad_words.txt slurs.txt --method sb --output songxCENS.mp3 --chunks 8 --workers 4
 """
 import argparse
+import json
 import os
 import sys
 import subprocess
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+import numpy as np
 from pydub import AudioSegment
 import gc
+from render_engine import segment_to_array, array_to_segment
+from workspace import Workspace
 
 
-def split_audio(input_path, chunks, tmp_dir):
-    audio = AudioSegment.from_file(input_path)
+def ms_to_frame(ms, frame_rate):
+    """The one ms -> sample index conversion used for both cutting and merging, so seams line up exactly."""
+    return int(ms) * frame_rate // 1000
+
+
+def export_chunk(audio, chunk, chunk_path):
+    """Writes the chunk's samples (overlap included) as lossless WAV, bit-exact with the decoded input."""
+    audio.get_sample_slice(ms_to_frame(chunk.start_ms, audio.frame_rate), ms_to_frame(chunk.end_ms, audio.frame_rate)).export(chunk_path, format="wav")
+    return chunk_path
+
+
+def merge_intervals(intervals):
+    """Sorts (start_ms, end_ms) intervals and merges overlapping ones (same as async_toolset, without its imports)."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class Chunk:
+    """
+    One chunk of the input. The chunk owns [cut_before, cut_after) of the song and is
+    processed with ``overlap_ms`` of context on each side, [start_ms, end_ms).
+    """
+
+    def __init__(self, index, start_ms, end_ms, cut_before, cut_after):
+        self.index = index
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.cut_before = cut_before
+        self.cut_after = cut_after
+
+    def __repr__(self):
+        return f"Chunk({self.index}, {self.start_ms}-{self.end_ms} ms, owns {self.cut_before}-{self.cut_after} ms)"
+
+
+def frame_energy(audio, frame_ms=20):
+    """RMS of every ``frame_ms`` frame of the (downmixed) audio, one value per frame."""
+    samples = segment_to_array(audio).mean(axis=1)
+    frame = max(1, int(audio.frame_rate * frame_ms / 1000))
+    frames = len(samples) // frame
+    if frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.sqrt(np.mean(samples[:frames * frame].reshape(frames, frame) ** 2, axis=1))
+
+
+def plan_chunks(audio, chunks, overlap_ms=2000, search_ms=3000, frame_ms=20):
+    """
+    Splits the song into ``chunks`` chunks, cutting at the quietest frame within ``search_ms``
+    of each even split point (a pause between words rather than the middle of one), with
+    ``overlap_ms`` of extra context on each side of every cut so a word at a boundary is
+    transcribed whole by at least one chunk.
+    """
     duration_ms = len(audio)
-    chunk_duration = int(duration_ms / chunks)
-    chunk_paths = []
-    base = os.path.splitext(os.path.basename(input_path))[0]
-    # preserve original extension (wav/mp3/other)
-    ext = os.path.splitext(input_path)[1].lower().lstrip('.')
-    if not ext:
-        ext = 'mp3'
-    for i in range(chunks):
-        start = i * chunk_duration
-        end = (i + 1) * chunk_duration if i < chunks - 1 else duration_ms
-        chunk = audio[start:end]
-        chunk_path = os.path.join(tmp_dir, f"{base}_chunk_{i}.{ext}")
-        if ext == 'mp3':
-            chunk.export(chunk_path, format=ext, bitrate='320k')
+    energy = frame_energy(audio, frame_ms)
+    cuts = [0]
+    for i in range(1, chunks):
+        nominal = i * duration_ms // chunks
+        lo = max(cuts[-1] + frame_ms, nominal - search_ms) // frame_ms
+        hi = min(duration_ms - frame_ms, nominal + search_ms) // frame_ms
+        if hi <= lo or hi > len(energy):
+            cuts.append(nominal)
+            continue
+        # Middle of the quietest frame
+        cuts.append(int(lo + np.argmin(energy[lo:hi])) * frame_ms + frame_ms // 2)
+    cuts.append(duration_ms)
+    return [Chunk(i, max(0, cuts[i] - overlap_ms), min(duration_ms, cuts[i + 1] + overlap_ms), cuts[i], cuts[i + 1])
+            for i in range(chunks)]
+
+
+def choose_seam(cut_ms, window, prev_detections, next_detections, margin_ms):
+    """
+    Picks where the merged output switches from the previous chunk to the next one.
+
+    Inside the overlap both chunks rendered the same audio, but either may have missed a
+    word the other caught. The seam is placed so that every detection in the overlap is
+    taken whole from a chunk that censored it (or straddles the seam only if both did),
+    preferring the low-energy cut point among the seams that leak nothing.
+    :param window: (start_ms, end_ms) of the overlap, global time.
+    :param margin_ms: half the crossfade, the seam keeps that far from detections and window edges.
+    """
+    lo, hi = window[0] + margin_ms, window[1] - margin_ms
+    if lo > hi:
+        return cut_ms
+    in_window = [(s, e) for s, e in prev_detections + next_detections if e > window[0] and s < window[1]]
+    union = merge_intervals(in_window)
+
+    def detected_by(detections, interval):
+        return any(s < interval[1] and e > interval[0] for s, e in detections)
+
+    def leaks(seam):
+        count = 0
+        for interval in union:
+            if interval[1] <= seam - margin_ms:
+                covered = detected_by(prev_detections, interval)
+            elif interval[0] >= seam + margin_ms:
+                covered = detected_by(next_detections, interval)
+            else:
+                covered = detected_by(prev_detections, interval) and detected_by(next_detections, interval)
+            count += not covered
+        return count
+
+    candidates = {min(hi, max(lo, cut_ms))}
+    for s, e in union:
+        candidates.update(c for c in (s - margin_ms, e + margin_ms) if lo <= c <= hi)
+    return min(candidates, key=lambda seam: (leaks(seam), abs(seam - cut_ms)))
+
+
+class OrderedMerger:
+    """
+    Merges chunk outputs that finish in any order.
+
+    ``add`` can be called as soon as a chunk is done; a chunk is decoded and appended only
+    once every chunk before it has been added, so merging progresses while later chunks
+    still run and the result is always in chunk order. Consecutive chunks overlap: the
+    seam is chosen from both chunks' detections (see choose_seam) and crossfaded, and the
+    detections are deduplicated into ``detections``.
+
+    Chunk outputs are WAV and merged as float32 samples, positioned with the same
+    ms -> sample conversion used to cut them, so seams are sample-accurate (no encoder
+    padding to drift on) and the result is encoded exactly once by ``export``.
+    """
+
+    def __init__(self, total, crossfade_ms=30):
+        self.total = total
+        self.crossfade_ms = crossfade_ms
+        self._pending = {}
+        self._next = 0
+        self._parts = []           # finished float32 pieces of the output, in order
+        self._open = None          # samples of the last merged chunk not committed yet
+        self._open_start = 0       # global sample index of self._open[0]
+        self.frame_rate = None
+        self._prev = None          # (Chunk, global detections) of the last merged chunk
+        self.detections = []
+
+    def add(self, chunk, path, detections=()):
+        """
+        :param detections: (start_ms, end_ms) the chunk censored, relative to the chunk.
+        """
+        self._pending[chunk.index] = (chunk, path, [(s + chunk.start_ms, e + chunk.start_ms) for s, e in detections])
+        while self._next in self._pending:
+            self._append(*self._pending.pop(self._next))
+            print(f"[=] Merged chunk {self._next + 1}/{self.total}")
+            self._next += 1
+
+    def _append(self, chunk, path, detections):
+        segment = AudioSegment.from_wav(path)
+        samples = segment_to_array(segment)
+        if self._prev is None:
+            self.frame_rate = segment.frame_rate
+            self._open, self._open_start = samples, ms_to_frame(chunk.start_ms, self.frame_rate)
+            self.detections = list(detections)
+            self._prev = (chunk, detections)
+            return
+        prev_chunk, prev_detections = self._prev
+        half = min(self.crossfade_ms // 2, (prev_chunk.end_ms - chunk.start_ms) // 2)
+        seam = choose_seam(chunk.cut_before, (chunk.start_ms, prev_chunk.end_ms), prev_detections, detections, half)
+        if seam != chunk.cut_before:
+            print(f"[=] Seam {chunk.index} moved from {chunk.cut_before} ms to {seam} ms to keep a censored word whole")
+
+        # 1. Commit the previous chunk up to the crossfade
+        fade_from = ms_to_frame(seam - half, self.frame_rate)
+        fade_to = ms_to_frame(seam + half, self.frame_rate)
+        self._parts.append(self._open[:fade_from - self._open_start])
+
+        # 2. Equal-gain crossfade of both renders of the overlap
+        chunk_start = ms_to_frame(chunk.start_ms, self.frame_rate)
+        outgoing = self._open[fade_from - self._open_start:fade_to - self._open_start]
+        incoming = samples[fade_from - chunk_start:fade_to - chunk_start]
+        frames = min(len(outgoing), len(incoming))
+        if frames:
+            ramp = np.linspace(0.0, 1.0, frames, dtype=np.float32)[:, None]
+            self._parts.append(outgoing[:frames] * (1.0 - ramp) + incoming[:frames] * ramp)
+
+        # 3. The rest of this chunk stays open until the next seam is known
+        self._open, self._open_start = samples[fade_from - chunk_start + frames:], fade_from + frames
+        # Detections left of the seam come from the previous chunk, right of it from this one
+        self.detections = merge_intervals([d for d in self.detections if d[0] < seam] + [d for d in detections if d[1] > seam])
+        self._prev = (chunk, detections)
+
+    @property
+    def complete(self):
+        return self._next == self.total
+
+    def export(self, out_path):
+        if not self.complete:
+            raise ValueError(f"Only {self._next} of {self.total} chunk outputs merged")
+        print(f"[=] {len(self.detections)} censored intervals after merging overlaps")
+        merged = array_to_segment(np.concatenate(self._parts + [self._open]), self.frame_rate)
+        # export matching requested output extension, the only lossy encode of the whole run
+        out_ext = os.path.splitext(out_path)[1].lower().lstrip('.')
+        if not out_ext:
+            out_ext = 'mp3'
+        if out_ext == 'mp3':
+            merged.export(out_path, format=out_ext, bitrate='320k')
         else:
-            chunk.export(chunk_path, format=ext)
-        chunk_paths.append(chunk_path)
-    return chunk_paths
-
-
-def merge_audios(paths, out_path):
-    if not paths:
-        raise ValueError("No chunk outputs to merge")
-    out = AudioSegment.empty()
-    for p in paths:
-        seg = AudioSegment.from_file(p)
-        out += seg
-    # export matching requested output extension
-    out_ext = os.path.splitext(out_path)[1].lower().lstrip('.')
-    if not out_ext:
-        out_ext = 'mp3'
-    if out_ext == 'mp3':
-        out.export(out_path, format=out_ext, bitrate='320k')
-    else:
-        out.export(out_path, format=out_ext)
-
-
-def run_chunk_processor(python_exe, runner_script, chunk_path, bad_words, slurs, method, out_chunk_path):
+            merged.export(out_path, format=out_ext)
+
+
+def read_detections(path):
+    """Intervals a chunk run wrote with --detections-out, [] if it didn't write any."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [tuple(interval) for interval in json.load(f)['intervals']]
+    except (OSError, ValueError, KeyError):
+        return []
+
+
+def run_chunk_processor(python_exe, runner_script, chunk_path, bad_words, slurs, method, out_chunk_path, job_id=None, cwd=None, env=None, detections_out=None):
     cmd = [python_exe, runner_script, chunk_path, bad_words, slurs, "--method", method, "--output", out_chunk_path]
+    if job_id:
+        cmd += ["--job-id", job_id]
+    if detections_out:
+        cmd += ["--detections-out", detections_out]
     print(f"Running: {' '.join(cmd)}")
-    res = subprocess.run(cmd)
+    res = subprocess.run(cmd, cwd=cwd, env=env)
     return res.returncode
 
 
+def default_gpu_slots():
+    """Chunks that fit on the GPU at once, each running separation and transcription with its own Whisper model. None without a GPU."""
+    from stage_scheduler import gpu_scheduler
+    from model_pool import whisper_weights_mb
+    return gpu_scheduler.job_slots("separate", "transcribe", resident_mb=whisper_weights_mb())
+
+
+def gpu_share_env(gpu_slots):
+    """
+    Environment for a chunk process: with several chunks on one GPU, each one's stage scheduler
+    only budgets for its share of the device memory.
+    """
+    from stage_scheduler import gpu_scheduler
+    env = dict(os.environ)
+    if gpu_slots and gpu_slots > 1 and gpu_scheduler.device_memory_mb:
+        env["CENSOR_GPU_MEMORY_MB"] = str(gpu_scheduler.device_memory_mb // gpu_slots)
+    return env
+
+
+def run_chunks(args, workspace, workers, gpu_slots, cpu_slots):
+    """
+    Processes the chunks ``workers`` at a time, each in its own work dir, merging outputs in order as they finish.
+
+    Every chunk is two steps, each gated by the resource it uses:
+      1. cut and encode the chunk, overlap included (a CPU slot)
+      2. censor it in a child process (a GPU slot, the child loads Spleeter and Whisper)
+    :return: OrderedMerger holding every chunk output.
+    """
+    # Decoded once; chunks and chunk outputs stay lossless WAV until the final encode
+    audio = AudioSegment.from_file(args.input)
+    plan = plan_chunks(audio, max(1, args.chunks), overlap_ms=args.overlap_ms, search_ms=args.cut_search_ms)
+    gpu = threading.BoundedSemaphore(gpu_slots) if gpu_slots else nullcontext()
+    cpu = threading.BoundedSemaphore(cpu_slots) if cpu_slots else nullcontext()
+    env = gpu_share_env(gpu_slots)
+    python_exe = sys.executable
+    runner_script = os.path.abspath(args.runner)
+    # Children run in their own work dirs, so every path handed to them has to be absolute
+    bad_words, slurs = os.path.abspath(args.bad_words), os.path.abspath(args.slurs)
+
+    def process_chunk(chunk):
+        chunk_dir = workspace.subdir(f"chunk_{chunk.index}")
+        chunk_path = os.path.join(chunk_dir, f"chunk_{chunk.index}.wav")
+        out_chunk = os.path.join(chunk_dir, f"chunk_{chunk.index}_out.wav")
+        detections_path = os.path.join(chunk_dir, "detections.json")
+        with cpu:
+            export_chunk(audio, chunk, chunk_path)
+        if workers == 1:
+            pre_chunk_cleanup()
+        with gpu:
+            rc = run_chunk_processor(python_exe, runner_script, chunk_path, bad_words, slurs, args.method, out_chunk,
+                                     job_id=f"{workspace.job_id}-{chunk.index}", cwd=chunk_dir, env=env,
+                                     detections_out=detections_path)
+        return rc, out_chunk, read_detections(detections_path)
+
+    print(f"[+] Processing {len(plan)} chunks with {workers} workers (GPU slots: {gpu_slots or 'unlimited'}, CPU slots: {cpu_slots or 'unlimited'})")
+    for chunk in plan:
+        print(f"[=] {chunk}")
+    merger = OrderedMerger(len(plan), crossfade_ms=args.crossfade_ms)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chunk")
+    try:
+        futures = {executor.submit(process_chunk, chunk): chunk for chunk in plan}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            rc, out_chunk, detections = future.result()
+            if rc != 0:
+                print(f"Chunk {chunk.index} processing failed (rc={rc}). Aborting.")
+                executor.shutdown(wait=True, cancel_futures=True)
+                sys.exit(rc)
+            merger.add(chunk, out_chunk, detections)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return merger
+
+
 def pre_chunk_cleanup():
     """Attempt to clear TensorFlow session, empty PyTorch CUDA cache, and run garbage collection."""
     print("[pre-cleanup] Clearing frameworks and running GC before next chunk")
@@ -101,44 +358,30 @@ def main():
     parser.add_argument("--output", required=True, help="Final output file path")
     parser.add_argument("--chunks", type=int, default=2, help="Number of chunks to split into (default 2)")
     parser.add_argument("--runner", default="async_censormy.py", help="Path to the runner script (default async_censormy.py)")
+    parser.add_argument("--workers", type=int, default=1, help="Chunks processed at once (default 1, sequential)")
+    parser.add_argument("--gpu-slots", type=int, default=None, help="Chunks allowed on the GPU at once (default: as many as fit in VRAM)")
+    parser.add_argument("--cpu-slots", type=int, default=None, help="Chunks allowed to encode/decode at once (default: CPU count)")
+    parser.add_argument("--overlap-ms", type=int, default=2000, help="Context added on each side of every cut, transcribed by both chunks (default 2000)")
+    parser.add_argument("--cut-search-ms", type=int, default=3000, help="How far from the even split point to look for a quiet cut (default 3000)")
+    parser.add_argument("--crossfade-ms", type=int, default=30, help="Crossfade at chunk seams (default 30)")
     args = parser.parse_args()
 
-    input_path = args.input
-    chunks = max(1, args.chunks)
-    tmp_dir = os.path.join(".", f"_batch_tmp_{int(time.time())}")
-    os.makedirs(tmp_dir, exist_ok=True)
+    # Unique per run (and on tmpfs when available), so two batch runs never share chunk files
+    workspace = Workspace()
 
     try:
-        print(f"Splitting {input_path} into {chunks} chunks in {tmp_dir}")
-        chunk_paths = split_audio(input_path, chunks, tmp_dir)
-
-        out_chunk_paths = []
-        python_exe = sys.executable
-        runner_script = os.path.abspath(args.runner)
-
-        # Use same extension for chunk outputs as the input chunks
-        chunk_ext = os.path.splitext(chunk_paths[0])[1].lower().lstrip('.')
-        for i, cp in enumerate(chunk_paths):
-            out_chunk = os.path.join(tmp_dir, f"chunk_{i}_out.{chunk_ext}")
-            pre_chunk_cleanup()
-            rc = run_chunk_processor(python_exe, runner_script, cp, args.bad_words, args.slurs, args.method, out_chunk)
-            if rc != 0:
-                print(f"Chunk {i} processing failed (rc={rc}). Aborting.")
-                sys.exit(rc)
-            out_chunk_paths.append(out_chunk)
-
+        workers = max(1, args.workers)
+        gpu_slots = args.gpu_slots if args.gpu_slots is not None else (default_gpu_slots() if workers > 1 else None)
+        cpu_slots = args.cpu_slots if args.cpu_slots is not None else os.cpu_count()
+        print(f"Splitting {args.input} into {max(1, args.chunks)} chunks in {workspace.dir}")
+        merger = run_chunks(args, workspace, workers, gpu_slots, cpu_slots)
         print("Merging chunk outputs...")
-        merge_audios(out_chunk_paths, args.output)
+        merger.export(args.output)
         print(f"Final merged output written to {args.output}")
 
     finally:
-        # cleanup temp files
-        try:
-            for f in os.listdir(tmp_dir):
-                os.remove(os.path.join(tmp_dir, f))
-            os.rmdir(tmp_dir)
-        except Exception:
-            pass
+        # cleanup this run's temp files only
+        workspace.cleanup()
 
 
 if __name__ == '__main__':
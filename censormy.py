@@ -1,7 +1,7 @@
 import argparse
 import time
 from toolset import *
-import async_toolset as ats
+from word_list import load_word_list
 
 def main():
     parser = argparse.ArgumentParser(description="Kudsha's Sound System")
@@ -17,18 +17,18 @@ def main():
         help="Censorship method: 'v' for vocal separation, 'b' for backspin, 'vb' for combination of both, 'p' for down-pitch, 'sv' for slur + vocal or 'ts'/'tape_stop' for tape stop / vinyl break.",
     )
     parser.add_argument("--output", default="censored_output.mp3", help="Output file path.")
+    parser.add_argument("--low-memory", action="store_true", help="Unload Spleeter after separating instead of keeping it resident.")
     args = parser.parse_args()
 
     # Time now for execution benchmarking
     start = time.time()
 
     # Read bad words from file
-    with open(args.bad_words_file, "r") as f:
-        bad_words = [line.strip().lower() for line in f]
+    bad_words = load_word_list(args.bad_words_file)
 
     if args.method == "v":
         print("Using vocal separation method...")
-        separate_audio(args.audio_file)
+        separate_audio(args.audio_file, low_memory=args.low_memory)
         censor_with_instrumentals(args.audio_file, bad_words, args.output)
 
     elif args.method == "b":
@@ -41,20 +41,19 @@ def main():
 
     elif args.method == "vb":
         print("Using vocal + backspin method...")
-        separate_audio(args.audio_file)
+        separate_audio(args.audio_file, low_memory=args.low_memory)
         censor_with_both(args.audio_file, bad_words, args.output)
     
     elif args.method == "p":
         print("Using vocal downpitch method...")
-        separate_audio(args.audio_file)
+        separate_audio(args.audio_file, low_memory=args.low_memory)
         censor_with_downpitch(args.audio_file, bad_words, args.output)
     
     elif args.method == "sv":
         print("Using slur + vocal method...")
         # Read slurs from file
-        with open(args.slurs_file, "r") as f:
-            slurs = [line.strip().lower() for line in f]
-        separate_audio(args.audio_file)
+        slurs = load_word_list(args.slurs_file)
+        separate_audio(args.audio_file, low_memory=args.low_memory)
         censor_with_instrumentals_and_downpitch(args.audio_file, bad_words, slurs, args.output)
     
     # End time
@@ -2,28 +2,43 @@ import gradio as gr
 import asyncio
 import os
 import time
-import tempfile
 from async_toolset import (
-    separate_audio,
-    censor_with_instrumentals,
-    censor_with_backspin,
-    censor_with_tape_stop,
-    censor_with_both,
-    censor_with_downpitch,
-    censor_with_instrumentals_and_downpitch,
-    censor_with_both_and_downpitch,
     cleanup,
-    run_in_thread
+    WHISPER_MODEL_SIZE,
+    WHISPER_DEVICE,
+    WHISPER_COMPUTE_TYPE,
+    SCREEN_MODEL_SIZE
 )
+from model_pool import whisper_pool
+from pipeline import PipelineCoordinator, METHOD_PLANS
+from word_list import load_word_list, word_list_from_bytes
+from separator_service import get_separator_service
+from workspace import Workspace, prune_dirs
+from audio_source import AudioSource
+
+# Opt-in: load Spleeter per request and unload it afterwards instead of keeping it resident
+LOW_MEMORY = os.environ.get("CENSOR_LOW_MEMORY", "0") == "1"
+# Separate only around the detected words instead of the whole song
+TARGETED_SEPARATION = os.environ.get("CENSOR_TARGETED_SEPARATION", "0") == "1"
+# Small-model screen + main-model confirmation instead of one full main-model pass
+CASCADE = os.environ.get("CENSOR_CASCADE", "0") == "1"
+# Transcribe the VAD-gated vocals stem (the mix when nothing is separated) instead of the whole mix
+VAD = os.environ.get("CENSOR_VAD", "0") == "1"
+# Every request writes to outputs/<job_id>/; finished ones are pruned by age and count
+OUTPUT_ROOT = "outputs"
+OUTPUT_KEEP = int(os.environ.get("CENSOR_OUTPUT_KEEP", 20))
+OUTPUT_MAX_AGE_SECONDS = float(os.environ.get("CENSOR_OUTPUT_MAX_AGE_MINUTES", 60)) * 60
+# Jobs whose output dir must not be pruned yet
+_active_jobs = set()
 
 
 
 def load_words_from_file(file_path):
-    """Load words from a file, one word per line."""
-    if not os.path.exists(file_path):
+    """Load words from a file, one word per line. Compiled once and reused until the file changes. None if it's missing."""
+    try:
+        return load_word_list(file_path)
+    except FileNotFoundError:
         return None
-    with open(file_path, "r") as f:
-        return [line.strip().lower() for line in f if line.strip()]
 
 
 async def process_audio(
@@ -63,7 +78,7 @@ async def process_audio(
     else:
         if bad_words_file is None:
             return None, "❌ Error: Please upload a bad words file or use built-in.", "0s"
-        bad_words = [line.strip().lower() for line in bad_words_file.decode('utf-8').strip().split('\n') if line.strip()]
+        bad_words = word_list_from_bytes(bad_words_file)
     
     if not bad_words:
         return None, "❌ Error: No valid bad words found.", "0s"
@@ -78,7 +93,7 @@ async def process_audio(
         else:
             if slurs_file is None:
                 return None, "❌ Error: Please upload a slurs file or use built-in.", "0s"
-            slurs = [line.strip().lower() for line in slurs_file.decode('utf-8').strip().split('\n') if line.strip()]
+            slurs = word_list_from_bytes(slurs_file)
         
         if not slurs:
             return None, "❌ Error: No valid slurs found.", "0s"
@@ -91,68 +106,32 @@ async def process_audio(
             ext = '.mp3'
         output_filename = f"censored_output{ext}"
     
-    # Ensure output directory exists
-    output_dir = "outputs"
+    # Every request gets its own scratch dir and output dir, so concurrent users never clobber each other
+    workspace = Workspace()
+    _active_jobs.add(workspace.job_id)
+    output_dir = os.path.join(OUTPUT_ROOT, workspace.job_id)
     os.makedirs(output_dir, exist_ok=True)
     output_path = os.path.join(output_dir, output_filename)
     
     # Start timing
     start_time = time.time()
+
+    # Decoded once, every stage below shares the buffer
+    audio = AudioSource(audio_file)
     
     try:
-        if method == "v":
-            status = "🎵 Using Vocal Separation method..."
-            task1 = asyncio.create_task(run_in_thread(separate_audio(audio_file)))
-            task2 = asyncio.create_task(run_in_thread(censor_with_instrumentals(audio_file, bad_words, output_path)))
-            await asyncio.gather(task1, task2)
-        
-        elif method == "Gv":
-            status = "🎵 Using GenAI Vocal Separation method..."
-            task1 = asyncio.create_task(run_in_thread(separate_audio(audio_file)))
-            task2 = asyncio.create_task(run_in_thread(censor_with_instrumentals(audio_file, bad_words, output_path, genai=True)))
-            await asyncio.gather(task1, task2)
-        
-        elif method == "b":
-            status = "🎵 Using Backspin method..."
-            task1 = asyncio.create_task(run_in_thread(separate_audio(audio_file)))
-            task2 = asyncio.create_task(run_in_thread(censor_with_backspin(audio_file, bad_words, output_path)))
-            await asyncio.gather(task1, task2)
-        
-        elif method == "ts":
+        # Each method runs only the stages its plan needs (backspin never separates)
+        plan = METHOD_PLANS.get(method)
+        if plan is None:
+            return None, f"❌ Error: Unknown method '{method}'.", "0s"
+        options = {}
+        if method == "ts":
             status = f"🎵 Using Tape Stop/Vinyl Break method (intensity={ts_intensity:.2f})..."
-            task1 = asyncio.create_task(run_in_thread(separate_audio(audio_file)))
-            task2 = asyncio.create_task(run_in_thread(censor_with_tape_stop(audio_file, bad_words, output_path, sep_task=task1, intensity=ts_intensity)))
-            await asyncio.gather(task1, task2)
-        
-        elif method == "vb":
-            status = "🎵 Using Vocal + Backspin method..."
-            task1 = asyncio.create_task(run_in_thread(separate_audio(audio_file)))
-            task2 = asyncio.create_task(run_in_thread(censor_with_both(audio_file, bad_words, output_path, sep_task=task1)))
-            await asyncio.gather(task1, task2)
-        
-        elif method == "p":
-            status = "🎵 Using Down-Pitch method..."
-            task1 = asyncio.create_task(run_in_thread(separate_audio(audio_file)))
-            task2 = asyncio.create_task(run_in_thread(censor_with_downpitch(audio_file, bad_words, output_path, sep_task=task1)))
-            await asyncio.gather(task1, task2)
-        
-        elif method == "sv":
-            status = "🎵 Using Slur + Vocal method..."
-            task1 = asyncio.create_task(run_in_thread(separate_audio(audio_file)))
-            task2 = asyncio.create_task(run_in_thread(censor_with_instrumentals_and_downpitch(audio_file, bad_words, slurs, output_path, sep_task=task1)))
-            await asyncio.gather(task1, task2)
-        
-        elif method == "sb":
-            status = "🎵 Using Slur + Vocal + Backspin method..."
-            task1 = asyncio.create_task(run_in_thread(separate_audio(audio_file)))
-            task2 = asyncio.create_task(run_in_thread(censor_with_both_and_downpitch(audio_file, bad_words, slurs, output_path, sep_task=task1)))
-            await asyncio.gather(task1, task2)
-        
+            options['intensity'] = ts_intensity
         else:
-            return None, f"❌ Error: Unknown method '{method}'.", "0s"
-        
-        # Cleanup temporary files
-        await cleanup()
+            status = f"🎵 Using {plan.label[0].upper() + plan.label[1:]} method..."
+        pipeline = PipelineCoordinator(audio, low_memory=LOW_MEMORY, workspace=workspace, targeted=TARGETED_SEPARATION, cascade=CASCADE, vad=VAD)
+        await pipeline.execute(plan, bad_words, output_path, slurs=slurs if plan.slurs else None, **options)
         
         # Calculate processing time
         end_time = time.time()
@@ -169,6 +148,14 @@ async def process_audio(
         processing_time = f"{end_time - start_time:.2f}s"
         return None, f"❌ Error during processing: {str(e)}", processing_time
 
+    finally:
+        # Cleanup this request's temporary files
+        await cleanup(workspace)
+        # Gradio copies a returned file into its own cache before serving it, so outputs of finished
+        # requests can go; this one is only handed over once we return, so it waits for the next request
+        _active_jobs.discard(workspace.job_id)
+        prune_dirs(OUTPUT_ROOT, keep=OUTPUT_KEEP, max_age_s=OUTPUT_MAX_AGE_SECONDS, exclude=_active_jobs | {workspace.job_id})
+
 
 def create_ui():
     """Create the Gradio UI for the audio censoring application."""
@@ -374,6 +361,15 @@ def create_ui():
 
 
 if __name__ == "__main__":
+    # Load Whisper once for the whole server, every request borrows it from the pool
+    whisper_pool.warm_up(WHISPER_MODEL_SIZE, WHISPER_DEVICE, WHISPER_COMPUTE_TYPE)
+    if CASCADE:
+        # The screen model stays resident next to the main one
+        whisper_pool.ensure_capacity(len({SCREEN_MODEL_SIZE, WHISPER_MODEL_SIZE}))
+        whisper_pool.warm_up(SCREEN_MODEL_SIZE, WHISPER_DEVICE, WHISPER_COMPUTE_TYPE)
+    whisper_pool.start_reaper()
+    if not LOW_MEMORY:
+        get_separator_service().warm()
     app = create_ui()
     app.launch(
         server_name="0.0.0.0",
@@ -0,0 +1,403 @@
+import argparse
+import contextlib
+import os
+import socket
+import sys
+import threading
+import time
+import numpy as np
+from async_toolset import match_transcript, merge_intervals, transcribe_samples, render_backspin, render_tape_stop, render_instrumentals
+from audio_source import WHISPER_SAMPLE_RATE
+from render_engine import CensorRenderer
+from separator_service import get_separator_service, Stems, SEPARATOR_SAMPLE_RATE
+from word_list import load_word_list
+from workspace import job_tag, new_job_id
+
+# method -> (render function, needs stems)
+LIVE_METHODS = {
+    'b': (render_backspin, False),
+    'ts': (render_tape_stop, False),
+    'v': (render_instrumentals, True),
+}
+
+
+def resample(samples, orig_sr, target_sr):
+    if orig_sr == target_sr:
+        return np.ascontiguousarray(samples, dtype=np.float32)
+    import librosa
+    return np.ascontiguousarray(librosa.resample(samples.T, orig_sr=orig_sr, target_sr=target_sr).T, dtype=np.float32)
+
+
+def open_stream(address, mode):
+    """
+    Binary stream for a PCM address: '-' (stdin/stdout), 'tcp://host:port' or 'unix:///path'
+    (a local socket, connected to), or a file path.
+    """
+    if address == "-":
+        return sys.stdin.buffer if mode == "rb" else sys.stdout.buffer
+    if address.startswith("tcp://"):
+        host, port = address[len("tcp://"):].rsplit(":", 1)
+        return socket.create_connection((host, int(port))).makefile(mode)
+    if address.startswith("unix://"):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address[len("unix://"):])
+        return sock.makefile(mode)
+    return open(address, mode)
+
+
+class RingBuffer:
+    """
+    Fixed-size float32 (frames, channels) ring addressed by absolute frame numbers.
+
+    The producer blocks in ``write`` while the ring is full, i.e. until the consumer
+    ``release``s frames it has sent on: that's the backpressure that pushes a slow output
+    back to the input pipe/socket instead of growing memory.
+    """
+
+    def __init__(self, frames, channels):
+        self.data = np.zeros((frames, channels), dtype=np.float32)
+        self.capacity = frames
+        self.written = 0    # frames ever written (write head)
+        self.released = 0   # frames the consumer is done with
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def write(self, block):
+        """Appends a block, blocking while there is no room. :return: seconds spent waiting for room."""
+        waited = time.time()
+        with self._cond:
+            while self.written + len(block) - self.released > self.capacity:
+                self._cond.wait()
+            waited = time.time() - waited
+            self._copy_in(self.written, block)
+            self.written += len(block)
+            self._cond.notify_all()
+        return waited
+
+    def _copy_in(self, start, block):
+        i = start % self.capacity
+        head = min(len(block), self.capacity - i)
+        self.data[i:i + head] = block[:head]
+        self.data[:len(block) - head] = block[head:]
+
+    def read(self, start, end):
+        """Copy of frames [start, end). They must still be in the ring."""
+        with self._cond:
+            if start < self.written - self.capacity or end > self.written:
+                raise ValueError(f"Frames {start}-{end} are not in the ring ({self.written - self.capacity}-{self.written})")
+            i = start % self.capacity
+            head = min(end - start, self.capacity - i)
+            return np.concatenate([self.data[i:i + head], self.data[:end - start - head]])
+
+    def write_back(self, start, block):
+        """Overwrites frames already in the ring, i.e. with their censored version."""
+        with self._cond:
+            self._copy_in(start, block)
+
+    def release(self, upto):
+        with self._cond:
+            self.released = max(self.released, upto)
+            self._cond.notify_all()
+
+    def wait_for(self, frames, timeout=None):
+        """Waits until ``frames`` frames were written or the input ended. :return: frames written."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.written >= frames or self.closed, timeout)
+            return self.written
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    @property
+    def fill(self):
+        return (self.written - self.released) / self.capacity
+
+
+class LiveMetrics:
+    """Counters of a live run, reported periodically on the log (never on the PCM output)."""
+
+    def __init__(self):
+        self.windows = 0
+        self.output_stalled_seconds = 0.0  # time the output waited for transcription to catch up
+        self.transcribe_seconds = 0.0  # last transcription time
+        self.transcribe_max = 0.0
+        self.detection_lag_max = 0.0   # audio seconds between a word ending and it being detected
+        self.censored = 0
+        self.late = 0                  # intervals whose start had already gone out
+        self.missed = 0                # intervals detected after they had entirely gone out
+        self.latency = 0.0             # input to output delay at the last write
+        self.ring_fill_max = 0.0
+        self.input_blocked_seconds = 0.0
+
+    def report(self):
+        return (f"latency {self.latency:.2f}s, transcription {self.transcribe_seconds:.2f}s (max {self.transcribe_max:.2f}s), "
+                f"detection lag max {self.detection_lag_max:.2f}s, windows {self.windows}, output stalled {self.output_stalled_seconds:.1f}s, "
+                f"censored {self.censored} ({self.late} late, {self.missed} missed), ring fill max {self.ring_fill_max:.0%}, "
+                f"input blocked {self.input_blocked_seconds:.1f}s")
+
+
+class LiveCensor:
+    """
+    Censors a live PCM feed with a fixed broadcast delay (the radio "dump button").
+
+    Three threads share a ring buffer of the last ``delay_s`` seconds plus a transcription
+    window: the reader appends incoming PCM, the transcriber re-transcribes the newest
+    ``window_s`` seconds every ``hop_s`` seconds and queues the matched intervals, and the
+    emitter writes out every frame ``delay_s`` seconds after it came in, rendering queued
+    intervals in place just before they are due. Overlapping windows see every word more
+    than once; detections are merged and only the part not yet rendered is added.
+
+    Audio never goes out untranscribed. While transcription keeps up, the delay is constant.
+    When it falls behind, the next pass covers all the audio since the last one, and the
+    output waits for it. The stall shows in the latency metrics, and the ring fills up,
+    which blocks the reader and pushes back on the input pipe or socket. A slow output
+    pushes back the same way. If transcription fails, the output stops at the last
+    transcribed frame and ``run()`` raises the error.
+    """
+
+    def __init__(self, bad_words, method='b', sample_rate=44100, channels=2, delay_s=7.0, window_s=6.0,
+                 hop_s=2.0, guard_s=1.0, block_s=0.1, report_s=30.0, job_id=None):
+        """
+        :param method: A key of LIVE_METHODS.
+        :param window_s: Audio transcribed per pass, capped at the delay (older audio has gone out).
+        :param guard_s: How far ahead of the output queued intervals are rendered.
+        :param block_s: Output (and input read) granularity.
+        :param report_s: Audio seconds between metrics lines.
+        """
+        self.bad_words = bad_words
+        self.render, self.needs_stems = LIVE_METHODS[method]
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.delay_frames = int(delay_s * sample_rate)
+        self.window_frames = int(min(window_s, delay_s) * sample_rate)
+        self.hop_frames = int(hop_s * sample_rate)
+        self.guard_frames = int(guard_s * sample_rate)
+        self.block_frames = max(1, int(block_s * sample_rate))
+        self.report_frames = int(report_s * sample_rate)
+        self.job_id = job_id or new_job_id()
+        # Room for the delay, one transcription window and what the output waits for before it goes out
+        self.ring = RingBuffer(self.delay_frames + self.window_frames + self.hop_frames + self.guard_frames + 2 * self.block_frames, channels)
+        self.metrics = LiveMetrics()
+        self._pending = []       # detected (start_frame, end_frame) not rendered yet
+        self._separations = {}   # pending interval -> (first frame separated, Future of its Stems)
+        self._rendered_until = 0
+        self._emitted = 0
+        self._lock = threading.Lock()
+        self._transcribed = 0    # frames covered by a finished transcription pass
+        self._transcribed_cond = threading.Condition()
+        self._transcribed_to_end = threading.Event()
+        self._transcriber_failed = threading.Event()  # not the end of the input: nothing past _transcribed may go out
+        self._errors = []
+
+    def _ms_to_frame(self, ms):
+        return int(round(ms * self.sample_rate / 1000))
+
+    # 1. READER
+    def _read(self, source):
+        frame_bytes = 2 * self.channels
+        pending = b""
+        try:
+            while True:
+                data = source.read(self.block_frames * frame_bytes)
+                if not data:
+                    break
+                data = pending + data
+                usable = len(data) - len(data) % frame_bytes
+                pending = data[usable:]
+                if usable:
+                    block = np.frombuffer(data[:usable], dtype=np.int16).reshape(-1, self.channels).astype(np.float32) / 32768
+                    self.metrics.input_blocked_seconds += self.ring.write(block)
+        except BaseException as e:
+            self._errors.append(e)
+        finally:
+            self.ring.close()
+
+    # 2. TRANSCRIBER
+    def _transcribe(self):
+        last = 0
+        try:
+            while True:
+                written = self.ring.wait_for(last + self.hop_frames)
+                final = self.ring.closed
+                if written == last:
+                    break
+                # Overlaps the previous pass by window - hop; longer when behind, no audio is ever skipped
+                start = max(0, min(written - self.window_frames, last - self.window_frames + self.hop_frames), self._emitted)
+                samples = resample(self.ring.read(start, written).mean(axis=1), self.sample_rate, WHISPER_SAMPLE_RATE)
+
+                began = time.time()
+                words = transcribe_samples(samples, offset_s=start / self.sample_rate)
+                self.metrics.transcribe_seconds = time.time() - began
+                self.metrics.transcribe_max = max(self.metrics.transcribe_max, self.metrics.transcribe_seconds)
+                self.metrics.windows += 1
+
+                self._queue(match_transcript(words, self.bad_words)['bad_words'], self.ring.written)
+                last = written
+                with self._transcribed_cond:
+                    self._transcribed = written
+                    self._transcribed_cond.notify_all()
+                if final:
+                    break
+        except BaseException as e:
+            print(f'[-] Transcription failed, the output stops at {self._transcribed / self.sample_rate:.1f}s{job_tag(self.job_id)}')
+            self._errors.append(e)
+            self._transcriber_failed.set()
+            self.ring.close()  # wakes the emitter
+        finally:
+            self._transcribed_to_end.set()
+            with self._transcribed_cond:
+                self._transcribed_cond.notify_all()
+
+    def _queue(self, intervals, written):
+        with self._lock:
+            for start_ms, end_ms in intervals:
+                a, b = self._ms_to_frame(start_ms), min(written, self._ms_to_frame(end_ms))
+                if b <= self._emitted:
+                    self.metrics.missed += 1
+                    print(f'[-] Missed {start_ms} ms to {end_ms} ms, it was out before it was detected{job_tag(self.job_id)}')
+                    continue
+                # Only what an earlier window hasn't rendered already
+                a = max(a, self._rendered_until)
+                if b > a:
+                    self.metrics.detection_lag_max = max(self.metrics.detection_lag_max, (written - b) / self.sample_rate)
+                    self._pending = merge_intervals(self._pending + [(a, b)])
+            if self.needs_stems:
+                # Separation starts as soon as an interval is known, not when it's due, so Spleeter
+                # runs in the delay instead of stalling the output. A merged interval is separated anew
+                for interval in self._pending:
+                    if interval not in self._separations:
+                        self._separations[interval] = self._separate(*interval)
+                for interval in list(self._separations):
+                    if interval not in self._pending:
+                        self._separations.pop(interval)[1].cancel()
+
+    # 3. EMITTER
+    def _render_due(self, horizon):
+        with self._lock:
+            due = [(iv, self._separations.pop(iv, None)) for iv in self._pending if iv[0] < horizon]
+            self._pending = [iv for iv in self._pending if iv[0] >= horizon]
+        for (a, b), separation in due:
+            if a < self._emitted:
+                self.metrics.late += 1
+                a = self._emitted
+            if b <= a:
+                continue
+            renderer = CensorRenderer(self.ring.read(a, b), self._stems(a, b, separation) if self.needs_stems else None, sample_rate=self.sample_rate)
+            self.render(renderer, [(0, (b - a) * 1000 // self.sample_rate)])
+            self.ring.write_back(a, renderer.out)
+            self.metrics.censored += 1
+            with self._lock:
+                self._rendered_until = max(self._rendered_until, b)
+
+    def _separate(self, a, b):
+        """
+        Queues the separation of frames [a, b), with up to a second of context that's still in the ring.
+        Live windows never repeat, so they skip the stem cache.
+        :return: (first frame separated, Future of its Stems).
+        """
+        lo = max(a - self.sample_rate, self.ring.written - self.ring.capacity, 0)
+        hi = min(b + self.sample_rate, self.ring.written)
+        waveform = resample(self.ring.read(lo, hi), self.sample_rate, SEPARATOR_SAMPLE_RATE)
+        return lo, get_separator_service().submit_waveform(waveform, job_id=self.job_id, cache=False)
+
+    def _stems(self, a, b, separation):
+        """Stems of frames [a, b), from the separation queued when the interval was detected."""
+        lo, future = separation or self._separate(a, b)
+        stalled = time.time()
+        stems = future.result()
+        self.metrics.output_stalled_seconds += time.time() - stalled
+        offset = int(round((a - lo) * stems.sample_rate / self.sample_rate))
+        frames = int(round((b - a) * stems.sample_rate / self.sample_rate))
+        return Stems(stems.vocals[offset:offset + frames], stems.accompaniment[offset:offset + frames], stems.sample_rate)
+
+    def _emit(self, sink):
+        next_report = self.report_frames
+        while True:
+            written = self.ring.wait_for(self._emitted + self.block_frames + self.delay_frames)
+            if self.ring.closed:
+                # Input is over: flush the tail once its last window has been transcribed
+                self._transcribed_to_end.wait()
+                end = min(written, self._emitted + self.block_frames)
+            else:
+                end = min(written - self.delay_frames, self._emitted + self.block_frames)
+            if end <= self._emitted:
+                if self.ring.closed:
+                    break
+                continue
+            # Nothing goes out before it (and the guard after it) was transcribed
+            stalled = time.time()
+            with self._transcribed_cond:
+                self._transcribed_cond.wait_for(lambda: self._transcribed >= min(end + self.guard_frames, self.ring.written)
+                                                or self._transcribed_to_end.is_set())
+            self.metrics.output_stalled_seconds += time.time() - stalled
+            if self._transcriber_failed.is_set():
+                # Whatever transcription never covered is dropped, not sent out uncensored
+                end = min(end, self._transcribed)
+                if end <= self._emitted:
+                    break
+            self._render_due(end + self.guard_frames)
+            block = self.ring.read(self._emitted, end)
+            sink.write((np.clip(block, -1.0, 1.0) * 32767).astype(np.int16).tobytes())
+            sink.flush()
+            self.metrics.latency = (self.ring.written - self._emitted) / self.sample_rate
+            self.metrics.ring_fill_max = max(self.metrics.ring_fill_max, self.ring.fill)
+            with self._lock:
+                self._emitted = end
+            self.ring.release(end)
+            if end >= next_report:
+                print(f'[=] Live{job_tag(self.job_id)}: {self.metrics.report()}')
+                next_report += self.report_frames
+
+    def run(self, source, sink):
+        """
+        Censors ``source`` into ``sink`` (binary streams of s16le PCM at the configured rate and channels) until the input ends.
+        :return: LiveMetrics.
+        """
+        if self.needs_stems:
+            get_separator_service().warm()
+        print(f'[+] Live censoring with a {self.delay_frames / self.sample_rate:.1f}s delay{job_tag(self.job_id)}..')
+        threads = [threading.Thread(target=self._read, args=(source,), name=f"live-read-{self.job_id}", daemon=True),
+                   threading.Thread(target=self._transcribe, name=f"live-transcribe-{self.job_id}", daemon=True)]
+        for thread in threads:
+            thread.start()
+        try:
+            self._emit(sink)
+        finally:
+            self.ring.close()
+        if self._errors:
+            raise self._errors[0]
+        print(f'[=] Live{job_tag(self.job_id)} done: {self.metrics.report()}')
+        return self.metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kudsha's Sound System Live: censors a raw PCM feed with a fixed delay.")
+    parser.add_argument("bad_words_file", help="Path to the bad words file.")
+    parser.add_argument("--input", default="-", help="s16le PCM in: '-' for stdin, 'tcp://host:port' or 'unix:///path' for a local socket, or a file.")
+    parser.add_argument("--output", default="-", help="s16le PCM out, same forms as --input ('-' for stdout).")
+    parser.add_argument("--method", choices=list(LIVE_METHODS), default="b", help="'b' for backspin, 'ts' for tape stop, 'v' for instrumental.")
+    parser.add_argument("--rate", type=int, default=44100, help="Sample rate of the PCM feed.")
+    parser.add_argument("--channels", type=int, default=2, help="Channels of the PCM feed.")
+    parser.add_argument("--delay", type=float, default=float(os.environ.get("CENSOR_LIVE_DELAY_SECONDS", 7)), help="Broadcast delay in seconds.")
+    parser.add_argument("--window", type=float, default=6.0, help="Seconds transcribed per pass.")
+    parser.add_argument("--hop", type=float, default=2.0, help="Seconds between passes.")
+    parser.add_argument("--job-id", default=None, help="Job id tagging the logs.")
+    args = parser.parse_args()
+
+    # Opened first: '-' is the real stdout, before it's redirected below
+    source, sink = open_stream(args.input, "rb"), open_stream(args.output, "wb")
+    # stdout may be carrying the PCM, everything logged goes to stderr then (word list loading included)
+    with contextlib.redirect_stdout(sys.stderr) if args.output == "-" else contextlib.nullcontext():
+        try:
+            bad_words = load_word_list(args.bad_words_file)
+        except OSError as e:
+            parser.error(f"can't read the bad words file: {e}")
+        live = LiveCensor(bad_words, method=args.method, sample_rate=args.rate, channels=args.channels,
+                          delay_s=args.delay, window_s=args.window, hop_s=args.hop, job_id=args.job_id)
+        live.run(source, sink)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from stage_scheduler import gpu_scheduler
+
+# Device memory (MB) of a model's float16 weights while it's resident; int8 compute types take about half
+WHISPER_WEIGHTS_MB = {"tiny": 80, "base": 150, "small": 500, "medium": 1550, "large": 3100}
+
+
+def whisper_weights_mb(size="medium", device="cuda", compute_type="int8_float16"):
+    """Device memory a resident model holds, 0 off the GPU. Unknown sizes count as "medium"."""
+    if device != "cuda":
+        return 0
+    mb = next((mb for name, mb in WHISPER_WEIGHTS_MB.items() if name in size), WHISPER_WEIGHTS_MB["medium"])
+    return mb // 2 if compute_type.startswith("int8") else mb
+
+
+class WhisperModelPool:
+    """
+    Process-wide registry of loaded faster-whisper models.
+
+    Models are keyed by (size, device, compute_type) and stay resident between
+    songs. Callers borrow a model with ``checkout`` which keeps a reference count,
+    so a model in use is never evicted. Idle models are dropped after
+    ``idle_timeout`` seconds, and the least recently used idle model is dropped
+    when loading a new one would exceed ``max_models``.
+    """
+
+    def __init__(self, max_models=1, idle_timeout=600):
+        self.max_models = max(1, int(max_models))
+        self.idle_timeout = idle_timeout
+        self._entries = {}  # key -> {'model', 'refs', 'last_used'}
+        self._lock = threading.Condition()
+        self._loading = set()
+        self._reaper = None
+
+    @staticmethod
+    def _load(size, device, compute_type):
+        from faster_whisper import WhisperModel
+        print(f'[+] Loading Whisper model "{size}" ({device}, {compute_type})..')
+        return WhisperModel(size, device=device, compute_type=compute_type)
+
+    def _release_memory(self):
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+    def _evict_idle(self, force_room=False):
+        """Drops expired idle models; with force_room also frees a slot for a new one. Lock must be held."""
+        now = time.monotonic()
+        evicted = []
+        for key, entry in list(self._entries.items()):
+            if entry['refs'] == 0 and self.idle_timeout is not None and now - entry['last_used'] >= self.idle_timeout:
+                evicted.append(key)
+                del self._entries[key]
+        if force_room:
+            while len(self._entries) + len(self._loading) >= self.max_models:
+                idle = [(entry['last_used'], key) for key, entry in self._entries.items() if entry['refs'] == 0]
+                if not idle:
+                    break
+                _, key = min(idle)
+                evicted.append(key)
+                del self._entries[key]
+        for key in evicted:
+            print(f'[-] Evicted idle Whisper model {key}')
+        return evicted
+
+    def acquire(self, size="medium", device="cuda", compute_type="int8_float16"):
+        """Returns a loaded model for the key and increments its reference count."""
+        key = (size, device, compute_type)
+        with self._lock:
+            while True:
+                self._evict_idle()
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry['refs'] += 1
+                    entry['last_used'] = time.monotonic()
+                    return entry['model']
+                if key in self._loading:
+                    # Another caller is loading the same model, wait for it instead of loading twice
+                    self._lock.wait()
+                    continue
+                evicted = self._evict_idle(force_room=True)
+                if len(self._entries) + len(self._loading) < self.max_models:
+                    self._loading.add(key)
+                    break
+                # Every resident model is checked out, wait for one to be released
+                self._lock.wait()
+
+        if evicted:
+            self._release_memory()
+        try:
+            model = self._load(size, device, compute_type)
+        except BaseException:
+            with self._lock:
+                self._loading.discard(key)
+                self._lock.notify_all()
+            raise
+
+        with self._lock:
+            self._loading.discard(key)
+            self._entries[key] = {'model': model, 'refs': 1, 'last_used': time.monotonic()}
+            self._lock.notify_all()
+        return model
+
+    def release(self, size="medium", device="cuda", compute_type="int8_float16"):
+        """Decrements the reference count of a model previously returned by ``acquire``."""
+        key = (size, device, compute_type)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry['refs'] = max(0, entry['refs'] - 1)
+            entry['last_used'] = time.monotonic()
+            self._lock.notify_all()
+
+    @contextmanager
+    def checkout(self, size="medium", device="cuda", compute_type="int8_float16"):
+        """
+        Borrows a resident model for the duration of the with-block.
+        :param size: Whisper model size, i.e. "tiny", "small", "medium".
+        :param device: "cuda" or "cpu".
+        :param compute_type: CTranslate2 compute type, i.e. "int8_float16".
+        """
+        model = self.acquire(size, device, compute_type)
+        try:
+            yield model
+        finally:
+            self.release(size, device, compute_type)
+
+    def warm_up(self, size="medium", device="cuda", compute_type="int8_float16"):
+        """Loads a model ahead of the first request so the first song doesn't pay for it."""
+        with self.checkout(size, device, compute_type):
+            pass
+        print(f'[+] Whisper model "{size}" is warm')
+
+    def ensure_capacity(self, models):
+        """
+        Raises ``max_models`` to at least ``models``, for callers that use several models in turn
+        on every song (the cascade's screen and main models), which would otherwise evict and
+        reload each other every time. Never lowers it.
+        """
+        with self._lock:
+            self.max_models = max(self.max_models, int(models))
+            self._lock.notify_all()
+
+    def evict_idle(self):
+        """Drops idle models past their timeout. Safe to call periodically."""
+        with self._lock:
+            evicted = self._evict_idle()
+        if evicted:
+            self._release_memory()
+        return evicted
+
+    def start_reaper(self, interval=60):
+        """Starts a daemon thread that calls ``evict_idle`` every ``interval`` seconds."""
+        if self._reaper is not None:
+            return
+        def _reap():
+            while True:
+                time.sleep(interval)
+                self.evict_idle()
+        self._reaper = threading.Thread(target=_reap, name="whisper-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def clear(self):
+        """Drops every model that isn't currently checked out."""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry['refs'] == 0]:
+                del self._entries[key]
+        self._release_memory()
+
+    def resident(self):
+        """Returns {key: reference_count} for the models currently loaded."""
+        with self._lock:
+            return {key: entry['refs'] for key, entry in self._entries.items()}
+
+    def device_memory_mb(self):
+        """Device memory held by the resident models (and the ones loading), for the stage scheduler's budget."""
+        with self._lock:
+            return sum(whisper_weights_mb(*key) for key in list(self._entries) + list(self._loading))
+
+
+whisper_pool = WhisperModelPool(
+    max_models=int(os.environ.get("CENSOR_WHISPER_MAX_MODELS", 1)),
+    idle_timeout=float(os.environ.get("CENSOR_WHISPER_IDLE_TIMEOUT", 600))
+)
+gpu_scheduler.add_resident("whisper", whisper_pool.device_memory_mb)
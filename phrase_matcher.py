@@ -0,0 +1,192 @@
+import string
+from collections import deque
+from functools import lru_cache
+
+
+def clean_token(word):
+    """Normalizes a transcribed word or list term the same way: lowercase, no surrounding spaces/punctuation."""
+    return word.lower().strip().strip(string.punctuation)
+
+
+def phrase_tokens(term):
+    """Splits a list term ("mother f") into cleaned tokens, [] for blank terms."""
+    return clean_token(term).split()
+
+
+class PhraseMatcher:
+    """
+    Token-level Aho-Corasick automaton over cleaned word lists.
+
+    Each phrase is a sequence of tokens tagged with a category ('bad_words', 'slurs', ..).
+    ``find`` walks a transcript once and reports every phrase occurrence, overlapping
+    ones included, in O(words + matches) no matter how many phrases were added.
+    """
+
+    def __init__(self):
+        self._goto = [{}]       # node -> {token: next node}
+        self._fail = [0]
+        self._output = [set()]  # node -> {(phrase length, category)}
+        self._compiled = True
+
+    def add(self, tokens, category):
+        """Adds one phrase (list of cleaned tokens) under a category."""
+        if not tokens:
+            return
+        node = 0
+        for token in tokens:
+            nxt = self._goto[node].get(token)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][token] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            node = nxt
+        self._output[node].add((len(tokens), category))
+        self._compiled = False
+
+    def compile(self):
+        """Builds the failure links (breadth-first). Called lazily by ``find``."""
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(token, 0)
+                self._output[child] |= self._output[self._fail[child]]
+        self._compiled = True
+        return self
+
+    def find(self, tokens):
+        """
+        Finds every phrase in a sequence of cleaned tokens.
+        :return: list of (start_idx, end_idx, category), indices inclusive.
+        """
+        if not self._compiled:
+            self.compile()
+        goto, fail, output = self._goto, self._fail, self._output
+        matches = []
+        node = 0
+        for i, token in enumerate(tokens):
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            for length, category in output[node]:
+                matches.append((i - length + 1, i, category))
+        return matches
+
+    @classmethod
+    def from_terms(cls, categories):
+        """
+        Compiles a matcher from raw list terms.
+        :param categories: {category: iterable of terms}, terms are cleaned and split here.
+        """
+        matcher = cls()
+        for category, terms in categories.items():
+            for term in terms:
+                matcher.add(phrase_tokens(term), category)
+        return matcher.compile()
+
+
+@lru_cache(maxsize=16)
+def _compiled(frozen_categories):
+    return PhraseMatcher.from_terms(dict(frozen_categories))
+
+
+def _freeze(terms):
+    # WordList objects hash by their content digest, plain lists are turned into tuples
+    return terms if hasattr(terms, 'digest') else tuple(terms)
+
+
+def get_matcher(bad_words, slurs=None):
+    """Returns a compiled matcher for the lists, reusing the one built for identical lists before."""
+    categories = (('bad_words', _freeze(bad_words)),)
+    if slurs is not None:
+        categories += (('slurs', _freeze(slurs)),)
+    return _compiled(categories)
+
+
+FUZZY_MIN_LENGTH = 4
+
+
+class FuzzyIndex:
+    """
+    Character counts of the list tokens long enough to match fuzzily, one row per token,
+    rows sorted by token length.
+
+    Both fuzzy tests are bounded by those counts: a list token can only be inside a candidate
+    that has all of its characters, and difflib's ratio never exceeds the share of characters
+    two words have in common (its quick_ratio), which also caps how much longer than the
+    candidate a close token can be. Checking the bounds against the vocabulary in one NumPy
+    pass leaves the exact, pure-Python tests a shortlist of a few tokens per candidate
+    instead of all of them; the result is the same.
+    """
+
+    def __init__(self, terms):
+        import numpy as np
+        self.terms = tuple(sorted(terms, key=lambda term: (len(term), term)))
+        self.alphabet = {c: i for i, c in enumerate(sorted(set(''.join(self.terms))))}
+        self.counts = np.zeros((len(self.terms), len(self.alphabet)), dtype=np.int32)
+        for row, term in enumerate(self.terms):
+            for c in term:
+                self.counts[row, self.alphabet[c]] += 1
+        self.lengths = np.array([len(term) for term in self.terms], dtype=np.int32)
+
+    def matches(self, candidate, cutoff):
+        """True when a list token is inside the candidate or close to it (difflib ratio >= cutoff)."""
+        import difflib
+        import numpy as np
+        # 1. Only tokens up to the longest that could still reach the cutoff (one more for rounding)
+        rows = int(np.searchsorted(self.lengths, int(len(candidate) * (2 - cutoff) / cutoff) + 1, side='right'))
+        if not rows:
+            return False
+        # 2. Characters each of them has in common with the candidate (multiset intersection)
+        present = {}
+        for c in candidate:
+            i = self.alphabet.get(c)
+            if i is not None:
+                present[i] = present.get(i, 0) + 1
+        columns = list(present)
+        common = np.minimum(self.counts[:rows, columns], np.array([present[i] for i in columns])).sum(axis=1)
+        lengths = self.lengths[:rows]
+        # 3. Exact tests on the shortlists
+        if any(self.terms[row] in candidate for row in np.flatnonzero(common == lengths)):
+            return True
+        # Same arithmetic as difflib's quick_ratio, so nothing get_close_matches would keep is dropped
+        shortlist = np.flatnonzero(2.0 * common / (lengths + len(candidate)) >= cutoff)
+        return bool(difflib.get_close_matches(candidate, [self.terms[row] for row in shortlist], n=1, cutoff=cutoff))
+
+
+@lru_cache(maxsize=16)
+def _vocabulary(frozen_lists):
+    tokens = frozenset(token for terms in frozen_lists for term in terms for token in phrase_tokens(term))
+    return tokens, FuzzyIndex([token for token in tokens if len(token) >= FUZZY_MIN_LENGTH])
+
+
+def fuzzy_hits(tokens, bad_words, slurs=None, cutoff=0.75):
+    """
+    Recall-oriented screen for a rough transcript (a small model, greedy decoding): indices of the
+    cleaned tokens that are, contain or look like a token of any listed phrase. A token and its
+    neighbour are also tried joined, for words a small model splits in two. Short list tokens
+    (under FUZZY_MIN_LENGTH) only match exactly, or everything would.
+    :return: sorted token indices.
+    """
+    exact, fuzzy = _vocabulary(tuple(_freeze(terms) for terms in (bad_words, slurs) if terms is not None))
+    hits = set()
+    for i, token in enumerate(tokens):
+        if token in exact:
+            hits.add(i)
+            continue
+        joined = token + tokens[i + 1] if i + 1 < len(tokens) else None
+        for candidate, span in ((token, (i,)), (joined, (i, i + 1))):
+            if candidate is None or len(candidate) < FUZZY_MIN_LENGTH:
+                continue
+            if fuzzy.matches(candidate, cutoff):
+                hits.update(span)
+                break
+    return sorted(hits)
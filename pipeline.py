@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from async_toolset import (
+    start_separation, start_targeted_separation, get_transcript, get_cascade_transcript, get_bad_word_timestamps_genai, match_transcript,
+    render_instrumentals, render_reversed_vocals, render_downpitch, render_instrumentals_and_downpitch,
+    render_both_and_downpitch, render_backspin, render_tape_stop
+)
+from render_engine import CensorRenderer
+from stage_scheduler import gpu_scheduler
+from workspace import Workspace
+from audio_source import as_audio_source
+
+
+# Stages a censor job can run and the stages each one needs first. Decoding is shared by
+# transcription and separation, effects are rendered over the decoded mix, encoding is one pass at the end.
+STAGE_DEPENDENCIES = {
+    'decode': (),
+    'transcribe': ('decode',),
+    'match': ('transcribe',),
+    'separate': ('decode',),
+    'effects': ('decode', 'match', 'separate'),
+    'encode': ('effects',),
+}
+WITH_SEPARATION = ('decode', 'transcribe', 'match', 'separate', 'effects', 'encode')
+WITHOUT_SEPARATION = ('decode', 'transcribe', 'match', 'effects', 'encode')
+
+
+class MethodPlan:
+    """
+    Declarative description of a censor method: the stages it runs, and the render function
+    (async_toolset.render_*) its effects stage applies. PipelineCoordinator.execute runs
+    exactly these stages, each as soon as the ones it needs are done.
+    """
+
+    def __init__(self, label, render, stages=WITH_SEPARATION, slurs=False, genai=False):
+        """
+        :param slurs: Slurs are matched as a second list (the render function gets both).
+        :param genai: Words come from the GenAI transcription bridge instead of Whisper.
+        """
+        self.label = label
+        self.render = render
+        self.stages = stages
+        self.slurs = slurs
+        self.genai = genai
+
+    def needs(self, stage):
+        return stage in self.stages
+
+    def dependencies(self, targeted=False, transcribe_vocals=False):
+        """
+        {stage: stages it waits for}, restricted to this plan. Targeted separation waits for the matches;
+        transcribing the vocals stem waits for the separation instead (the two can't both be true).
+        """
+        dependencies = dict(STAGE_DEPENDENCIES)
+        if targeted:
+            dependencies['separate'] = ('match',)
+        elif transcribe_vocals:
+            dependencies['transcribe'] = ('separate',)
+        return {stage: tuple(d for d in dependencies[stage] if d in self.stages) for stage in self.stages}
+
+
+METHOD_PLANS = {
+    'v': MethodPlan("vocal separation", render_instrumentals),
+    'Gv': MethodPlan("GenAI vocal separation", render_instrumentals, genai=True),
+    # Oldest method in the book, doesn't require vocal separation
+    'b': MethodPlan("backspin", render_backspin, stages=WITHOUT_SEPARATION),
+    'vb': MethodPlan("vocal + backspin", render_reversed_vocals),
+    'p': MethodPlan("vocal downpitch", render_downpitch),
+    'sv': MethodPlan("slur + vocal", render_instrumentals_and_downpitch, slurs=True),
+    'sb': MethodPlan("slur + vocal + backspin", render_both_and_downpitch, slurs=True),
+    'ts': MethodPlan("tape stop / vinyl break", render_tape_stop),
+}
+METHOD_PLANS['tape_stop'] = METHOD_PLANS['ts']
+
+
+class PipelineCoordinator:
+    """
+    Runs the stages of one censor job.
+
+    ``execute`` takes a method's MethodPlan and runs only the stages the method needs
+    (backspin never separates), each on its own thread as soon as the stages it depends on
+    are done, handing results along as thread-safe futures. Transcription of the original
+    mix and separation start together, so the two always overlap; whether they actually
+    share the GPU is up to ``gpu_scheduler``. With ``targeted``, separation waits for the
+    matches instead and only runs on padded windows around them (see
+    start_targeted_separation). An error in any stage is raised by ``execute``.
+
+    While it runs, ``self.stems`` and ``self.timestamps`` are the futures of the separate
+    and match stages.
+
+    Each job owns a ``Workspace``: its job id tags every stage's threads and log lines,
+    and its scratch directory is the only thing ``cleanup`` removes.
+    """
+
+    def __init__(self, audio_file_path, low_memory=False, workspace=None, targeted=False, cascade=False, vad=False):
+        """
+        :param audio_file_path: Path or AudioSource; the stages share one AudioSource, so the file is decoded once.
+        :param targeted: Separate only windows around the matched hits, once they are known.
+        :param cascade: Transcribe with a small-model screen and a main-model confirmation (see get_cascade_transcript).
+        :param vad: Transcribe the vocals stem with VAD gating once it's separated, or the mix with VAD gating
+                    when the plan doesn't separate (or separates around the hits, after transcription).
+        """
+        self.source = as_audio_source(audio_file_path)
+        self.audio_file_path = audio_file_path
+        self.low_memory = low_memory
+        self.targeted = targeted
+        self.cascade = cascade
+        self.vad = vad
+        self.workspace = workspace or Workspace()
+        self.job_id = self.workspace.job_id
+        self.stems = None
+        self.timestamps = None
+        self._started_at = None
+
+    async def execute(self, plan, bad_words, output_path, slurs=None, **options):
+        """
+        Runs a MethodPlan: every stage on its own thread, started as soon as the stages it needs are done.
+        :param options: Passed to the plan's render function (i.e. intensity for the tape stop).
+        :return: The output path.
+        """
+        self._started_at = time.time()
+        source = self.source
+        transcribe_vocals = self.vad and plan.needs('separate') and not (self.targeted or self.cascade or plan.genai)
+        def transcribe(done):
+            if plan.genai:
+                return asyncio.run(get_bad_word_timestamps_genai(source, bad_words))
+            if self.cascade:
+                return asyncio.run(get_cascade_transcript(source, bad_words, slurs if plan.slurs else None, vad=self.vad))
+            return asyncio.run(get_transcript(source, stems=done.get('separate'), vad=self.vad))
+        def match(done):
+            if plan.genai:
+                return done['transcribe']
+            found = match_transcript(done['transcribe'], bad_words, slurs if plan.slurs else None)
+            return (found['bad_words'], found['slurs']) if plan.slurs else found['bad_words']
+        def separate(done):
+            if self.targeted:
+                return start_targeted_separation(source, futures['match'], low_memory=self.low_memory, job_id=self.job_id).result()
+            return start_separation(source, low_memory=self.low_memory, job_id=self.job_id).result()
+        def effects(done):
+            found = done['match']
+            bad_word_timestamps, slurs_timestamps = found if plan.slurs else (found, ())
+            renderer = CensorRenderer(source, done.get('separate'))
+            plan.render(renderer, bad_word_timestamps, slurs_timestamps, **options)
+            return renderer
+        def encode(done):
+            done['effects'].export(output_path, input_path=source)
+            return output_path
+        runners = {'decode': lambda done: source.samples is not None, 'transcribe': transcribe, 'match': match,
+                   'separate': separate, 'effects': effects, 'encode': encode}
+
+        dependencies = plan.dependencies(self.targeted, transcribe_vocals)
+        if transcribe_vocals:
+            print(f'[=] Transcription will run on the vocals stem (VAD-gated) once it is separated{self.workspace.tag}')
+        elif plan.needs('separate') and not self.targeted:
+            mode = "concurrently" if gpu_scheduler.can_overlap("separate", "transcribe") else "one at a time (not enough VRAM for both)"
+            print(f'[=] Separation and transcription will use the GPU {mode}{self.workspace.tag}')
+        print(f'[=] Stages: {", ".join(plan.stages)}{self.workspace.tag}')
+
+        futures = {stage: Future() for stage in plan.stages}
+        def _run(stage):
+            future = futures[stage]
+            try:
+                done = {dep: futures[dep].result() for dep in dependencies[stage]}
+                future.set_result(runners[stage](done))
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            if stage in ('transcribe', 'separate', 'effects'):
+                print(f'[+] {stage.capitalize()} ready after {time.time() - self._started_at:.2f}s{self.workspace.tag}')
+        for stage in plan.stages:
+            threading.Thread(target=_run, args=(stage,), name=f"{stage}-{self.job_id}", daemon=True).start()
+
+        self.timestamps = futures['match']
+        self.stems = futures.get('separate')
+        return await asyncio.wrap_future(futures['encode'])
+
+    def detections(self):
+        """
+        Every censored interval of the finished job as a sorted [(start_ms, end_ms), ..], whatever
+        shape the transcription returned (bad words only, or bad words and slurs).
+        """
+        if self.timestamps is None or not self.timestamps.done() or self.timestamps.exception() is not None:
+            return []
+        result = self.timestamps.result() or []
+        if isinstance(result, tuple):
+            result = [interval for category in result for interval in category]
+        return sorted((int(start), int(end)) for start, end in result)
@@ -0,0 +1,367 @@
+import os
+import numpy as np
+from pydub import AudioSegment
+
+
+def segment_to_array(segment):
+    """Decoded AudioSegment -> float32 array shaped (frames, channels) in [-1, 1]."""
+    samples = np.array(segment.get_array_of_samples())
+    scale = float(1 << (8 * segment.sample_width - 1))
+    return (samples.astype(np.float32) / scale).reshape((-1, segment.channels))
+
+
+def array_to_segment(samples, frame_rate):
+    """float32 (frames, channels) array -> 16-bit AudioSegment, clipping anything outside [-1, 1]."""
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+    return AudioSegment(pcm.tobytes(), frame_rate=frame_rate, sample_width=2, channels=pcm.shape[1])
+
+
+def pitch_shift(samples, sample_rate, semitones):
+    """
+    Shifts the pitch of an in-memory signal, the array-in/array-out version of ``down_pitch``.
+    Multichannel input is downmixed to mono first, like ``librosa.load`` did for the temp-file path.
+    :param samples: float32 (frames,) or (frames, channels) array.
+    :param semitones: Semitones to shift by (negative to down-pitch).
+    :return: float32 (frames,) array.
+    """
+    import librosa
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    if len(samples) == 0:
+        return samples.astype(np.float32)
+    shifted = librosa.effects.pitch_shift(y=np.ascontiguousarray(samples, dtype=np.float32), sr=sample_rate, n_steps=semitones)
+    return shifted.astype(np.float32, copy=False)
+
+
+def pitch_shift_batch(segments, sample_rate, semitones):
+    """
+    Pitch-shifts many signals with one vectorized librosa call per length instead of one call per signal.
+
+    Segments are downmixed to mono and grouped by exact length; each group of two or more is
+    stacked into a (segments, frames) matrix and librosa runs the STFT, phase vocoder and
+    resampler over the leading axis in one pass. Segments are never padded: the time stretch
+    and resampling depend on the length, so a padded row would not match ``pitch_shift`` of
+    the segment. Every result is the same as ``pitch_shift`` of that segment; a length
+    nothing else shares goes through ``pitch_shift`` itself.
+    :param segments: list of float32 (frames,) or (frames, channels) arrays.
+    :return: list of float32 (frames,) arrays, in the order given.
+    """
+    import librosa
+    mono = [s.mean(axis=1) if s.ndim > 1 else s for s in segments]
+    results = [np.zeros(0, dtype=np.float32)] * len(mono)
+
+    # 1. Group by length (hits padded by the same buffer around same-length words often share one)
+    groups = {}
+    for i, samples in enumerate(mono):
+        if len(samples):
+            groups.setdefault(len(samples), []).append(i)
+
+    # 2. Shift each group as one (segments, frames) matrix
+    for group in groups.values():
+        if len(group) == 1:
+            results[group[0]] = pitch_shift(mono[group[0]], sample_rate, semitones)
+            continue
+        batch = np.stack([mono[i] for i in group]).astype(np.float32, copy=False)
+        shifted = librosa.effects.pitch_shift(y=batch, sr=sample_rate, n_steps=semitones)
+        for row, i in enumerate(group):
+            results[i] = np.ascontiguousarray(shifted[row], dtype=np.float32)
+    return results
+
+
+def tape_stop_warp(frames, intensity, curve_exponent):
+    """
+    Read positions of a tape stop over ``frames`` frames, as (left index, fraction) for linear
+    interpolation. The playback speed falls from 1 to ``1 - intensity * 0.85`` along a
+    ``curve_exponent`` curve, time-stretched back to the segment length.
+    """
+    u = np.linspace(0.0, 1.0, frames)
+    speed_end = 1.0 - intensity * 0.85
+    p = curve_exponent + 1.0
+    phi = u - ((1.0 - speed_end) / p) * (u ** p)
+    phi_max = 1.0 - ((1.0 - speed_end) / p)
+    positions = (frames - 1) * (phi / phi_max)
+    left = np.minimum(positions.astype(np.int64), frames - 2)
+    fraction = (positions - left).astype(np.float32)[:, None]
+    return left, fraction
+
+
+def fade_envelope(frames, sample_rate, fade_in_ms, fade_out_ms):
+    """
+    Gain per frame of pydub's ``fade_in``/``fade_out`` at both ends of a segment: a linear
+    ramp between -120 dB and unity, one step per frame. (frames, 1) float32.
+    """
+    envelope = np.ones(frames, dtype=np.float32)
+    floor = 10 ** (-120 / 20)
+    duration_ms = frames * 1000 / sample_rate
+    if 0 < fade_in_ms < duration_ms:
+        n = int(fade_in_ms * sample_rate / 1000)
+        envelope[:n] = floor + (1.0 - floor) * np.arange(n) / n
+    if 0 < fade_out_ms < duration_ms:
+        n = int(fade_out_ms * sample_rate / 1000)
+        envelope[frames - n:] *= 1.0 + (floor - 1.0) * np.arange(n) / n
+    return envelope[:, None]
+
+
+def tape_stop(samples, sample_rate, intensity=0.6, curve_exponent=1.2, fade_in_ms=5, fade_out_ms=15):
+    """
+    DJ tape stop / vinyl break over an in-memory signal, the array version of ``apply_tape_stop_effect``.
+
+    Every channel is interpolated at once in float32 from the warp table, then the
+    peak-matching gain and the fades are applied together in one multiply.
+    :param samples: float32 (frames,) or (frames, channels) array.
+    :param intensity: 0.0 to 1.0 tape-break depth.
+    :return: float32 array shaped like ``samples``.
+    """
+    mono = samples.ndim == 1
+    x = np.asarray(samples, dtype=np.float32)
+    if mono:
+        x = x[:, None]
+    frames = len(x)
+    orig_peak = float(np.max(np.abs(x))) if frames else 0.0
+    if frames < 2 or orig_peak == 0:
+        return samples.astype(np.float32)
+
+    left, fraction = tape_stop_warp(frames, max(0.0, min(1.0, float(intensity))), float(curve_exponent))
+    lower = np.take(x, left, axis=0)
+    out = np.take(x, left + 1, axis=0)
+    out -= lower
+    out *= fraction
+    out += lower
+
+    out_peak = float(np.max(np.abs(out)))
+    gain = fade_envelope(frames, sample_rate, fade_in_ms, fade_out_ms)
+    out *= gain * np.float32(orig_peak / out_peak) if out_peak > 0 else gain
+    return out[:, 0] if mono else out
+
+
+def export_format(input_path):
+    """(format, bitrate) the censor methods write for an input: WAV for WAV inputs, 320k MP3 otherwise."""
+    if os.fspath(input_path).lower().endswith(".wav"):
+        return "wav", None
+    return "mp3", '320k'
+
+
+def export_like(segment, input_path, output_path):
+    """Exports WAV for WAV inputs, 320k MP3 otherwise (the format every censor method writes)."""
+    format, bitrate = export_format(input_path)
+    if bitrate:
+        segment.export(output_path, format=format, bitrate=bitrate)
+    else:
+        segment.export(output_path, format=format)
+
+
+class AudioWriter:
+    """
+    Incremental 16-bit encoder: float32 (frames, channels) blocks go in with ``write`` as
+    they are rendered, and are on disk (or in ffmpeg) right away. WAV is written directly,
+    anything else is piped through ffmpeg, which writes the file as it goes. ``close``
+    finishes the file (WAV header sizes, MP3 trailer).
+    """
+
+    def __init__(self, output_path, sample_rate, channels, format="mp3", bitrate=None):
+        self.output_path = os.fspath(output_path)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.format = format
+        self.frames_written = 0
+        self._wav = None
+        self._encoder = None
+        if format == "wav":
+            import wave
+            self._wav = wave.open(self.output_path, "wb")
+            self._wav.setnchannels(channels)
+            self._wav.setsampwidth(2)
+            self._wav.setframerate(sample_rate)
+        else:
+            import subprocess
+            from pydub.utils import get_encoder_name
+            cmd = [get_encoder_name(), "-y", "-v", "error", "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "-"]
+            if bitrate:
+                cmd += ["-b:a", bitrate]
+            cmd += ["-f", format, self.output_path]
+            self._encoder = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def write(self, samples):
+        """Appends a float32 (frames, channels) block, clipping anything outside [-1, 1]."""
+        block = np.asarray(samples, dtype=np.float32)
+        if block.ndim == 1:
+            block = block[:, None]
+        pcm = (np.clip(block, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+        if self._wav is not None:
+            self._wav.writeframes(pcm)
+        else:
+            self._encoder.stdin.write(pcm)
+            self._encoder.stdin.flush()
+        self.frames_written += len(block)
+
+    def close(self):
+        if self._wav is not None:
+            self._wav.close()
+            self._wav = None
+        elif self._encoder is not None:
+            encoder, self._encoder = self._encoder, None
+            encoder.stdin.close()
+            if encoder.wait() != 0:
+                raise RuntimeError(f"Encoding {self.output_path} failed (ffmpeg exit code {encoder.returncode})")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def write_audio(samples, sample_rate, output_path, format="mp3", bitrate=None, block_frames=1 << 20):
+    """
+    Encodes a float32 (frames, channels) array block by block, so a memory-mapped mix is never
+    converted to 16-bit in one piece.
+    """
+    with AudioWriter(output_path, sample_rate, samples.shape[1], format=format, bitrate=bitrate) as writer:
+        for start in range(0, len(samples), block_frames):
+            writer.write(samples[start:start + block_frames])
+
+
+class CensorRenderer:
+    """
+    Renders a censored mix in place.
+
+    The mix is decoded once into a preallocated float32 buffer and every censored
+    interval is written over its slice (replace, overlay, reverse, or any array
+    effect such as pitch or tape-stop). Untouched audio is never copied again, and
+    the result is encoded exactly once by ``export``, instead of rebuilding the song
+    with ``AudioSegment +=`` per interval (which re-copies everything rendered so far).
+
+    Sources other than the mix ('accompaniment', 'vocals', ..) are kept as given (i.e.
+    memory-mapped float16 stems from the stem cache) and conformed to the mix sample
+    rate and channel count one interval at a time, when an interval is read. With a
+    memory-mapped AudioSource the output buffer is a copy-on-write map of the decoded
+    mix, so only the censored regions ever take memory, however long the song.
+    """
+
+    def __init__(self, audio, stems=None, sample_rate=None):
+        """
+        :param audio: Decoded mix, as an AudioSegment, an AudioSource (its shared buffer is never written)
+                      or a float32 (frames, channels) array at ``sample_rate`` (copied, i.e. one streaming window).
+        :param stems: Optional Stems (separator_service) or {name: AudioSegment}.
+        """
+        if isinstance(audio, AudioSegment):
+            self.sample_rate = audio.frame_rate
+            self.out = segment_to_array(audio)
+        elif isinstance(audio, np.ndarray):
+            self.sample_rate = sample_rate
+            self.out = np.array(audio if audio.ndim > 1 else audio[:, None], dtype=np.float32)
+        else:
+            self.sample_rate = audio.sample_rate
+            self.out = audio.writable_copy()
+        self.channels = self.out.shape[1]
+        self._sources = {}
+        if stems is not None:
+            if isinstance(stems, dict):
+                for name, segment in stems.items():
+                    self.add_source(name, segment)
+            else:
+                for name in ('vocals', 'accompaniment'):
+                    self.add_source(name, stems[name], stems.sample_rate)
+
+    def __len__(self):
+        """Length in frames."""
+        return self.out.shape[0]
+
+    def fit(self, samples, frames):
+        """Matches a layer to this mix's channel count and to ``frames`` (truncate or zero-pad)."""
+        if samples.ndim == 1:
+            samples = samples[:, None]
+        if samples.shape[1] != self.channels:
+            if samples.shape[1] == 1:
+                samples = np.repeat(samples, self.channels, axis=1)
+            else:
+                samples = samples.mean(axis=1, keepdims=True)
+                samples = np.repeat(samples, self.channels, axis=1)
+        if samples.shape[0] >= frames:
+            return np.ascontiguousarray(samples[:frames], dtype=np.float32)
+        padded = np.zeros((frames, self.channels), dtype=np.float32)
+        padded[:samples.shape[0]] = samples
+        return padded
+
+    def add_source(self, name, data, sample_rate=None):
+        """Registers a stem (AudioSegment, or array plus its sample rate) under a name. Nothing is converted yet."""
+        if isinstance(data, AudioSegment):
+            data, sample_rate = segment_to_array(data), data.frame_rate
+        if data.ndim == 1:
+            data = data[:, None]
+        self._sources[name] = (data, sample_rate or self.sample_rate)
+
+    def has_source(self, name):
+        return name in self._sources
+
+    def _frames(self, start_ms, end_ms):
+        a = min(len(self), max(0, int(round(start_ms * self.sample_rate / 1000))))
+        b = min(len(self), max(a, int(round(end_ms * self.sample_rate / 1000))))
+        return a, b
+
+    def _window(self, name, a, b, margin=1024):
+        """Frames [a, b) of a source at the mix rate and channel count, float32. Only this window is read."""
+        if name == 'mix':
+            return self.out[a:b]
+        data, sample_rate = self._sources[name]
+        if sample_rate == self.sample_rate:
+            return self.fit(data[a:b], b - a)
+        # Resample just the window, with some context on both sides for the filter
+        import librosa
+        ratio = sample_rate / self.sample_rate
+        sa = max(0, int(a * ratio) - margin)
+        sb = min(len(data), int(np.ceil(b * ratio)) + margin)
+        if sb <= sa:
+            return np.zeros((b - a, self.channels), dtype=np.float32)
+        window = np.asarray(data[sa:sb], dtype=np.float32)
+        resampled = librosa.resample(window.T, orig_sr=sample_rate, target_sr=self.sample_rate).T
+        offset = max(0, int(round(a - sa / ratio)))
+        return self.fit(resampled[offset:], b - a)
+
+    def source(self, name, start_ms, end_ms):
+        """Interval of a source ('mix' is the rendered buffer) between two times in ms."""
+        a, b = self._frames(start_ms, end_ms)
+        return self._window(name, a, b)
+
+    def replace(self, start_ms, end_ms, source='accompaniment'):
+        """Swaps the interval for the same interval of another source."""
+        a, b = self._frames(start_ms, end_ms)
+        self.out[a:b] = self._window(source, a, b)
+
+    def reverse(self, start_ms, end_ms, source='mix'):
+        """Writes the interval of a source back to front (backspin)."""
+        a, b = self._frames(start_ms, end_ms)
+        self.out[a:b] = self._window(source, a, b)[::-1].copy()
+
+    def overlay(self, start_ms, end_ms, layer, base='accompaniment'):
+        """
+        Writes base + layer over the interval. The layer is truncated or padded to the interval, like pydub's overlay.
+        :param layer: float32 array at the mix sample rate, or the name of a source.
+        :param base: Source under the layer, or None to write the layer alone.
+        """
+        a, b = self._frames(start_ms, end_ms)
+        if isinstance(layer, str):
+            layer = self._window(layer, a, b)
+        layer = self.fit(layer, b - a)
+        if base is None:
+            self.out[a:b] = layer
+        else:
+            np.add(self._window(base, a, b), layer, out=self.out[a:b])
+
+    def pitch_many(self, intervals, semitones, source='vocals'):
+        """Pitch-shifted copies of a source's (start_ms, end_ms) intervals, batched, in the same order."""
+        slices = [self.source(source, start_ms, end_ms) for start_ms, end_ms in intervals]
+        return pitch_shift_batch(slices, self.sample_rate, semitones)
+
+    def export(self, output_path, input_path=None, format=None, bitrate='320k'):
+        """
+        Encodes the rendered mix once, block by block.
+        :param input_path: When given, mirror its format (WAV stays WAV, anything else becomes 320k MP3).
+        """
+        if input_path is not None:
+            format, bitrate = export_format(input_path)
+        write_audio(self.out, self.sample_rate, output_path, format=format or "mp3", bitrate=bitrate)
+        print(f"Censored audio saved to {output_path}")
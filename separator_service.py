@@ -0,0 +1,279 @@
+import atexit
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from stem_cache import stem_cache
+from stage_scheduler import gpu_scheduler
+from workspace import job_tag
+from audio_source import AudioSource
+
+# Let TensorFlow grow its GPU allocation instead of grabbing the whole card, so Whisper can share it
+os.environ.setdefault("TF_FORCE_GPU_ALLOW_GROWTH", "true")
+
+SEPARATOR_MODEL = 'spleeter:2stems-16kHz'  # 2 stems: vocals + instrumental
+SEPARATOR_SAMPLE_RATE = 44100  # Spleeter models take 44.1kHz input whatever their bandwidth
+
+
+class Stems:
+    """
+    In-memory separation result: arrays shaped (frames, channels) at ``sample_rate``.
+    Fresh from the separator they are float32; from the stem cache, read-only float16 memory maps.
+    """
+
+    def __init__(self, vocals, accompaniment, sample_rate=SEPARATOR_SAMPLE_RATE):
+        self.vocals = vocals
+        self.accompaniment = accompaniment
+        self.sample_rate = sample_rate
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+
+class WindowedStem:
+    """
+    A stem separated only in some windows of the song and silent everywhere else (targeted
+    separation). It slices like the (frames, channels) array it stands in for, so the
+    renderer reads it the same way, and nothing outside the windows is ever allocated.
+    """
+
+    ndim = 2
+    dtype = "float32"
+
+    def __init__(self, frames, channels, windows):
+        """
+        :param windows: list of (start frame, float32 (frames, channels) array).
+        """
+        self.frames = frames
+        self.channels = channels
+        self.windows = windows
+
+    @property
+    def shape(self):
+        return (self.frames, self.channels)
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, key):
+        import numpy as np
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("WindowedStem only supports contiguous frame slices")
+        start, stop, _ = key.indices(self.frames)
+        out = np.zeros((max(0, stop - start), self.channels), dtype=np.float32)
+        for offset, data in self.windows:
+            lo, hi = max(start, offset), min(stop, offset + len(data))
+            if lo < hi:
+                out[lo - start:hi - start] = data[lo - offset:hi - offset]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        samples = self[:]
+        return samples if dtype is None else samples.astype(dtype)
+
+
+def load_waveform(audio_adapter, input_audio_path):
+    """
+    Decodes a file the way Spleeter expects it: float32 (frames, channels) at 44.1kHz.
+    An AudioSource is resampled from its shared decoded buffer instead of being decoded again.
+    """
+    import numpy as np
+    if isinstance(input_audio_path, AudioSource):
+        return input_audio_path.at_rate(SEPARATOR_SAMPLE_RATE)
+    waveform, _ = audio_adapter.load(input_audio_path, sample_rate=SEPARATOR_SAMPLE_RATE, dtype=np.float32)
+    return waveform
+
+
+def separate_waveform(separator, waveform):
+    """Runs a loaded Spleeter separator over a waveform and wraps the result as Stems."""
+    import numpy as np
+    prediction = separator.separate(waveform)
+    return Stems(
+        prediction['vocals'].astype(np.float32, copy=False),
+        prediction['accompaniment'].astype(np.float32, copy=False)
+    )
+
+
+class SeparatorService:
+    """
+    Long-lived Spleeter engine that keeps the TensorFlow graph resident across songs.
+
+    Lifecycle: ``start()`` imports Spleeter and builds the separator on a dedicated
+    worker thread, ``warm()`` runs a short silent clip so the graph is built before
+    the first song, ``submit()``/``separate_many()`` queue input files (or
+    ``submit_stems()`` to get the stems back as arrays, ``submit_waveform()`` for a
+    decoded window), and
+    ``shutdown()`` drains the queue and drops the model. All separations run on the
+    worker thread, so TensorFlow only ever sees a single caller.
+    """
+
+    _STOP = object()
+
+    def __init__(self, model=SEPARATOR_MODEL):
+        self.model = model
+        self._queue = queue.Queue()
+        self._thread = None
+        self._ready = threading.Event()
+        self._start_error = None
+        self._lock = threading.Lock()
+        self._separator = None
+        self._audio_adapter = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Starts the worker thread and blocks until Spleeter is loaded."""
+        with self._lock:
+            if not self.running:
+                self._ready.clear()
+                self._start_error = None
+                self._thread = threading.Thread(target=self._worker, name="separator-service", daemon=True)
+                self._thread.start()
+        self._ready.wait()
+        if self._start_error is not None:
+            raise self._start_error
+        return self
+
+    def warm(self):
+        """Pushes one second of silence through the model so the graph is built ahead of the first song."""
+        self.start()
+        future = Future()
+        self._queue.put(('warm', None, None, None, future))
+        return future.result()
+
+    def submit(self, input_audio_path, output_dir="separated", job_id=None):
+        """
+        Queues a file for separation.
+        :param job_id: Tags the job's log lines (see workspace.Workspace).
+        :return: concurrent.futures.Future resolving to (vocals_path, accompaniment_path).
+        """
+        self.start()
+        future = Future()
+        self._queue.put(('file', input_audio_path, output_dir, job_id, future))
+        return future
+
+    def separate(self, input_audio_path, output_dir="separated"):
+        """Blocking separation of a single file."""
+        return self.submit(input_audio_path, output_dir).result()
+
+    def submit_stems(self, input_audio_path, job_id=None):
+        """
+        Queues a file for in-memory separation, nothing is written to disk.
+        :param job_id: Tags the job's log lines (see workspace.Workspace).
+        :return: concurrent.futures.Future resolving to Stems.
+        """
+        self.start()
+        future = Future()
+        self._queue.put(('stems', input_audio_path, None, job_id, future))
+        return future
+
+    def submit_waveform(self, waveform, job_id=None, cache=True):
+        """
+        Queues an already decoded float32 (frames, channels) 44.1kHz waveform, i.e. one window
+        of a streaming job, for in-memory separation.
+        :param cache: Go through the stem cache. Off for audio that never comes back (a live
+            feed), which would only hash, write and evict real songs for nothing.
+        :return: concurrent.futures.Future resolving to Stems.
+        """
+        self.start()
+        future = Future()
+        self._queue.put(('waveform' if cache else 'transient', waveform, None, job_id, future))
+        return future
+
+    def separate_many(self, input_audio_paths, output_dir="separated"):
+        """Queues every file at once and returns their futures in input order."""
+        return [self.submit(path, output_dir) for path in input_audio_paths]
+
+    def shutdown(self, wait=True):
+        """Finishes the queued jobs, then unloads the separator and clears the TensorFlow session."""
+        with self._lock:
+            if not self.running:
+                return
+            self._queue.put((self._STOP, None, None, None, None))
+            thread = self._thread
+        if wait:
+            thread.join()
+
+    def _load(self):
+        from spleeter.separator import Separator
+        from spleeter.audio.adapter import AudioAdapter
+        print(f'[+] Loading separator model {self.model}..')
+        self._separator = Separator(self.model, multiprocess=False)
+        self._audio_adapter = AudioAdapter.default()
+
+    def _unload(self):
+        self._separator = None
+        self._audio_adapter = None
+        try:
+            import tensorflow as tf
+            tf.keras.backend.clear_session()
+        except Exception:
+            pass
+        print(f'[=] Separator service stopped')
+
+    def _run_job(self, kind, input_audio_path, output_dir, job_id=None):
+        import numpy as np
+        if kind == 'warm':
+            self._separator.separate(np.zeros((SEPARATOR_SAMPLE_RATE, 2), dtype=np.float32))
+            print(f'[+] Separator graph is warm')
+            return None
+        if kind == 'transient':
+            return self._separate_scheduled(input_audio_path)
+        if kind == 'waveform':
+            waveform = input_audio_path
+        else:
+            print(f'[+] Separation in Progress{job_tag(job_id)}..')
+            waveform = load_waveform(self._audio_adapter, input_audio_path)
+        stems = stem_cache.get_or_separate(waveform, self.model, self._separate_scheduled)
+        if kind in ('stems', 'waveform'):
+            return stems
+        filename = os.path.splitext(os.path.basename(input_audio_path))[0]
+        vocal_path = f"{output_dir}/{filename}/vocals.wav"
+        instrumental_path = f"{output_dir}/{filename}/accompaniment.wav"
+        os.makedirs(os.path.dirname(vocal_path), exist_ok=True)
+        self._audio_adapter.save(vocal_path, np.asarray(stems.vocals, dtype=np.float32), stems.sample_rate, 'wav')
+        self._audio_adapter.save(instrumental_path, np.asarray(stems.accompaniment, dtype=np.float32), stems.sample_rate, 'wav')
+        return vocal_path, instrumental_path
+
+    def _separate_scheduled(self, waveform):
+        with gpu_scheduler.reserve("separate"):
+            return separate_waveform(self._separator, waveform)
+
+    def _worker(self):
+        try:
+            self._load()
+        except BaseException as e:
+            self._start_error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            while True:
+                kind, input_audio_path, output_dir, job_id, future = self._queue.get()
+                if kind is self._STOP:
+                    break
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(self._run_job(kind, input_audio_path, output_dir, job_id))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            self._unload()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_separator_service():
+    """Returns the process-wide separator service, starting it on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SeparatorService()
+            atexit.register(_service.shutdown)
+    return _service.start()
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Peak device memory (MB) a stage needs while it runs, on top of what's already resident.
+# Spleeter 2stems with TF allow_growth peaks around 4-5GB on a full song,
+# Whisper medium int8_float16 with beam_size=5 and word timestamps around 2.5-3GB, of which
+# the ~0.8GB of weights stay resident in model_pool and are counted there.
+STAGE_VRAM_MB = {
+    "separate": int(os.environ.get("CENSOR_VRAM_SEPARATE_MB", 4500)),
+    "transcribe": int(os.environ.get("CENSOR_VRAM_TRANSCRIBE_MB", 2300)),
+}
+
+# Stages whose framework keeps its peak allocation once they've run: TF under allow_growth
+# grows its pool but never hands it back, even after clear_session.
+RETAINING_STAGES = ("separate",)
+
+
+def detect_device_memory_mb():
+    """Total memory of the first CUDA device in MB, or None when there is no GPU to schedule."""
+    if os.environ.get("CENSOR_GPU_MEMORY_MB"):
+        return int(os.environ["CENSOR_GPU_MEMORY_MB"])
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return torch.cuda.get_device_properties(0).total_memory // (1024 ** 2)
+    except ImportError:
+        pass
+    return None
+
+
+class GpuStageScheduler:
+    """
+    Admits GPU stages according to their VRAM footprint.
+
+    Each stage reserves ``STAGE_VRAM_MB[stage]`` for as long as it runs. Stages whose
+    footprints fit in the device budget together run at once (i.e. separation and
+    transcription on a 24GB card); otherwise they are serialized (an 8GB card). A stage
+    that is bigger than the whole budget still runs, alone. Without a GPU nothing waits.
+
+    Memory held between stages is taken off the budget: whatever the ``add_resident``
+    callbacks report (the Whisper models resident in the pool), and the pool a retaining
+    stage keeps after its first run. A retaining stage only reserves what it needs on top
+    of its own retained pool.
+    """
+
+    def __init__(self, device_memory_mb=None, headroom_mb=1024, footprints=None, retaining=RETAINING_STAGES):
+        self.device_memory_mb = device_memory_mb
+        self.headroom_mb = headroom_mb
+        self.footprints = dict(STAGE_VRAM_MB if footprints is None else footprints)
+        self.retaining = set(retaining)
+        self._reserved = {}  # stage -> number of running instances
+        self._retained = {}  # stage -> MB its framework still holds after running
+        self._resident = {}  # name -> callable returning the MB it holds on the device
+        self._cond = threading.Condition()
+
+    def add_resident(self, name, resident_mb):
+        """
+        Registers memory that stays on the device outside of any stage, i.e. loaded models.
+        :param name: Name of the holder, registering it again replaces the callback.
+        :param resident_mb: Callable returning the MB currently held.
+        """
+        with self._cond:
+            self._resident[name] = resident_mb
+            self._cond.notify_all()
+
+    def resident_mb(self):
+        """MB held on the device between stages: resident models plus retained framework pools."""
+        return sum(resident_mb() for resident_mb in self._resident.values()) + sum(self._retained.values())
+
+    @property
+    def budget_mb(self):
+        if self.device_memory_mb is None:
+            return None
+        return self.device_memory_mb - self.headroom_mb - self.resident_mb()
+
+    def _need_mb(self, stage):
+        return max(0, self.footprints.get(stage, 0) - self._retained.get(stage, 0))
+
+    def _in_use_mb(self):
+        return sum(self._need_mb(stage) * count for stage, count in self._reserved.items())
+
+    def _fits(self, need):
+        if self.budget_mb is None:
+            return True
+        # Nothing running: admit it even past the budget, it's the best the device can do
+        return not self._reserved or self._in_use_mb() + need <= self.budget_mb
+
+    def can_overlap(self, *stages):
+        """True when all the given stages fit in the budget at the same time."""
+        if self.budget_mb is None:
+            return True
+        return sum(self._need_mb(stage) for stage in stages) <= self.budget_mb
+
+    @contextmanager
+    def reserve(self, stage):
+        """Blocks until the stage fits on the device, then holds its footprint for the with-block."""
+        waited_from = None
+        with self._cond:
+            while not self._fits(self._need_mb(stage)):
+                if waited_from is None:
+                    waited_from = time.time()
+                    print(f'[=] GPU busy ({self._in_use_mb()}MB of {self.budget_mb}MB reserved, {self.resident_mb()}MB resident), "{stage}" waits..')
+                self._cond.wait()
+            self._reserved[stage] = self._reserved.get(stage, 0) + 1
+        if waited_from is not None:
+            print(f'[=] "{stage}" admitted after {time.time() - waited_from:.2f}s')
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._reserved[stage] -= 1
+                if not self._reserved[stage]:
+                    del self._reserved[stage]
+                if stage in self.retaining and self.device_memory_mb is not None:
+                    self._retained[stage] = self.footprints.get(stage, 0)
+                self._cond.notify_all()
+
+    def job_slots(self, *stages, resident_mb=0):
+        """
+        How many whole jobs (each running all the given stages) fit on the device side by side.
+        :param resident_mb: MB each job also keeps loaded between its stages (its own Whisper model).
+        :return: at least 1, or None without a GPU (no limit).
+        """
+        if self.budget_mb is None:
+            return None
+        # Every job is its own process, with its own framework pools to grow
+        need = sum(self.footprints.get(stage, 0) for stage in stages) + resident_mb
+        return max(1, self.budget_mb // need) if need else None
+
+
+gpu_scheduler = GpuStageScheduler(device_memory_mb=detect_device_memory_mb())
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "censormypy", "stems")
+
+
+def audio_hash(waveform):
+    """Content hash of a decoded waveform, so re-encodes or renames of the same song still hit."""
+    import numpy as np
+    digest = hashlib.sha256()
+    digest.update(str(waveform.shape).encode())
+    digest.update(np.ascontiguousarray(waveform).data)
+    return digest.hexdigest()
+
+
+class StemCache:
+    """
+    Persistent, size-bounded LRU cache of separated stems.
+
+    Entries are keyed by the decoded audio hash plus the separator model id and stored
+    as a single float16 .npy (vocals and accompaniment stacked), about a quarter of the
+    size of the two float32 WAVs Spleeter writes. Writes go to a temp file that is
+    renamed into place, so a crash never leaves a half-written entry. Recency is tracked
+    with the file mtime, which a hit refreshes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(waveform, model):
+        return hashlib.sha256(f"{model}:{audio_hash(waveform)}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def get(self, key, announce=True):
+        """
+        Returns the cached Stems for the key, or None on a miss.
+        The stems are read-only float16 views of the memory-mapped entry: only the regions a
+        censor method actually touches are ever read into memory, however long the song is.
+        """
+        import numpy as np
+        from separator_service import Stems
+        path = self._path(key)
+        try:
+            stacked = np.load(path, mmap_mode='r')
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError):
+            return None
+        if announce:
+            print(f'[+] Using cached stems {key[:12]}..')
+        return Stems(stacked[0], stacked[1])
+
+    def put(self, key, stems):
+        """Stores the stems atomically and evicts least recently used entries above max_bytes."""
+        import numpy as np
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            # Each stem is cast straight into the mapped file, no stacked or float16 copy of the song in memory
+            stacked = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float16, shape=(2,) + stems.vocals.shape)
+            stacked[0] = stems.vocals
+            stacked[1] = stems.accompaniment
+            stacked.flush()
+            del stacked
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            try:
+                entries = []
+                for name in os.listdir(self.cache_dir):
+                    if name.endswith(".npy"):
+                        stat = os.stat(os.path.join(self.cache_dir, name))
+                        entries.append((stat.st_mtime, stat.st_size, name))
+            except OSError:
+                return
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                    print(f'[-] Evicted cached stems {name[:12]}..')
+                except OSError:
+                    pass
+                total -= size
+
+    def get_or_separate(self, waveform, model, separate):
+        """
+        Returns cached stems for the waveform, or runs ``separate(waveform)`` and caches the result.
+        :param separate: Callable returning Stems, only invoked on a cache miss.
+        """
+        key = self.key(waveform, model)
+        stems = self.get(key)
+        if stems is None:
+            stems = separate(waveform)
+            self.put(key, stems)
+            # Hand out the memory-mapped entry and let the separator's full-length arrays go
+            cached = self.get(key, announce=False)
+            if cached is not None:
+                stems = cached
+        return stems
+
+
+stem_cache = StemCache(
+    cache_dir=os.environ.get("CENSOR_STEM_CACHE_DIR", DEFAULT_CACHE_DIR),
+    max_bytes=int(float(os.environ.get("CENSOR_STEM_CACHE_MB", 2048)) * 1024 ** 2)
+)
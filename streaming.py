@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+from async_toolset import BUFFER_MS, match_transcript, transcribe_samples, transcript_key
+from audio_source import as_audio_source, WHISPER_SAMPLE_RATE
+from render_engine import CensorRenderer, AudioWriter, export_format
+from separator_service import get_separator_service, Stems, SEPARATOR_SAMPLE_RATE
+from transcript_cache import transcript_cache
+from pipeline import METHOD_PLANS
+from workspace import job_tag
+
+STREAM_WINDOW_SECONDS = float(os.environ.get("CENSOR_STREAM_WINDOW_SECONDS", 30))
+# Audio transcribed on both sides of a window, so words at its edges are heard in context
+STREAM_CONTEXT_SECONDS = float(os.environ.get("CENSOR_STREAM_CONTEXT_SECONDS", 3))
+SEPARATION_MARGIN_MS = 1000
+
+# method -> (render function, needs stems, uses slurs), from the same plans as the file mode
+STREAM_METHODS = {name: (plan.render, plan.needs('separate'), plan.slurs) for name, plan in METHOD_PLANS.items() if not plan.genai}
+
+
+class StreamingCensor:
+    """
+    Censors a song window by window and hands out each window as soon as it's final,
+    instead of transcribing, separating and rendering the whole song before the first byte.
+
+    Every window (``STREAM_WINDOW_SECONDS``) is transcribed with ``STREAM_CONTEXT_SECONDS``
+    of audio on both sides, matched, separated (plus a short margin), rendered and encoded.
+    A window never ends inside a censored interval: when a match crosses the planned end,
+    the window is extended to the end of the match, so every effect is rendered in one
+    piece and seams always fall on untouched audio. While one window is separated and
+    rendered, the next one is already being transcribed; nothing further ahead is started
+    until the consumer takes the current window, so memory stays at about two windows
+    (plus the decoded input) whatever the length of the song.
+
+    ``stream()`` yields (sample_rate, float32 (frames, channels) block) per window, which
+    a Gradio streaming output or an HTTP response can play as it arrives; ``run()`` writes
+    the blocks to a file incrementally.
+    """
+
+    def __init__(self, audio, bad_words, slurs=None, method='v', window_s=STREAM_WINDOW_SECONDS,
+                 context_s=STREAM_CONTEXT_SECONDS, job_id=None):
+        """
+        :param audio: Path or AudioSource.
+        :param method: A key of STREAM_METHODS (the CLI's --method values, GenAI aside).
+        :param job_id: Tags the log lines (see workspace.Workspace).
+        """
+        if method not in STREAM_METHODS:
+            raise ValueError(f"Method '{method}' can't be streamed, use one of {', '.join(STREAM_METHODS)}")
+        self.source = as_audio_source(audio)
+        self.bad_words = bad_words
+        self.render, self.needs_stems, uses_slurs = STREAM_METHODS[method]
+        self.slurs = slurs if uses_slurs else None
+        self.window_ms = int(window_s * 1000)
+        self.context_ms = int(context_s * 1000)
+        self.job_id = job_id
+        self.detections = []          # every censored (start_ms, end_ms), in song time
+        self.first_window_seconds = None
+        self._cached_words = None
+
+    def _words(self, start_ms, end_ms):
+        """Transcript of [start_ms, end_ms), from the whole-song transcript cache when it's there."""
+        if self._cached_words is not None:
+            return [w for w in self._cached_words if w['end'] * 1000 > start_ms and w['start'] * 1000 < end_ms]
+        samples = self.source.window(start_ms, end_ms, sample_rate=WHISPER_SAMPLE_RATE, mono=True)
+        return transcribe_samples(samples, offset_s=start_ms / 1000)
+
+    def _plan(self, start_ms, duration_ms):
+        """
+        Transcribes and matches the window starting at ``start_ms``.
+        :return: (end_ms, bad word intervals, slur intervals), intervals in song time, within the window.
+        """
+        heard_from = max(0, start_ms - self.context_ms)
+        heard_to = min(duration_ms, start_ms + self.window_ms + self.context_ms)
+        found = match_transcript(self._words(heard_from, heard_to), self.bad_words, self.slurs)
+
+        # 1. Move the end of the window past any match crossing it (as far as what was heard allows)
+        end_ms = min(duration_ms, start_ms + self.window_ms)
+        moved = True
+        while moved and end_ms < duration_ms:
+            moved = False
+            for a, b in found['bad_words'] + found['slurs']:
+                if a < end_ms < b <= heard_to:
+                    end_ms, moved = b, True
+
+        # 2. Keep what falls in the window. Matches the previous window already rendered are dropped,
+        # remnants shorter than the padding are re-transcription jitter of those
+        def within(intervals):
+            kept = []
+            for a, b in intervals:
+                a, b = max(a, start_ms), min(b, end_ms)
+                if b - a >= BUFFER_MS:
+                    kept.append((a, b))
+            return kept
+        return end_ms, within(found['bad_words']), within(found['slurs'])
+
+    async def _separate(self, start_ms, end_ms):
+        """Stems of [start_ms, end_ms), separated with a margin on both sides so the window edges don't show."""
+        lo = max(0, start_ms - SEPARATION_MARGIN_MS)
+        waveform = await asyncio.to_thread(self.source.window, lo, end_ms + SEPARATION_MARGIN_MS, SEPARATOR_SAMPLE_RATE)
+        stems = await asyncio.wrap_future(get_separator_service().submit_waveform(waveform, job_id=self.job_id))
+        offset = int(round((start_ms - lo) * stems.sample_rate / 1000))
+        frames = int(round((end_ms - start_ms) * stems.sample_rate / 1000))
+        return Stems(stems.vocals[offset:offset + frames], stems.accompaniment[offset:offset + frames], stems.sample_rate)
+
+    def _render(self, start_ms, end_ms, bad_word_timestamps, slurs_timestamps, stems):
+        renderer = CensorRenderer(self.source.window(start_ms, end_ms), stems, sample_rate=self.source.sample_rate)
+        # Renderer times are relative to the window
+        self.render(renderer,
+                    [(a - start_ms, b - start_ms) for a, b in bad_word_timestamps],
+                    [(a - start_ms, b - start_ms) for a, b in slurs_timestamps])
+        return renderer.out
+
+    async def stream(self):
+        """
+        Censors the song window by window.
+        :return: async generator of (sample_rate, float32 (frames, channels) block), in order, covering the whole song.
+        """
+        began = time.time()
+        duration_ms = await asyncio.to_thread(lambda: self.source.duration_ms)
+        self._cached_words = await asyncio.to_thread(transcript_cache.get, transcript_key(self.source))
+        if self._cached_words is not None:
+            print(f'[+] Using cached transcript for {self.source}')
+
+        start_ms = 0
+        plan = asyncio.ensure_future(asyncio.to_thread(self._plan, start_ms, duration_ms))
+        try:
+            while plan is not None:
+                end_ms, bad_word_timestamps, slurs_timestamps = await plan
+                # Transcribe the next window while this one is separated and rendered
+                plan = asyncio.ensure_future(asyncio.to_thread(self._plan, end_ms, duration_ms)) if end_ms < duration_ms else None
+
+                print(f'[+] Window {start_ms} ms to {end_ms} ms: {len(bad_word_timestamps)} bad words, {len(slurs_timestamps)} slurs{job_tag(self.job_id)}')
+                stems = None
+                if self.needs_stems and (bad_word_timestamps or slurs_timestamps):
+                    stems = await self._separate(start_ms, end_ms)
+                block = await asyncio.to_thread(self._render, start_ms, end_ms, bad_word_timestamps, slurs_timestamps, stems)
+                self.detections.extend(sorted(bad_word_timestamps + slurs_timestamps))
+
+                if self.first_window_seconds is None:
+                    self.first_window_seconds = time.time() - began
+                    print(f'[=] First window ready after {self.first_window_seconds:.1f} seconds{job_tag(self.job_id)}')
+                yield self.source.sample_rate, block
+                start_ms = end_ms
+        finally:
+            if plan is not None:
+                plan.cancel()
+
+    async def run(self, output_path, format=None, bitrate='320k'):
+        """
+        Streams the censored song into a file, each window encoded and written as soon as it's rendered.
+        :param format: Output format, by default mirrors the input (WAV stays WAV, anything else becomes 320k MP3).
+        :return: The censored intervals (ms).
+        """
+        if format is None:
+            format, bitrate = export_format(self.source)
+        writer = None
+        try:
+            async for sample_rate, block in self.stream():
+                if writer is None:
+                    writer = AudioWriter(output_path, sample_rate, block.shape[1], format=format, bitrate=bitrate)
+                writer.write(block)
+        finally:
+            if writer is not None:
+                writer.close()
+        print(f"Censored audio saved to {output_path}")
+        return self.detections
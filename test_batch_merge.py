@@ -0,0 +1,86 @@
+import sys
+import os
+import tempfile
+
+# Add current directory to path to import batch_runner
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from pydub import AudioSegment
+from batch_runner import plan_chunks, choose_seam, export_chunk, OrderedMerger, Chunk
+from render_engine import segment_to_array, array_to_segment
+
+RATE = 8000
+
+
+def noise_song(seconds, quiet=()):
+    """Stereo noise at ``RATE``, silent over the (start_ms, end_ms) ``quiet`` stretches."""
+    rng = np.random.default_rng(0)
+    samples = rng.uniform(-0.5, 0.5, (seconds * RATE, 2)).astype(np.float32)
+    for start, end in quiet:
+        samples[start * RATE // 1000:end * RATE // 1000] = 0
+    return array_to_segment(samples, RATE)
+
+
+def test_plan_chunks_cuts_at_pauses():
+    # Quiet stretches near the even split points of a 30s song in three chunks (10s and 20s)
+    song = noise_song(30, quiet=[(11500, 11800), (18200, 18500)])
+    chunks = plan_chunks(song, 3, overlap_ms=2000, search_ms=3000)
+    assert [c.cut_before for c in chunks] == [0, chunks[0].cut_after, chunks[1].cut_after]
+    assert 11500 <= chunks[0].cut_after <= 11800
+    assert 18200 <= chunks[1].cut_after <= 18500
+    assert chunks[-1].cut_after == len(song)
+    for c in chunks:
+        assert c.start_ms == max(0, c.cut_before - 2000) and c.end_ms == min(len(song), c.cut_after + 2000)
+
+
+def test_choose_seam():
+    window = (8000, 12000)
+    # Nothing detected: the seam stays at the cut
+    assert choose_seam(10000, window, [], [], 15) == 10000
+    # A word across the cut that only the previous chunk caught is taken whole from it
+    seam = choose_seam(10000, window, [(9800, 10400)], [], 15)
+    assert seam >= 10400 + 15
+    # Only the next chunk caught it: the seam moves before the word
+    seam = choose_seam(10000, window, [], [(9800, 10400)], 15)
+    assert seam <= 9800 - 15
+    # Both caught it: no reason to move
+    assert choose_seam(10000, window, [(9800, 10400)], [(9790, 10410)], 15) == 10000
+
+
+def test_merger_reconstructs_untouched_chunks():
+    # Chunks that weren't censored must merge back into the input, whatever order they finish in
+    song = noise_song(20, quiet=[(6500, 6700), (13300, 13500)])
+    chunks = plan_chunks(song, 3, overlap_ms=1000, search_ms=1000)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [export_chunk(song, chunk, os.path.join(tmp, f"chunk_{chunk.index}.wav")) for chunk in chunks]
+        merger = OrderedMerger(len(chunks))
+        for chunk in reversed(chunks):
+            merger.add(chunk, paths[chunk.index])
+        assert merger.complete
+        out_path = os.path.join(tmp, "merged.wav")
+        merger.export(out_path)
+        merged = segment_to_array(AudioSegment.from_wav(out_path))
+    original = segment_to_array(song)
+    assert merged.shape == original.shape
+    # One 16-bit requantization of the whole song, nothing else
+    assert np.abs(merged - original).max() < 1e-4
+
+
+def test_merger_keeps_detections_of_both_chunks():
+    song = noise_song(4)
+    chunks = [Chunk(0, 0, 2500, 0, 2000), Chunk(1, 1500, 4000, 2000, 4000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [export_chunk(song, chunk, os.path.join(tmp, f"chunk_{chunk.index}.wav")) for chunk in chunks]
+        merger = OrderedMerger(2)
+        # Detections are relative to each chunk; the word at 1900-2200 ms is seen by both
+        merger.add(chunks[1], paths[1], detections=[(400, 700), (2000, 2200)])
+        merger.add(chunks[0], paths[0], detections=[(500, 800), (1900, 2200)])
+    assert merger.detections == [(500, 800), (1900, 2200), (3500, 3700)]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"[+] {name} passed")
@@ -5,7 +5,8 @@ import os
 # Add current directory to path to import async_toolset
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from async_toolset import get_bad_word_timestamps
+from async_toolset import get_bad_word_timestamps, WHISPER_MODEL_SIZE, WHISPER_COMPUTE_TYPE, WHISPER_DECODE_OPTIONS
+from transcript_cache import transcript_cache, file_hash
 
 async def test_function():
     # Test the function with senseless.mp3 using bad_words.txt
@@ -17,8 +18,9 @@ async def test_function():
         result = await get_bad_word_timestamps("senseless.mp3", bad_words)
         print(f"Success! Found {len(result)} bad word timestamps: {result}")
 
-        # Check if JSON was created
-        json_path = "senseless.mp3.json"
+        # Check if the word-level transcript JSON was cached
+        json_path = transcript_cache._path(transcript_cache.key(
+            file_hash("senseless.mp3"), (WHISPER_MODEL_SIZE, WHISPER_COMPUTE_TYPE), WHISPER_DECODE_OPTIONS))
         if os.path.exists(json_path):
             print(f"[+] JSON cache created at {json_path}")
         else:
@@ -0,0 +1,64 @@
+import sys
+import os
+
+# Add current directory to path to import phrase_matcher
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from phrase_matcher import PhraseMatcher, get_matcher, clean_token, phrase_tokens
+
+
+def naive_find(tokens, categories):
+    """Reference matcher: every phrase tried at every position."""
+    matches = []
+    for category, terms in categories.items():
+        for term in terms:
+            phrase = phrase_tokens(term)
+            for i in range(len(tokens) - len(phrase) + 1):
+                if phrase and tokens[i:i + len(phrase)] == phrase:
+                    matches.append((i, i + len(phrase) - 1, category))
+    return sorted(matches)
+
+
+def test_cleaning():
+    assert clean_token("  Shit!! ") == "shit"
+    assert phrase_tokens("Mother F,") == ["mother", "f"]
+    assert phrase_tokens("   ") == []
+
+
+def test_overlapping_phrases():
+    # Phrases that share prefixes and suffixes, so the failure links are exercised
+    categories = {'bad_words': ["a b", "b", "a b c", "c d", "b c d e"], 'slurs': ["d", "x y"]}
+    matcher = PhraseMatcher.from_terms(categories)
+    tokens = "a b c d x a b c d e x y".split()
+    assert sorted(matcher.find(tokens)) == naive_find(tokens, categories)
+
+
+def test_random_transcripts():
+    import random
+    random.seed(7)
+    vocabulary = ["a", "b", "c", "d", "e"]
+    for _ in range(200):
+        categories = {'bad_words': [" ".join(random.choices(vocabulary, k=random.randint(1, 3))) for _ in range(6)],
+                      'slurs': [" ".join(random.choices(vocabulary, k=random.randint(1, 2))) for _ in range(3)]}
+        tokens = random.choices(vocabulary, k=40)
+        # Duplicate terms are reported once, like the automaton does
+        expected = sorted(set(naive_find(tokens, categories)))
+        assert sorted(PhraseMatcher.from_terms(categories).find(tokens)) == expected
+
+
+def test_blank_terms_and_no_slurs():
+    matcher = get_matcher(["", "  ", "shit"])
+    assert matcher.find(["no", "shit"]) == [(1, 1, 'bad_words')]
+    assert matcher.find([]) == []
+
+
+def test_matcher_is_reused():
+    assert get_matcher(["fuck", "shit"], ["x"]) is get_matcher(["fuck", "shit"], ["x"])
+    assert get_matcher(["fuck", "shit"]) is not get_matcher(["fuck", "shit"], ["x"])
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"[+] {name} passed")
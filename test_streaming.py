@@ -0,0 +1,67 @@
+import sys
+import os
+
+# Add current directory to path to import streaming
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from streaming import StreamingCensor
+from async_toolset import BUFFER_MS
+from phrase_matcher import clean_token
+
+DURATION_MS = 30000
+
+
+def word(text, start_s, end_s):
+    return {'raw': text, 'clean': clean_token(text), 'start': start_s, 'end': end_s, 'probability': 0.9}
+
+
+def censor(words, window_s=10, context_s=2):
+    """StreamingCensor over ``words`` (the song is never decoded, only ``_plan`` runs)."""
+    sc = StreamingCensor("song.wav", ["shit"], window_s=window_s, context_s=context_s)
+    sc._cached_words = words
+    return sc
+
+
+def plan_all(sc):
+    """Plans every window like ``stream`` does: [(start_ms, end_ms, bad word intervals), ..]."""
+    windows = []
+    start_ms = 0
+    while start_ms < DURATION_MS:
+        end_ms, bad_words, _ = sc._plan(start_ms, DURATION_MS)
+        windows.append((start_ms, end_ms, bad_words))
+        start_ms = end_ms
+    return windows
+
+
+def test_word_across_window_boundary_is_censored_once_and_whole():
+    # "shit" straddles the planned 10 s boundary, another one sits inside the second window
+    sc = censor([word("oh", 9.2, 9.6), word("shit", 9.8, 10.3), word("shit", 14.0, 14.4), word("yeah", 10.4, 10.8)])
+    windows = plan_all(sc)
+    # The first window is extended to the end of the padded match, the next one starts there
+    assert windows[0][:2] == (0, 10300 + BUFFER_MS)
+    assert windows[1][0] == windows[0][1]
+    assert windows[-1][1] == DURATION_MS
+    detections = [interval for _, _, bad_words in windows for interval in bad_words]
+    assert detections == [(9800 - BUFFER_MS, 10300 + BUFFER_MS), (14000 - BUFFER_MS, 14400 + BUFFER_MS)]
+
+
+def test_retranscribed_edge_word_is_not_censored_twice():
+    # Each window hears the word again with its own timing: the next window's transcript puts
+    # its end a little later, which must not leave a second, partial censor after the seam
+    sc = censor([])
+    shifts = iter([0.0, 0.04])
+    def words(start_ms, end_ms):
+        heard = [word("shit", 9.8, 10.3 + next(shifts, 0.0))]
+        return [w for w in heard if w['end'] * 1000 > start_ms and w['start'] * 1000 < end_ms]
+    sc._words = words
+    windows = plan_all(sc)
+    detections = [interval for _, _, bad_words in windows for interval in bad_words]
+    assert detections == [(9800 - BUFFER_MS, 10300 + BUFFER_MS)]
+    assert windows[0][1] == 10300 + BUFFER_MS
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"[+] {name} passed")
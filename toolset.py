@@ -6,19 +6,27 @@ import numpy as np
 from pydub import AudioSegment
 from shutil import rmtree
 from module_context import ModuleContext
+from separator_service import get_separator_service, SEPARATOR_MODEL
+from async_toolset import render_tape_stop
+from render_engine import CensorRenderer, segment_to_array, array_to_segment, pitch_shift, tape_stop
 
 
 
-def separate_audio(input_audio_path, output_dir="separated"):
+def separate_audio(input_audio_path, output_dir="separated", low_memory=False):
     """
     Separates the input audio into vocals and instrumental using Spleeter.
+    :param low_memory: Load Spleeter just for this call and unload it afterwards instead of using the resident service.
     """
-    print(f'[+] Separation in Progress..')
+    if not low_memory:
+        return get_separator_service().separate(input_audio_path, output_dir)
+
+    print(f'[+] Separation in Progress (low-memory mode)..')
     with ModuleContext("spleeter.separator") as modules:
         Separator = modules["spleeter.separator"].Separator
-        separator = Separator('spleeter:2stems-16kHz')  # 2 stems: vocals + instrumental
+        separator = Separator(SEPARATOR_MODEL)
         separator.separate_to_file(input_audio_path, output_dir)
-        return f"{output_dir}/separated_audio/vocals.wav", f"{output_dir}/separated_audio/accompaniment.wav"
+        filename = os.path.splitext(os.path.basename(input_audio_path))[0]
+        return f"{output_dir}/{filename}/vocals.wav", f"{output_dir}/{filename}/accompaniment.wav"
 
 def down_pitch(input_path, output_path, semitones):
     """
@@ -31,7 +39,7 @@ def down_pitch(input_path, output_path, semitones):
     y, sr = librosa.load(input_path, sr=None)
 
     # Down-pitch the audio
-    y_shifted = librosa.effects.pitch_shift(y=y, sr=sr, n_steps=-semitones)
+    y_shifted = pitch_shift(y, sr, -semitones)
     print(f"[-] Down-shifted the pitch, saving..")
     # Save the processed audio
     sf.write(output_path, y_shifted, sr)
@@ -53,30 +61,14 @@ def censor_with_instrumentals(audio_file_path, bad_words, output_file="censored_
     print(f'[+] Transcribe vocals to find bad words in Progress..')
     bad_word_timestamps = get_bad_word_timestamps(audio_file_path, bad_words)
 
-    audio = AudioSegment.from_mp3(audio_file_path)
-    instrumental = AudioSegment.from_file(instrumental_path)
-
-    censored_audio = AudioSegment.empty()  # Start with an empty audio segment
-    previous_end_time = 0  # Keep track of the end of the last processed segment
-  
-    # Process each bad word segment
+    renderer = CensorRenderer(AudioSegment.from_mp3(audio_file_path), {'accompaniment': AudioSegment.from_file(instrumental_path)})
     for start_time, end_time in bad_word_timestamps:
-        # Add the audio before the bad word
-        censored_audio += audio[previous_end_time:start_time]
         print(f"[-] Processing segment: {start_time} ms to {end_time} ms")
-        # Reverse only the segment containing the bad word
-        censored_segment = instrumental[start_time:end_time]
-        censored_audio += censored_segment
-
-        # Update the end time of the last processed segment
-        previous_end_time = end_time
-
-    # Add the remaining audio after the last bad word
-    censored_audio += audio[previous_end_time:]
+        # Replace only the segment containing the bad word with the instrumental
+        renderer.replace(start_time, end_time, 'accompaniment')
 
     # Save the censored audio to the output file
-    censored_audio.export(output_file, format="mp3", bitrate='320k')
-    print(f"Censored audio saved to {output_file}")
+    renderer.export(output_file)
 
 def censor_with_both(audio_file_path, bad_words, output_file="censored_output.mp3"):
     """
@@ -97,31 +89,14 @@ def censor_with_both(audio_file_path, bad_words, output_file="censored_output.mp
     print(f'[+] Transcribe vocals to find bad words in Progress..')
     bad_word_timestamps = get_bad_word_timestamps(audio_file_path, bad_words)
 
-    audio = AudioSegment.from_mp3(audio_file_path)
-    instrumental = AudioSegment.from_file(instrumental_path)
-    vocals = AudioSegment.from_file(vocal_path)
-
-    censored_audio = AudioSegment.empty()  # Start with an empty audio segment
-    previous_end_time = 0  # Keep track of the end of the last processed segment
-  
-    # Process each bad word segment
+    renderer = CensorRenderer(AudioSegment.from_mp3(audio_file_path), {'accompaniment': AudioSegment.from_file(instrumental_path), 'vocals': AudioSegment.from_file(vocal_path)})
     for start_time, end_time in bad_word_timestamps:
-        # Add the audio before the bad word
-        censored_audio += audio[previous_end_time:start_time]
         print(f"[-] Processing segment: {start_time} ms to {end_time} ms")
-        # Reverse only the segment containing the bad word
-        censored_segment : AudioSegment = instrumental[start_time:end_time]
-        censored_audio += censored_segment.overlay(vocals[start_time:end_time].reverse())
-
-        # Update the end time of the last processed segment
-        previous_end_time = end_time
-
-    # Add the remaining audio after the last bad word
-    censored_audio += audio[previous_end_time:]
+        # Reverse only the vocals of the segment containing the bad word, over the instrumental
+        renderer.overlay(start_time, end_time, renderer.source('vocals', start_time, end_time)[::-1], base='accompaniment')
 
     # Save the censored audio to the output file
-    censored_audio.export(output_file, format="mp3", bitrate='320k')
-    print(f"Censored audio saved to {output_file}")
+    renderer.export(output_file)
 
 def censor_with_downpitch(audio_file_path, bad_words, output_file="censored_output.mp3"):
     """
@@ -141,40 +116,16 @@ def censor_with_downpitch(audio_file_path, bad_words, output_file="censored_outp
     print(f'[+] Transcribe vocals to find bad words in Progress..')
     bad_word_timestamps = get_bad_word_timestamps(audio_file_path, bad_words)
 
-    audio = AudioSegment.from_mp3(audio_file_path)
-    instrumental = AudioSegment.from_file(instrumental_path)
-    vocals = AudioSegment.from_file(vocal_path)
-
-    censored_audio = AudioSegment.empty()  # Start with an empty audio segment
-    previous_end_time = 0  # Keep track of the end of the last processed segment
-  
-    # Process each bad word segment
-    for start_time, end_time in bad_word_timestamps:
-        # Add the audio before the bad word
-        censored_audio += audio[previous_end_time:start_time]
+    renderer = CensorRenderer(AudioSegment.from_mp3(audio_file_path), {'accompaniment': AudioSegment.from_file(instrumental_path), 'vocals': AudioSegment.from_file(vocal_path)})
+    print(f"[-] Down-pitching {len(bad_word_timestamps)} vocal segments in one pass..")
+    downpitched_segments = renderer.pitch_many(bad_word_timestamps, -10) # 10 semi-tones should be enough to sound screwed.
+    for (start_time, end_time), downpitched in zip(bad_word_timestamps, downpitched_segments):
         print(f"[+] Processing segment: {start_time} ms to {end_time} ms")
-        # Reverse only the segment containing the bad word
-        censored_segment : AudioSegment = instrumental[start_time:end_time]
-
-        print(f"[-] Preparing current segment for down-pitch..")
-        cur_vocal_to_downpitch = vocals[start_time:end_time]
-        cur_vocal_to_downpitch.export('temp.mp3',format="mp3",bitrate='320k')
-        print(f"[-] Calling downpitch... ")
-        
-        down_pitch('temp.mp3','down_temp.mp3',semitones=10) # 10 semi-tones should be enough to sound screwed.
         print(f"[-] Mixing segment as censored...")
-        downpitched = AudioSegment.from_file('down_temp.mp3')
-        censored_audio += censored_segment.overlay(downpitched)
-
-        # Update the end time of the last processed segment
-        previous_end_time = end_time
-
-    # Add the remaining audio after the last bad word
-    censored_audio += audio[previous_end_time:]
+        renderer.overlay(start_time, end_time, downpitched, base='accompaniment')
 
     # Save the censored audio to the output file
-    censored_audio.export(output_file, format="mp3", bitrate='320k')
-    print(f"Censored audio saved to {output_file}")
+    renderer.export(output_file)
 
 def censor_with_instrumentals_and_downpitch(audio_file_path, bad_words, slurs, output_file="censored_output.mp3"):
     """
@@ -196,77 +147,37 @@ def censor_with_instrumentals_and_downpitch(audio_file_path, bad_words, slurs, o
     both_timestamps = get_bad_word_and_slurs_timestamps(audio_file_path, bad_words, slurs)
     bad_word_timestamps, slurs_timestamps = both_timestamps
     
-    audio = AudioSegment.from_mp3(audio_file_path)
-    instrumental = AudioSegment.from_file(instrumental_path)
-    vocals = AudioSegment.from_file(vocal_path)
-
-    censored_audio = AudioSegment.empty()  # Start with an empty audio segment
-    previous_end_time = 0  # Keep track of the end of the last processed segment
-  
-    # Process each bad word segment
+    renderer = CensorRenderer(AudioSegment.from_mp3(audio_file_path), {'accompaniment': AudioSegment.from_file(instrumental_path), 'vocals': AudioSegment.from_file(vocal_path)})
+    bad_word_set = set(bad_word_timestamps)
+    slur_only = [interval for interval in slurs_timestamps if interval not in bad_word_set]
+    print(f"[-] Down-pitching {len(slur_only)} slur segments in one pass..")
+    downpitched_slurs = dict(zip(slur_only, renderer.pitch_many(slur_only, -10))) # 10 semi-tones should be enough to sound screwed.
     for start_time, end_time in sorted(bad_word_timestamps + slurs_timestamps):
-        # Add the audio before the bad word
-        if (start_time, end_time) in bad_word_timestamps:
-            censored_audio += audio[previous_end_time:start_time]
+        if (start_time, end_time) in bad_word_set:
             print(f"[+] Processing bad word segment: {start_time} ms to {end_time} ms")
-            # Reverse only the segment containing the bad word
-            censored_segment = instrumental[start_time:end_time]
-            censored_audio += censored_segment
-
+            # Replace only the segment containing the bad word with the instrumental
+            renderer.replace(start_time, end_time, 'accompaniment')
         else:
-            censored_audio += audio[previous_end_time:start_time]
             print(f"[+] Processing slur segment: {start_time} ms to {end_time} ms")
-            # Reverse only the segment containing the bad word
-            censored_segment : AudioSegment = instrumental[start_time:end_time]
-
-            print(f"[-] Preparing current segment for down-pitch..")
-            cur_vocal_to_downpitch = vocals[start_time:end_time]
-            cur_vocal_to_downpitch.export('temp.mp3',format="mp3",bitrate='320k')
-            print(f"[-] Calling downpitch... ")
-            
-            down_pitch('temp.mp3','down_temp.mp3',semitones=10) # 10 semi-tones should be enough to sound screwed.
             print(f"[-] Mixing segment as censored...")
-            downpitched = AudioSegment.from_file('down_temp.mp3')
-            censored_audio += censored_segment.overlay(downpitched)
-
-        # Update the end time of the last processed segment
-        previous_end_time = end_time
-
-    # Add the remaining audio after the last bad word
-    censored_audio += audio[previous_end_time:]
+            renderer.overlay(start_time, end_time, downpitched_slurs[(start_time, end_time)], base='accompaniment')
 
     # Save the censored audio to the output file
-    censored_audio.export(output_file, format="mp3", bitrate='320k')
-    print(f"Censored audio saved to {output_file}")
+    renderer.export(output_file)
 
 def censor_with_backspin(audio_file_path, bad_words, output_file_path="censored_output.mp3"):
     # Oldest method in the book
-    audio = AudioSegment.from_mp3(audio_file_path)
     print(f'[+] Transcribe vocals to find bad words in Progress..')
     bad_word_timestamps = get_bad_word_timestamps(audio_file_path, bad_words)
-   
 
-    censored_audio = AudioSegment.empty()  # Start with an empty audio segment
-    previous_end_time = 0  # Keep track of the end of the last processed segment
-  
-    # Process each bad word segment
+    renderer = CensorRenderer(AudioSegment.from_mp3(audio_file_path))
     for start_time, end_time in bad_word_timestamps:
-        # Add the audio before the bad word
-        censored_audio += audio[previous_end_time:start_time]
         print(f"[-] Processing segment: {start_time} ms to {end_time} ms")
         # Reverse only the segment containing the bad word
-        censored_segment = audio[start_time:end_time].reverse()
-        censored_audio += censored_segment
-
-        # Update the end time of the last processed segment
-        previous_end_time = end_time
-
-    # Add the remaining audio after the last bad word
-    censored_audio += audio[previous_end_time:]
+        renderer.reverse(start_time, end_time)
 
     # Save the censored audio to the output file
-    censored_audio.export(output_file_path, format="mp3")
-    print(f"Censored audio saved to {output_file_path}")
+    renderer.export(output_file_path)
 
 def apply_tape_stop_effect(
     segment: AudioSegment,
@@ -284,67 +195,10 @@ def apply_tape_stop_effect(
     """
     if len(segment) == 0:
         return segment
-
-    intensity = max(0.0, min(1.0, float(intensity)))
-    speed_end = 1.0 - intensity * 0.85
-
-    orig_raw = np.array(segment.get_array_of_samples())
-    samples = orig_raw.astype(np.float64)
-    num_channels = segment.channels
-
-    if num_channels > 1:
-        samples = samples.reshape((-1, num_channels))
-
-    num_frames = len(samples)
-    if num_frames < 2:
-        return segment
-
-    orig_peak = np.max(np.abs(samples))
-    if orig_peak == 0:
-        return segment
-
-    u = np.linspace(0.0, 1.0, num_frames)
-
-    p = curve_exponent + 1.0
-    phi = u - ((1.0 - speed_end) / p) * (u ** p)
-    phi_max = 1.0 - ((1.0 - speed_end) / p)
-
-    in_indices = np.arange(num_frames, dtype=np.float64)
-    out_indices = (num_frames - 1) * (phi / phi_max)
-
-    if num_channels == 1:
-        out_samples = np.interp(out_indices, in_indices, samples)
-    else:
-        out_samples = np.zeros((num_frames, num_channels), dtype=np.float64)
-        for c in range(num_channels):
-            out_samples[:, c] = np.interp(out_indices, in_indices, samples[:, c])
-
-    out_peak = np.max(np.abs(out_samples))
-    if out_peak > 0:
-        out_samples = out_samples * (orig_peak / out_peak)
-
-    if np.issubdtype(orig_raw.dtype, np.integer):
-        info = np.iinfo(orig_raw.dtype)
-        out_samples = np.clip(out_samples, info.min, info.max).astype(orig_raw.dtype)
-    else:
-        out_samples = out_samples.astype(orig_raw.dtype)
-
-    if num_channels > 1:
-        out_samples = out_samples.flatten()
-
-    tape_stopped = AudioSegment(
-        out_samples.tobytes(),
-        frame_rate=segment.frame_rate,
-        sample_width=segment.sample_width,
-        channels=segment.channels
-    )
-
-    if fade_in_ms > 0 and len(tape_stopped) > fade_in_ms:
-        tape_stopped = tape_stopped.fade_in(duration=fade_in_ms)
-    if fade_out_ms > 0 and len(tape_stopped) > fade_out_ms:
-        tape_stopped = tape_stopped.fade_out(duration=fade_out_ms)
-
-    return tape_stopped
+    # The float32 kernel (render_engine.tape_stop) on the decoded samples
+    samples = tape_stop(segment_to_array(segment), segment.frame_rate, intensity=intensity,
+                        curve_exponent=curve_exponent, fade_in_ms=fade_in_ms, fade_out_ms=fade_out_ms)
+    return array_to_segment(samples, segment.frame_rate)
 
 def censor_with_tape_stop(
     audio_file_path,
@@ -366,59 +220,18 @@ def censor_with_tape_stop(
     vocal_path = f'separated/{filename}/vocals.wav'
     has_stems = os.path.exists(instrumental_path) and os.path.exists(vocal_path)
 
-    audio = AudioSegment.from_file(audio_file_path)
     print(f'[+] Transcribe vocals to find bad words in Progress..')
     bad_word_timestamps = get_bad_word_timestamps(audio_file_path, bad_words)
 
+    stems = None
     if has_stems:
-        instrumental = AudioSegment.from_file(instrumental_path)
-        vocals = AudioSegment.from_file(vocal_path)
-
-    censored_audio = AudioSegment.empty()  # Start with an empty audio segment
-    previous_end_time = 0  # Keep track of the end of the last processed segment
+        stems = {'accompaniment': AudioSegment.from_file(instrumental_path), 'vocals': AudioSegment.from_file(vocal_path)}
+    renderer = CensorRenderer(AudioSegment.from_file(audio_file_path), stems)
 
-    # Process each bad word segment
-    for start_time, end_time in bad_word_timestamps:
-        # Add the audio before the bad word
-        censored_audio += audio[previous_end_time:start_time]
-        print(f"[-] Processing tape stop segment (intensity={intensity}): {start_time} ms to {end_time} ms")
-        
-        target_vocal = vocals[start_time:end_time] if has_stems else audio[start_time:end_time]
-        
-        # 1. Export target segment to temporary file for down_pitch
-        temp_input = 'temp_ts_in.wav'
-        temp_down = 'temp_ts_down.wav'
-        target_vocal.export(temp_input, format="wav")
-        
-        # 2. Call down_pitch
-        print(f"[-] Calling downpitch ({semitones} semitones) for tape stop segment...")
-        down_pitch(temp_input, temp_down, semitones=semitones)
-        downpitched_vocal = AudioSegment.from_file(temp_down)
-        
-        # 3. Apply tape stop deceleration with controlled break intensity
-        ts_vocal = apply_tape_stop_effect(downpitched_vocal, intensity=intensity)
-
-        if has_stems:
-            inst_seg = instrumental[start_time:end_time]
-            censored_segment = inst_seg.overlay(ts_vocal)
-
-        else:
-            censored_segment = ts_vocal
+    render_tape_stop(renderer, bad_word_timestamps, semitones=semitones, intensity=intensity)
 
-        censored_audio += censored_segment
-
-        # Update the end time of the last processed segment
-        previous_end_time = end_time
-
-    # Add the remaining audio after the last bad word
-    censored_audio += audio[previous_end_time:]
-
-    # Save the censored audio to the output file
-    if audio_file_path.endswith(".wav"):
-        censored_audio.export(output_file_path, format="wav")
-    else:
-        censored_audio.export(output_file_path, format="mp3", bitrate='320k')
-    print(f"Censored audio saved to {output_file_path}")
+    # Save as wav if the original file is wav, otherwise as mp3 with high bitrate
+    renderer.export(output_file_path, input_path=audio_file_path)
 
 
 
@@ -473,5 +286,6 @@ def print_transcribed_words(audio_file_path):
 
 def cleanup():
     print(f'[=] Running clean-up..')
-    os.remove('down_temp.mp3') if os.path.exists('down_temp.mp3') else None
+    for temp_file in ['down_temp.wav', 'down_temp.mp3', 'temp.wav', 'temp.mp3', 'temp_ts_in.wav', 'temp_ts_down.wav']:
+        os.remove(temp_file) if os.path.exists(temp_file) else None
     rmtree('separated') if os.path.exists('separated') else None
\ No newline at end of file
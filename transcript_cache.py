@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+import tempfile
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "censormypy", "transcripts")
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """sha256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TranscriptCache:
+    """
+    Persistent cache of word-level transcripts.
+
+    An entry is the list of words ({'raw', 'clean', 'start', 'end', 'probability'})
+    Whisper produced for a given audio content, model and decoding parameters.
+    Nothing about the word lists goes into the key, so editing a list only re-runs
+    the (cheap) matching against the cached words, never the GPU pass.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def key(audio_hash, model, params):
+        """
+        :param audio_hash: content hash of the audio (see file_hash).
+        :param model: model identity, i.e. ("medium", "int8_float16").
+        :param params: decoding parameters passed to transcribe().
+        """
+        blob = json.dumps({'audio': audio_hash, 'model': list(model), 'params': params}, sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Returns the cached word list for the key, or None on a miss."""
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, words):
+        """Writes the word list atomically (temp file + rename)."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(words, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self._path(key)
+
+
+transcript_cache = TranscriptCache(os.environ.get("CENSOR_TRANSCRIPT_CACHE_DIR", DEFAULT_CACHE_DIR))
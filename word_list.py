@@ -0,0 +1,99 @@
+import hashlib
+import os
+import threading
+
+
+class WordList:
+    """
+    A normalized, deduplicated bad words / slurs list.
+
+    Terms are stripped and lowercased once, blank lines dropped and duplicates removed
+    (first occurrence wins). Instances are hashable by content, so compiled matchers
+    keyed on them (see phrase_matcher.get_matcher) are reused without rehashing every term.
+    """
+
+    def __init__(self, terms, source=None):
+        seen = set()
+        normalized = []
+        for term in terms:
+            term = term.strip().lower()
+            if term and term not in seen:
+                seen.add(term)
+                normalized.append(term)
+        self.terms = tuple(normalized)
+        self.source = source
+        self.digest = hashlib.sha256("\n".join(self.terms).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(f, source=path)
+
+    @classmethod
+    def from_text(cls, text, source=None):
+        return cls(text.splitlines(), source=source)
+
+    def matcher(self, slurs=None):
+        """Compiled phrase matcher for this list (and optionally a slurs list as a second category)."""
+        from phrase_matcher import get_matcher
+        return get_matcher(self, slurs)
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __bool__(self):
+        return bool(self.terms)
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __eq__(self, other):
+        return isinstance(other, WordList) and other.digest == self.digest
+
+    def __repr__(self):
+        return f"WordList({self.source or 'inline'}, {len(self.terms)} terms)"
+
+
+MAX_CACHED_UPLOADS = 32
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_word_list(path):
+    """
+    Loads a word list file once per process, reloading only when its mtime or size changes.
+    :return: WordList.
+    :raises FileNotFoundError: if the file doesn't exist, before any audio work starts.
+    """
+    stat = os.stat(path)
+    key = ('file', os.path.abspath(path))
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+    word_list = WordList.from_file(path)
+    print(f'[+] Loaded {len(word_list)} terms from {path}')
+    with _cache_lock:
+        _cache[key] = (stamp, word_list)
+    return word_list
+
+
+def word_list_from_bytes(data, source="upload"):
+    """Builds a WordList from uploaded file contents, reusing the one built for identical contents."""
+    key = ('bytes', hashlib.sha256(data).hexdigest())
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            return cached[1]
+    word_list = WordList.from_text(data.decode('utf-8'), source=source)
+    with _cache_lock:
+        uploads = [k for k in _cache if k[0] == 'bytes']
+        if len(uploads) >= MAX_CACHED_UPLOADS:
+            del _cache[uploads[0]]  # dicts keep insertion order, drop the oldest upload
+        _cache[key] = (None, word_list)
+    return word_list
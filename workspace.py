@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+SHM_DIR = "/dev/shm"
+
+
+def default_scratch_root():
+    """
+    Where job workspaces are created: $CENSOR_SCRATCH_DIR if set, else tmpfs (/dev/shm) when
+    it's there and writable, else the system temp dir.
+    """
+    root = os.environ.get("CENSOR_SCRATCH_DIR")
+    if root:
+        return root
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        return os.path.join(SHM_DIR, "censormypy")
+    return os.path.join(tempfile.gettempdir(), "censormypy")
+
+
+def new_job_id():
+    return uuid.uuid4().hex[:12]
+
+
+def job_tag(job_id):
+    """Suffix for log lines, so interleaved output of concurrent jobs can be told apart."""
+    return f" (job {job_id})" if job_id else ""
+
+
+def prune_dirs(root, keep=None, max_age_s=None, exclude=()):
+    """
+    Removes old subdirectories of ``root`` (by mtime): every one older than ``max_age_s``, and all
+    but the newest ``keep``. Names in ``exclude`` (jobs still running) are never removed.
+    :return: the removed paths.
+    """
+    try:
+        entries = [(entry.stat().st_mtime, entry.path) for entry in os.scandir(root)
+                   if entry.is_dir() and entry.name not in exclude]
+    except OSError:
+        return []
+    entries.sort(reverse=True)
+    now = time.time()
+    removed = []
+    for rank, (mtime, path) in enumerate(entries):
+        if (keep is not None and rank >= keep) or (max_age_s is not None and now - mtime > max_age_s):
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+    return removed
+
+
+class Workspace:
+    """
+    Scratch space of one censor job.
+
+    Every job gets its own directory (``<root>/job-<job_id>``) for anything it has to put
+    on disk, so concurrent jobs (two Gradio users, parallel batch_runner chunks) never share
+    a filename, and ``cleanup`` removes only this job's files. The shared stem and transcript
+    caches live elsewhere and are never touched.
+    """
+
+    def __init__(self, job_id=None, root=None):
+        self.job_id = job_id or new_job_id()
+        self.root = os.path.abspath(root or default_scratch_root())
+        self.dir = os.path.join(self.root, f"job-{self.job_id}")
+        os.makedirs(self.dir, exist_ok=True)
+
+    @property
+    def tag(self):
+        return job_tag(self.job_id)
+
+    def path(self, *names):
+        """Path inside the workspace, i.e. workspace.path('separated') or workspace.path('chunk_0.wav')."""
+        return os.path.join(self.dir, *names)
+
+    def subdir(self, *names):
+        """Creates (if needed) and returns a directory inside the workspace."""
+        path = self.path(*names)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def cleanup(self):
+        print(f'[=] Running clean-up{self.tag}..')
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
+
+    def __repr__(self):
+        return f"Workspace({self.dir})"